@@ -1,8 +1,7 @@
 from collections import namedtuple
-from migen.genlib.io import DifferentialInput, DifferentialOutput, DDROutput
+from migen.genlib.io import DifferentialInput, DifferentialOutput, DDROutput, DDRInput
 from migen import *
 
-
 # all times in cycles
 AdcParams = namedtuple(
     "AdcParams",
@@ -19,7 +18,11 @@ AdcParams = namedtuple(
         # this avoids having synchronizers and another counter
         # to signal end-of transfer
         # and it ensures fixed latency early in the pipeline
+        "pipelined",  # overlap the conversion of the next sample with the
+        # readout (READ, RTT) of the current one
+        "ddr",  # data on both clkout edges (IDDR), half the READ time
     ],
+    defaults=[False, False],
 )
 
 
@@ -28,6 +31,13 @@ class Adc(Module):
     ADC interface.
     * Supports ADCs like the LTC2320-16.
     * Hardcoded timings.
+    * Pipelined (`AdcParams.pipelined`): the next conversion overlaps the
+      readout, one sample every `t_read + t_rtt + 1` cycles (if the
+      conversion is shorter). The latency from the conversion start to
+      `done` is unchanged, the next conversion starts before `done` of
+      the current one.
+    * DDR (`AdcParams.ddr`): data on both `clkout` edges, captured with
+      IDDRs, half the READ time at the same sck frequency.
     """
 
     def __init__(self, pins, params):
@@ -37,7 +47,9 @@ class Adc(Module):
         ]  # retrieved ADC data
         self.start = Signal()  # start conversion and reading
         self.reading = Signal()  # data is being read (outputs are invalid)
-        self.done = Signal()  # data is valid and a new conversion can be started
+        # data is valid and a new conversion can be started,
+        # pipelined: data valid strobe
+        self.done = Signal()
 
         ###
 
@@ -67,22 +79,47 @@ class Adc(Module):
         ]
 
         # set up counters for the four states CNVH, CONV, READ, RTT
-        t_read = 3 * p.width * p.channels // p.lanes  # SDR
-        assert p.lanes * t_read == p.width * p.channels * 3
+        # 3 cycles per sck period, one (SDR) or two (DDR) bits per lane
+        n_edge = 2 if p.ddr else 1
+        t_read = 3 * p.width * p.channels // (p.lanes * n_edge)
+        assert p.lanes * n_edge * t_read == p.width * p.channels * 3
         assert all(_ > 0 for _ in (p.t_cnvh, p.t_conv, p.t_rtt))
         assert p.t_conv > 1
-        count = Signal(max=max(p.t_cnvh, p.t_conv, t_read, p.t_rtt), reset_less=True)
+        # The conversion (CNVH, CONV) and the readout (READ, RTT) have their
+        # own state machines. The next conversion may start `t_next` cycles
+        # after the readout started: when the readout is done (and there
+        # was one IDLE cycle) or, pipelined, such that its CONV ends then.
+        # The time from the conversion start to the data is always the same.
+        t_next = t_read + p.t_rtt
+        if p.pipelined:
+            t_next = max(0, t_next - p.t_cnvh - p.t_conv)
+        count = Signal(max=max(p.t_cnvh, p.t_conv), reset_less=True)
         count_load = Signal.like(count)
         count_done = Signal()
+        read_count = Signal(max=max(t_read, p.t_rtt), reset_less=True)
+        read_count_load = Signal.like(read_count)
+        read_count_done = Signal()
+        next_count = Signal(max=t_next + 1)
+        read_start = Signal()
         update = Signal()
 
-        self.comb += count_done.eq(count == 0)
+        self.comb += [
+            count_done.eq(count == 0),
+            read_count_done.eq(read_count == 0),
+        ]
         self.sync += [
             count.eq(count - 1),
             If(
                 count_done,
                 count.eq(count_load),
             ),
+            read_count.eq(read_count - 1),
+            If(
+                read_count_done,
+                read_count.eq(read_count_load),
+            ),
+            If(next_count != 0, next_count.eq(next_count - 1)),
+            If(read_start, next_count.eq(t_next)),
             # 6 bit barrel shifter that shifts by two each cycle
             If(sck_en, Cat(ddr_clk_synth).eq(Cat(ddr_clk_synth[-2:], ddr_clk_synth))),
         ]
@@ -90,8 +127,10 @@ class Adc(Module):
         self.submodules.fsm = fsm = FSM("IDLE")
         fsm.act(
             "IDLE",
-            self.done.eq(1),
-            If(self.start, count_load.eq(p.t_cnvh - 1), NextState("CNVH")),
+            If(
+                next_count == 0,
+                If(self.start, count_load.eq(p.t_cnvh - 1), NextState("CNVH")),
+            ),
         )
         fsm.act(
             "CNVH",
@@ -99,35 +138,61 @@ class Adc(Module):
             cnvn.eq(1),
             If(count_done, NextState("CONV")),
         )
-        fsm.act("CONV", count_load.eq(t_read - 1), If(count_done, NextState("READ")))
-        fsm.act(
+        fsm.act("CONV", If(count_done, read_start.eq(1), NextState("IDLE")))
+
+        self.submodules.read_fsm = read_fsm = FSM("IDLE")
+        read_fsm.act(
+            "IDLE",
+            If(read_start, read_count_load.eq(t_read - 1), NextState("READ")),
+        )
+        read_fsm.act(
             "READ",
             self.reading.eq(1),
-            count_load.eq(p.t_rtt - 1),
+            read_count_load.eq(p.t_rtt - 1),
             sck_en.eq(1),
-            If(count_done, NextState("RTT")),
+            If(read_count_done, NextState("RTT")),
         )
-        fsm.act(
+        read_fsm.act(
             "RTT",  # account for sck->clkout round trip time
             self.reading.eq(1),
-            If(count_done, update.eq(1), NextState("IDLE")),
+            If(read_count_done, update.eq(1), NextState("IDLE")),
         )
+        if p.pipelined:
+            # data valid strobe
+            self.sync += self.done.eq(update)
+        else:
+            self.comb += self.done.eq(
+                fsm.ongoing("IDLE") & read_fsm.ongoing("IDLE") & (next_count == 0)
+            )
 
         self.clock_domains.cd_ret = ClockDomain("ret", reset_less=True)
         self.comb += self.cd_ret.clk.eq(clkout)
 
         k = p.channels // p.lanes
-        assert t_read == k * p.width * 3
+        assert n_edge * t_read == k * p.width * 3
         # flip sdos because the inputs on the ADC are flipped on schematic
         for i, sdo in enumerate(reversed(sdo)):
-            sdo_sr = Signal(2 * t_read)
-            self.sync.ret += [
-                sdo_sr[1:].eq(sdo_sr),
-                sdo_sr[0].eq(sdo),
-            ]
+            sdo_sr = Signal(2 * n_edge * t_read)
+            if p.ddr:
+                # the IDDR needs the pad input, invert afterwards
+                sdo_i, invert = (sdo2n, 1) if sdo is self.sdo[1] else (sdo, 0)
+                rise, fall = Signal(), Signal()
+                self.specials += DDRInput(sdo_i, rise, fall, ClockSignal("ret"))
+                # SAME_EDGE: the falling edge bit is the earlier one
+                # the registered IDDR outputs hold the last pair
+                sdo_data = Cat(rise ^ invert, fall ^ invert, sdo_sr)
+                self.sync.ret += sdo_sr.eq(sdo_data)
+            else:
+                self.sync.ret += [
+                    sdo_sr[1:].eq(sdo_sr),
+                    sdo_sr[0].eq(sdo),
+                ]
+                sdo_data = sdo_sr
             self.sync += [
                 If(
                     update,
-                    Cat(reversed([self.data[i * k + j] for j in range(k)])).eq(sdo_sr),
+                    Cat(reversed([self.data[i * k + j] for j in range(k)])).eq(
+                        sdo_data
+                    ),
                 )
             ]
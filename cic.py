@@ -0,0 +1,109 @@
+from migen import *
+from misoc.interconnect.stream import Endpoint
+
+
+class CICInterpolator(Module):
+    """Super-sampled CIC interpolator with runtime rate.
+
+    Interpolates by `r` (runtime, 2 to `r_max`) and outputs two samples per
+    cycle (`data0` is earlier). The gain is `r**(n - 1)`. The comb
+    section runs at the input rate and the integrators process two samples
+    per cycle. The arithmetic wraps at the output width. The filter waits
+    for input and stalls on output.
+
+    * `n`: order
+    * `r_max`: maximum rate
+    * `width`: input width
+    """
+
+    def __init__(self, n, r_max, width):
+        width_o = width + bits_for(r_max ** (n - 1) - 1)
+        self.r = Signal(max=r_max + 1, reset=r_max)
+        self.input = Endpoint([("data", (width, True))])
+        self.output = Endpoint([("data0", (width_o, True)), ("data1", (width_o, True))])
+
+        # phase of data0 within the current input sample period
+        p = Signal(max=r_max + 1)
+        # new input sample at data0 or data1
+        take = Signal()
+        take1 = Signal()
+        ce = Signal()
+        self.comb += [
+            take1.eq(p + 1 == self.r),
+            take.eq((p == 0) | take1),
+            ce.eq(~(self.output.stb & ~self.output.ack) & ~(take & ~self.input.stb)),
+            self.input.ack.eq(ce & take),
+        ]
+        self.sync += [
+            If(
+                ce,
+                If(
+                    p + 2 >= self.r,
+                    p.eq(p + 2 - self.r),
+                ).Else(
+                    p.eq(p + 2),
+                ),
+            )
+        ]
+
+        # comb section, one stage per cycle
+        x = Signal((width_o, True))
+        x_stb = Signal()
+        x_slot = Signal()
+        self.comb += x.eq(self.input.data)
+        self.sync += If(ce, x_stb.eq(take), x_slot.eq(take1))
+        x_reg = Signal((width_o, True), reset_less=True)
+        self.sync += If(ce, x_reg.eq(x))
+        x = x_reg
+        for i in range(n):
+            x0 = Signal((width_o, True))
+            x1 = Signal((width_o, True), reset_less=True)
+            stb, slot = Signal(), Signal()
+            self.sync += If(
+                ce,
+                If(
+                    x_stb,
+                    x0.eq(x),
+                    x1.eq(x - x0),
+                ),
+                stb.eq(x_stb),
+                slot.eq(x_slot),
+            )
+            x, x_stb, x_slot = x1, stb, slot
+
+        # zero stuffing
+        a = Signal((width_o, True), reset_less=True)
+        b = Signal((width_o, True), reset_less=True)
+        self.sync += If(
+            ce,
+            a.eq(Mux(x_stb & ~x_slot, x, 0)),
+            b.eq(Mux(x_stb & x_slot, x, 0)),
+        )
+
+        # integrators, two samples per cycle
+        for i in range(n):
+            a0 = Signal((width_o, True), reset_less=True)
+            ab = Signal((width_o, True), reset_less=True)
+            y0 = Signal((width_o, True), reset_less=True)
+            y1 = Signal((width_o, True))
+            self.sync += If(
+                ce,
+                a0.eq(a),
+                ab.eq(a + b),
+                y0.eq(y1 + a0),
+                y1.eq(y1 + ab),
+            )
+            a, b = y0, y1
+
+        self.sync += [
+            If(
+                self.output.ack,
+                self.output.stb.eq(0),
+            ),
+            If(
+                ce,
+                self.output.data0.eq(a),
+                self.output.data1.eq(b),
+                self.output.stb.eq(1),
+            ),
+        ]
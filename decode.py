@@ -5,8 +5,22 @@ from misoc.cores.duc import complex
 
 from interpolate import SampleMux, InterpolateChannel
 
+write_layout = [("we", 1), ("addr", 7), ("data", 8)]
+header_layout = write_layout + [("type", 4)]
 
-header_layout = [("we", 1), ("addr", 7), ("data", 8), ("type", 4)]
+# header.type:
+# 1: the body carries samples
+# 2: the body carries a list of register writes (`write_layout`,
+#    first write most significant, entries with `we` clear are skipped)
+# 3: the body carries `header.data` bytes (first byte most significant)
+#    written to consecutive registers starting at `header.addr`
+# 4: the body carries the interpolator filter coefficients
+#    (`InterpolateChannel.coeff`, `coeff_width` bit each, first most
+#    significant)
+# 5: the body carries timed samples, each slot with a hold duration
+#    (`SampleMux`, first slot most significant)
+
+coeff_width = 18
 
 # straming gearbox
 #
@@ -38,14 +52,20 @@ class SampleGearbox(Module):
         self.comb += [
             If(
                 self.data_stb,
-                If(self.data_short, incoming.eq(data_width - 1),).Else(
+                If(
+                    self.data_short,
+                    incoming.eq(data_width - 1),
+                ).Else(
                     incoming.eq(data_width),
                 ),
             ).Else(
                 incoming.eq(0),
             ),
             full.eq(level >= sample_width),
-            If(full, outgoing.eq(sample_width),).Else(
+            If(
+                full,
+                outgoing.eq(sample_width),
+            ).Else(
                 outgoing.eq(0),
             ),
         ]
@@ -88,32 +108,55 @@ bus_layout = [
 
 
 class Register(Module):
-    """Configuration/status register"""
+    """Configuration/status register
 
-    def __init__(self, width=None, read=True, write=True, readback=True):
+    Writable registers in a commit `group` are double buffered: bus writes
+    go to `shadow` and are transferred to `write` on `commit`. Readback
+    returns `shadow`.
+    """
+
+    def __init__(self, width=None, read=True, write=True, readback=True, group=None):
         self.bus = Record(bus_layout)
+        self.group = group
         if width is None:
             width = len(self.bus.dat_w)
         assert width <= len(self.bus.dat_w)
         if write:
             self.write = Signal(width)
-            self.sync += If(self.bus.we, self.write.eq(self.bus.dat_w))
+            if group is None:
+                self.sync += If(self.bus.we, self.write.eq(self.bus.dat_w))
+            else:
+                self.shadow = Signal(width)
+                self.commit = Signal()
+                self.sync += [
+                    If(self.bus.we, self.shadow.eq(self.bus.dat_w)),
+                    If(self.commit, self.write.eq(self.shadow)),
+                ]
         if read:
             self.read = Signal(width)
             self.comb += self.bus.dat_r.eq(self.read)
         if read and write and readback:
-            self.comb += self.read.eq(self.write)
+            self.comb += self.read.eq(self.write if group is None else self.shadow)
 
 
 def intersection(a, b):
+    """Whether the address sets given by `(adr, mask)` pairs overlap"""
     (aa, am), (ba, bm) = a, b
-    # TODO
-    return False
+    return (aa ^ ba) & am & bm == 0
 
 
 class Bus(Module):
-    def __init__(self):
+    """Register bus
+
+    The address decoder and the read multiplexer are generated as one case
+    over the bus address once all slaves are connected. If `pipeline`
+    is set, the read data is registered and valid `latency` cycles
+    after `re`.
+    """
+
+    def __init__(self, pipeline=False):
         self.bus = Record(bus_layout)
+        self.latency = int(pipeline)
         self._slaves = []
 
     def _check_intersection(self, adr, mask):
@@ -127,29 +170,79 @@ class Bus(Module):
         adr &= mask
         self._check_intersection(adr, mask)
         self._slaves.append((bus, adr, mask))
-        stb = Signal()
-        self.comb += [
-            stb.eq(self.bus.adr & mask == adr & mask),
-            bus.adr.eq(self.bus.adr),
-            bus.dat_w.eq(self.bus.dat_w),
-            bus.we.eq(self.bus.we & stb),
-            bus.re.eq(self.bus.re & stb),
-            If(stb, self.bus.dat_r.eq(bus.dat_r)),
-        ]
+
+    def do_finalize(self):
+        if not self._slaves:
+            return
+        stb = Signal(len(self._slaves))
+        dat_r = Signal.like(self.bus.dat_r)
+        cases = {}
+        for i, (bus, adr, mask) in enumerate(self._slaves):
+            self.comb += [
+                bus.adr.eq(self.bus.adr),
+                bus.dat_w.eq(self.bus.dat_w),
+                bus.we.eq(self.bus.we & stb[i]),
+                bus.re.eq(self.bus.re & stb[i]),
+            ]
+            for a in range(1 << len(self.bus.adr)):
+                if a & mask == adr:
+                    cases[a] = [stb[i].eq(1), dat_r.eq(bus.dat_r)]
+        self.comb += Case(self.bus.adr, cases)
+        if self.latency:
+            self.sync += self.bus.dat_r.eq(dat_r)
+        else:
+            self.comb += self.bus.dat_r.eq(dat_r)
 
 
 class Decode(Module):
     """Decode a frame into samples and metadata and drive
     a bus of registers from the metadata.
+
+    For each frame, `response` is the data of the addressed register and
+    `response_burst` collects the data of the `n_read` registers starting
+    at the addressed one (first register most significant), valid on
+    `response_stb`. Only the addressed register sees `re`, the following
+    ones are read without it. With `pipeline`, the register read multiplexer is
+    registered and `response` is valid one cycle after `stb`.
+
+    The interpolation `ratio` code (see `interpolate.ratios`) applies to
+    the sample multiplexer and all interpolators. At 10x the 16 samples
+    of a frame are for channel 0 (see `SampleMux`), at 40x a samples frame
+    is needed every other frame. Frames of type 5 carry samples with
+    individual hold durations (see `SampleMux`): long slow segments of a
+    waveform need few samples.
+
+    With `share_mac`, the I and Q interpolators of a channel share the
+    ciccomp DSP (not at 10x). With `reload`, the interpolator filter
+    coefficients can be loaded with frames of type 4. With
+    `dsp_primitive`, the interpolator filters instantiate DSP48E1
+    primitives.
+
+    Block writes from the body of frames of type 2 and 3 are applied
+    one per cycle after the burst read.
     """
 
-    def __init__(self, b_sample, n_channel, n_mux, t_frame):
+    def __init__(
+        self,
+        b_sample,
+        n_channel,
+        n_mux,
+        t_frame,
+        n_read=16,
+        pipeline=False,
+        share_mac=False,
+        reload=False,
+        dsp_primitive=False,
+    ):
         n_samples = n_mux * n_channel * 2
         header = Record(header_layout)
         body = Signal(n_samples * b_sample)
         self.frame = Signal(len(body) + len(header))
         self.stb = Signal()
         self.response = Signal(8)
+        self.response_burst = Signal(8 * n_read, reset_less=True)
+        self.response_stb = Signal()
+        self.ratio = Signal(2)
         self.comb += [
             Cat(header.raw_bits(), body).eq(self.frame),
         ]
@@ -159,36 +252,165 @@ class Decode(Module):
         )
         self.comb += [
             self.zoh.body.eq(body),
-            self.zoh.body_stb.eq(self.stb & (header.type == 1)),
+            self.zoh.body_stb.eq(self.stb & ((header.type == 1) | (header.type == 5))),
+            self.zoh.timed.eq(header.type == 5),
+            self.zoh.ratio.eq(self.ratio),
         ]
 
         self.interpolate = []
+        # interpolator clip counters (i, q) and clear strobe of each channel
+        self.clip = []
+        self.clip_clr = [Signal() for _ in range(n_channel)]
         self.data = [[Record(complex(16)) for _ in range(n_channel)] for _ in range(2)]
         for ch in range(n_channel):
-            for iq in "iq":
-                inter = InterpolateChannel()
-                self.submodules += inter
-                self.interpolate.append(inter)
+            if share_mac:
+                inter = [InterpolateChannel(2, reload, dsp_primitive)]
+            else:
+                inter = [InterpolateChannel(1, reload, dsp_primitive) for _ in "iq"]
+            self.submodules += inter
+            self.interpolate.extend(inter)
+            self.comb += [ii.ratio.eq(self.ratio) for ii in inter]
+            lanes = [lane for ii in inter for lane in ii.lanes]
+            self.clip.append(Cat(lane.clip for lane in lanes))
+            self.comb += [lane.clip_clr.eq(self.clip_clr[ch]) for lane in lanes]
+            lanes = [(i, o) for ii in inter for i, o in zip(ii.inputs, ii.outputs)]
+            for iq, (inp, out) in zip("iq", lanes):
                 self.comb += [
-                    inter.input.data.eq(getattr(self.zoh.sample[ch], iq)),
-                    inter.input.stb.eq(self.zoh.sample_stb),
-                    getattr(self.data[0][ch], iq).eq(inter.output.data0),
-                    getattr(self.data[1][ch], iq).eq(inter.output.data1),
-                    inter.output.ack.eq(1),
+                    inp.data.eq(getattr(self.zoh.sample[ch], iq)),
+                    inp.stb.eq(self.zoh.sample_stb),
+                    getattr(self.data[0][ch], iq).eq(out.data0),
+                    getattr(self.data[1][ch], iq).eq(out.data1),
+                    out.ack.eq(1),
                 ]
 
-        self.submodules.bus = Bus()
+        if reload:
+            n_coeff = len(self.interpolate[0].coeff)
+            coeff = Signal(n_coeff * coeff_width, reset_less=True)
+            coeff_stb = Signal()
+            self.sync += [
+                coeff_stb.eq(self.stb & (header.type == 4)),
+                If(
+                    self.stb & (header.type == 4),
+                    coeff.eq(body[-len(coeff) :]),
+                ),
+            ]
+            for inter in self.interpolate:
+                self.comb += inter.coeff_stb.eq(coeff_stb)
+                for i, c in enumerate(reversed(inter.coeff)):
+                    self.comb += c.eq(coeff[i * coeff_width : (i + 1) * coeff_width])
+
+        self.submodules.bus = Bus(pipeline)
         self.comb += [
             self.bus.bus.dat_w.eq(header.data),
             self.bus.bus.adr.eq(header.addr),
-            self.bus.bus.we.eq(self.stb & header.we),
+            self.bus.bus.we.eq(self.stb & header.we & (header.type != 3)),
             self.bus.bus.re.eq(self.stb & ~header.we),
             self.response.eq(self.bus.bus.dat_r),
         ]
 
+        # burst read the following registers, sampled without `re`
+        # (no read side effects on registers that were not addressed)
+        read_adr = Signal.like(self.bus.bus.adr, reset_less=True)
+        read_pending = Signal(max=n_read)
+        self.comb += [
+            If(
+                ~self.stb & (read_pending != 0),
+                self.bus.bus.adr.eq(read_adr),
+            ),
+        ]
+        read_valid = Signal()
+        read_done = Signal()
+        self.comb += [
+            read_valid.eq(self.stb | (read_pending != 0)),
+            read_done.eq(Mux(self.stb, n_read == 1, read_pending == 1)),
+        ]
+        self.sync += [
+            If(
+                read_pending != 0,
+                read_pending.eq(read_pending - 1),
+                read_adr.eq(read_adr + 1),
+            ),
+            If(
+                self.stb,
+                read_pending.eq(n_read - 1),
+                read_adr.eq(header.addr + 1),
+            ),
+        ]
+        for _ in range(self.bus.latency):
+            read_valid_d, read_done_d = Signal(), Signal()
+            self.sync += [
+                read_valid_d.eq(read_valid),
+                read_done_d.eq(read_done),
+            ]
+            read_valid, read_done = read_valid_d, read_done_d
+        self.sync += [
+            self.response_stb.eq(read_done),
+            If(
+                read_valid,
+                self.response_burst.eq(Cat(self.bus.bus.dat_r, self.response_burst)),
+            ),
+        ]
+
+        # block write from the body after the burst read
+        n_burst = len(body) // 8
+        assert n_read - 1 + n_burst <= t_frame
+        write = Record(write_layout)
+        write_buf = Signal(len(body), reset_less=True)
+        write_burst = Signal(reset_less=True)
+        write_adr = Signal.like(self.bus.bus.adr, reset_less=True)
+        write_pending = Signal(max=n_burst + 1)
+        write_ce = Signal()
+        self.comb += [
+            write.raw_bits().eq(write_buf[-len(write) :]),
+            write_ce.eq(~self.stb & (read_pending == 0) & (write_pending != 0)),
+            If(
+                write_ce,
+                If(
+                    write_burst,
+                    self.bus.bus.dat_w.eq(write_buf[-8:]),
+                    self.bus.bus.adr.eq(write_adr),
+                    self.bus.bus.we.eq(1),
+                ).Else(
+                    self.bus.bus.dat_w.eq(write.data),
+                    self.bus.bus.adr.eq(write.addr),
+                    self.bus.bus.we.eq(write.we),
+                ),
+            ),
+        ]
+        self.sync += [
+            If(
+                write_ce,
+                write_pending.eq(write_pending - 1),
+                write_adr.eq(write_adr + 1),
+                If(
+                    write_burst,
+                    write_buf.eq(write_buf << 8),
+                ).Else(
+                    write_buf.eq(write_buf << len(write)),
+                ),
+            ),
+            If(
+                self.stb,
+                write_buf.eq(body),
+                write_adr.eq(header.addr),
+                write_burst.eq(header.type == 3),
+                write_pending.eq(0),
+                If(
+                    header.type == 2,
+                    write_pending.eq(len(body) // len(write)),
+                ),
+                If(
+                    header.type == 3,
+                    write_pending.eq(Mux(header.data > n_burst, n_burst, header.data)),
+                ),
+            ),
+        ]
+
     def map_registers(self, registers):
         self.mem_map = {}
         self.registers = {}
+        # commit strobes of the register groups
+        self.commit = {}
         addr = 0
         for name, *regs in registers:
             if isinstance(name, int):
@@ -200,6 +422,10 @@ class Decode(Module):
                 self.bus.connect(reg.bus, addr, mask=0x7F)
                 assert addr not in self.mem_map
                 self.mem_map[addr] = (name, i)
+                if hasattr(reg, "commit"):
+                    if reg.group not in self.commit:
+                        self.commit[reg.group] = Signal(name=f"commit_{reg.group}")
+                    self.comb += reg.commit.eq(self.commit[reg.group])
                 self.submodules += reg
                 addr += 1
 
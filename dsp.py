@@ -0,0 +1,147 @@
+from migen import *
+
+
+class DSP(Module):
+    """Pipelined multiply-accumulate DSP block.
+
+    `p = (a + d)*b + c` on `load`, else `p = (a + d)*b + p`.
+
+    The operands are registered `areg` times (`b` once more with the
+    pre-adder), the pre-adder sum, the product and `p` once. `c`, `pcin`
+    and `load` are not registered. `ce` advances the whole pipeline.
+
+    The behavioral model relies on synthesis inference. With `primitive`
+    a DSP48E1 is instantiated with the same pipeline.
+
+    :param arch: DSP block architecture (xilinx/lattice) for the widths
+    :param areg: Operand register stages (0 to 2)
+    :param preadd: Use the `d` pre-adder
+    :param cascade: Load `pcin` (from the `pcout` of another block)
+        instead of `c`
+    :param primitive: Instantiate a DSP48E1 (xilinx only)
+    """
+
+    def __init__(
+        self, arch="xilinx", areg=1, preadd=True, cascade=False, primitive=False
+    ):
+        assert arch in ("xilinx", "lattice"), "unsupported dsp architecture"
+        assert 0 <= areg and areg + preadd <= 2
+        if arch == "lattice":
+            w_a, w_b, w_p = 18, 18, 36
+        else:
+            w_a, w_b, w_p = 25, 18, 48
+        self.a = Signal((w_a, True), reset_less=True)
+        self.b = Signal((w_b, True), reset_less=True)
+        self.c = Signal((w_p, True), reset_less=True)
+        self.d = Signal((w_a, True), reset_less=True)
+        self.pcin = Signal((w_p, True), reset_less=True)
+        self.load = Signal()
+        self.ce = Signal(reset=1)
+        self.p = Signal((w_p, True), reset_less=True)
+        self.pcout = Signal((w_p, True), reset_less=True)
+        self.latency = areg + preadd + 2
+
+        if primitive:
+            assert arch == "xilinx", "DSP48E1 is xilinx only"
+            self._dsp48e1(areg, preadd, cascade)
+        else:
+            self._behavioral(areg, preadd, cascade)
+
+    def _behavioral(self, areg, preadd, cascade):
+        a, b, d = self.a, self.b, self.d
+        for _ in range(areg):
+            a_reg, b_reg, d_reg = Signal.like(a), Signal.like(b), Signal.like(d)
+            self.sync += If(self.ce, a_reg.eq(a), b_reg.eq(b), d_reg.eq(d))
+            a, b, d = a_reg, b_reg, d_reg
+        if preadd:
+            ad = Signal.like(a)
+            b_reg = Signal.like(b)
+            # b is piped to be in line with a+d
+            self.sync += If(self.ce, ad.eq(a + d), b_reg.eq(b))
+            a, b = ad, b_reg
+        self.m = m = Signal.like(self.p)
+        self.sync += [
+            If(
+                self.ce,
+                m.eq(a * b),
+                If(
+                    self.load,
+                    self.p.eq(m + (self.pcin if cascade else self.c)),
+                ).Else(
+                    self.p.eq(self.p + m),
+                ),
+            )
+        ]
+        self.comb += self.pcout.eq(self.p)
+
+    def _dsp48e1(self, areg, preadd, cascade):
+        opmode = Signal(7)
+        self.comb += [
+            # Z: C/PCIN (load) or P (accumulate), Y: M, X: M
+            opmode.eq(Mux(self.load, 0b0010101 if cascade else 0b0110101, 0b0100101)),
+        ]
+        self.specials += Instance(
+            "DSP48E1",
+            p_A_INPUT="DIRECT",
+            p_B_INPUT="DIRECT",
+            p_USE_DPORT="TRUE" if preadd else "FALSE",
+            p_USE_MULT="MULTIPLY",
+            p_USE_SIMD="ONE48",
+            p_USE_PATTERN_DETECT="NO_PATDET",
+            p_AUTORESET_PATDET="NO_RESET",
+            p_AREG=areg,
+            p_ACASCREG=areg,
+            p_BREG=areg + preadd,
+            p_BCASCREG=areg + preadd,
+            p_DREG=areg if preadd else 1,
+            p_ADREG=int(preadd),
+            p_CREG=0,
+            p_MREG=1,
+            p_PREG=1,
+            p_INMODEREG=0,
+            p_OPMODEREG=0,
+            p_ALUMODEREG=0,
+            p_CARRYINREG=0,
+            p_CARRYINSELREG=0,
+            i_CLK=ClockSignal(),
+            # A2 (and D) into the pre-adder, B2 into the multiplier
+            i_INMODE=0b00100 if preadd else 0b00000,
+            i_OPMODE=opmode,
+            i_ALUMODE=0b0000,
+            i_CARRYINSEL=0b000,
+            i_CARRYIN=0,
+            i_A=Cat(self.a, Replicate(self.a[-1], 30 - len(self.a))),
+            i_B=self.b,
+            i_C=self.c,
+            i_D=self.d,
+            i_PCIN=self.pcin,
+            i_ACIN=0,
+            i_BCIN=0,
+            i_CARRYCASCIN=0,
+            i_MULTSIGNIN=0,
+            i_CEA1=self.ce,
+            i_CEA2=self.ce,
+            i_CEB1=self.ce,
+            i_CEB2=self.ce,
+            i_CED=self.ce,
+            i_CEAD=self.ce,
+            i_CEC=0,
+            i_CEM=self.ce,
+            i_CEP=self.ce,
+            i_CECTRL=0,
+            i_CEINMODE=0,
+            i_CEALUMODE=0,
+            i_CECARRYIN=0,
+            i_RSTA=0,
+            i_RSTB=0,
+            i_RSTC=0,
+            i_RSTD=0,
+            i_RSTM=0,
+            i_RSTP=0,
+            i_RSTCTRL=0,
+            i_RSTINMODE=0,
+            i_RSTALUMODE=0,
+            i_RSTALLCARRYIN=0,
+            o_P=self.p,
+            o_PCOUT=self.pcout,
+        )
@@ -1,4 +1,4 @@
-# First order IIR filter for multiple channels and profiles with one DSP and no blockram.
+# IIR filter of configurable order for multiple channels and profiles with one DSP, optionally memory backed.
 # DSP block with MSB aligned inputs and "round half down" rounding.
 #
 #
@@ -7,74 +7,161 @@
 from ast import Constant
 from migen import *
 
+from dsp import DSP
+
 N_COEFF = 3  # [b0, b1, a0] number of coefficients for a first order iir
 
 
-class Dsp(Module):
-    def __init__(self):
-        # xilinx dsp architecture (subset)
-        self.a = a = Signal((25, True), reset_less=True)
-        self.b = b = Signal((18, True), reset_less=True)
-        self.c = c = Signal((48, True), reset_less=True)
-        self.mux_p = mux_p = Signal()  # accumulator mux
-        self.m = m = Signal((48, True), reset_less=True)
-        self.p = p = Signal((48, True), reset_less=True)
-        self.sync += [m.eq(a * b), p.eq(m + c), If(mux_p, p.eq(m + p))]
+def n_coeff(order):
+    """Number of coefficients [b0, ..., b(order), a1, ..., a(order)]"""
+    return 2 * order + 1
+
+
+class Dsp(DSP):
+    def __init__(self, primitive=False):
+        # xilinx dsp architecture (subset), unregistered operands
+        DSP.__init__(self, areg=0, preadd=False, primitive=primitive)
+        self.mux_p = Signal()  # accumulator mux
+        self.comb += self.load.eq(~self.mux_p)
 
 
 class Iir(Module):
-    def __init__(self, w_coeff, w_data, log2_a0, n_profiles, n_channels):
+    """IIR filter for multiple channels and profiles with one DSP
+
+    `order` 1 has the coefficients `[b0, b1, a0]` (`N_COEFF`), higher orders
+    `[b0, ..., b(order), a1, ..., a(order)]` (e.g. the biquad `[b0, b1, b2,
+    a1, a2]`). The input history is shared by the profiles, the output
+    history is per profile. The channels are processed one after the other,
+    one coefficient per cycle. With `parallel`, each channel has its own
+    DSP and the channels are processed concurrently.
+
+    `latency` is the number of cycles from `stb_in` to `stb_out` (and the
+    updated `outp`): `n_channels*n_coeff + 4`, with `parallel`
+    `n_coeff + 4`.
+
+    With `memory`, the coefficients, offsets and the output history are
+    kept in LUTRAM/BRAM (one word per profile and channel, registered
+    reads) instead of registers and multiplexers, for many profiles.
+    There are no `coeff` and `offset` registers then: a profile is written
+    through `wr_coeff`, `wr_offset`, `wr_channel`, `wr_profile` and
+    `wr_stb`. `outp` is registered and follows a change of `ch_profile`
+    with the next update (instead of immediately). The latency is the same.
+    """
+
+    def __init__(
+        self,
+        w_coeff,
+        w_data,
+        log2_a0,
+        n_profiles,
+        n_channels,
+        dsp_primitive=False,
+        order=1,
+        parallel=False,
+        memory=False,
+    ):
+        self.n_coeff = n_step = n_coeff(order)
+        if parallel and n_channels > 1:
+            # one single channel filter per channel
+            iirs = [
+                Iir(
+                    w_coeff,
+                    w_data,
+                    log2_a0,
+                    n_profiles,
+                    1,
+                    dsp_primitive,
+                    order,
+                    memory=memory,
+                )
+                for _ in range(n_channels)
+            ]
+            self.submodules += iirs
+            self.stb_in = Signal()
+            self.stb_out = iirs[0].stb_out
+            self.comb += [iir.stb_in.eq(self.stb_in) for iir in iirs]
+            self.inp = Array(iir.inp[0] for iir in iirs)
+            self.outp = Array(iir.outp[0] for iir in iirs)
+            if memory:
+                self._profile_write_port(w_coeff, w_data, n_profiles, n_channels)
+                for i, iir in enumerate(iirs):
+                    self.comb += [
+                        iir.wr_stb.eq(self.wr_stb & (self.wr_channel == i)),
+                        iir.wr_profile.eq(self.wr_profile),
+                        [a.eq(b) for a, b in zip(iir.wr_coeff, self.wr_coeff)],
+                        iir.wr_offset.eq(self.wr_offset),
+                    ]
+            else:
+                self.coeff = Array(
+                    Array(
+                        Array(iir.coeff[k][j][0] for iir in iirs)
+                        for j in range(n_profiles)
+                    )
+                    for k in range(n_step)
+                )
+                self.offset = Array(
+                    Array(iir.offset[j][0] for iir in iirs) for j in range(n_profiles)
+                )
+            self.ch_profile = Array(iir.ch_profile[0] for iir in iirs)
+            self.hold = Array(iir.hold[0] for iir in iirs)
+            self.clip_pos = Array(iir.clip_pos[0] for iir in iirs)
+            self.clip_neg = Array(iir.clip_neg[0] for iir in iirs)
+            self.latency = iirs[0].latency
+            return
+        self.latency = n_channels * n_step + 4
         # input strobe signal (start processing all channels)
         self.stb_in = stb_in = Signal()
         self.stb_out = stb_out = Signal()  # output strobe signal (all channels done)
         self.inp = inp = Array(Signal((w_data, True)) for _ in range(n_channels))
         self.outp = outp = Array(Signal((w_data, True)) for _ in range(n_channels))
-        # coeff registers for all channels and profiles
-        self.coeff = coeff = Array(
-            Array(
-                Array(Signal((w_coeff, True)) for _ in range(n_channels))
+        if memory:
+            self._profile_write_port(w_coeff, w_data, n_profiles, n_channels)
+        else:
+            # coeff registers for all channels and profiles
+            self.coeff = coeff = Array(
+                Array(
+                    Array(Signal((w_coeff, True)) for _ in range(n_channels))
+                    for _ in range(n_profiles)
+                )
+                for _ in range(n_step)
+            )
+            self.offset = offset = Array(
+                Array(Signal((w_data, True)) for _ in range(n_channels))
                 for _ in range(n_profiles)
             )
-            for _ in range(N_COEFF)
-        )
-        self.offset = offset = Array(
-            Array(Signal((w_data, True)) for _ in range(n_channels))
-            for _ in range(n_profiles)
-        )
         # registers for selected profile for channel
         self.ch_profile = ch_profile = Array(
             Signal(max=n_profiles + 1) for _ in range(n_channels)
         )
         # output hold signal for each channel
         self.hold = hold = Array(Signal() for _ in range(n_channels))
+        # output clipped to the positive limit/to zero (not held), strobes
+        self.clip_pos = clip_pos = Array(Signal() for _ in range(n_channels))
+        self.clip_neg = clip_neg = Array(Signal() for _ in range(n_channels))
 
         ###
 
-        # Making these registers reset less results in worsend timing.
-        # y1 register unique for each profile
-        y1 = Array(
-            Array(Signal((w_data, True)) for _ in range(n_channels))
-            for _ in range(n_profiles)
-        )
-        # x0, x1 registers shared for all profiles
+        # x0, ..., x(order) registers shared for all profiles
         x = Array(
-            Array(Signal((w_data, True)) for _ in range(n_channels))
-            for _ in range(N_COEFF - 1)
+            Array(Signal((w_data, True)) for _ in range(order + 1))
+            for _ in range(n_channels)
         )
         y0_clipped = Signal((w_data, True))
         profile_index = Signal(max=n_profiles + 1)
         channel_index = Signal(max=n_channels + 1)
         busy = Signal()
-        # computation steps/pipeline:
+        # computation steps/pipeline (first order):
         # 0    -> load coeff[0],xy[0]
         # 1    -> load coeff[1],xy[1], m0=coeff[0]*xy[0]
         # 2    -> load coeff[2],xy[2], m1=coeff[1]*xy[1], p0=offset+m0
         # 1(3) ->                      m2=coeff[2]*xy[2], p1=p0+m1
         # 2(4) ->                                         p2=p1+m2
         # 3(5) ->                                                      retrieve data y0=clip(p2)?hold
-        step = Signal(2)  # computation step
+        # Higher orders have more steps per channel, the result of the
+        # previous channel is always retrieved at step 2.
+        step = Signal(max=n_step)  # computation step
         ch_profile_last_ch = Signal(max=n_profiles + 1)  # auxillary signal for muxing
-        self.submodules.dsp = dsp = Dsp()
+        self.submodules.dsp = dsp = Dsp(dsp_primitive)
         assert w_data <= len(dsp.b)
         assert w_coeff <= len(dsp.a)
         shift_c = len(dsp.a) + len(dsp.b) - w_data - (w_data - log2_a0)
@@ -83,15 +170,113 @@ class Iir(Module):
         # +1 from standard sign bit
         n_sign = len(dsp.p) - len(dsp.a) - len(dsp.b) + w_data - log2_a0 + 1
         c_rounding_offset = Constant((1 << shift_c - 1) - 1, shift_c)
+        # the result of the previous channel is written back at step 2
+        y_we = Signal()
+        self.comb += y_we.eq(
+            busy
+            & (step == 2)
+            & (channel_index != 0)
+            & (channel_index != n_channels + 1)
+        )
+        if memory:
+            # Coefficients, offset and output history of a profile and channel
+            # are read together with the address presented one cycle ahead
+            # (registered read). The history of the previous channel is kept
+            # for its write back.
+            w_profile = bits_for(n_profiles - 1)
+            w_channel = bits_for(n_channels - 1) if n_channels > 1 else 0
+
+            def adr(profile, channel):
+                if w_channel:
+                    return Cat(profile[:w_profile], channel[:w_channel])
+                return profile[:w_profile]
+
+            depth = 1 << w_profile + w_channel
+            coeff_mem = Memory(n_step * w_coeff + w_data, depth)
+            y_mem = Memory(order * w_data, depth)
+            coeff_wr = coeff_mem.get_port(write_capable=True)
+            coeff_rd = coeff_mem.get_port()
+            y_wr = y_mem.get_port(write_capable=True)
+            y_rd = y_mem.get_port()
+            self.specials += coeff_mem, y_mem, coeff_wr, coeff_rd, y_wr, y_rd
+            coeff_sel = Array(Signal((w_coeff, True)) for _ in range(n_step))
+            offset_sel = Signal((w_data, True))
+            y_sel = [Signal((w_data, True)) for _ in range(order)]
+            y_last = Signal(order * w_data)
+            self.comb += [
+                coeff_wr.we.eq(self.wr_stb),
+                coeff_wr.adr.eq(adr(self.wr_profile, self.wr_channel)),
+                coeff_wr.dat_w.eq(Cat(self.wr_coeff, self.wr_offset)),
+                Cat(coeff_sel, offset_sel).eq(coeff_rd.dat_r),
+                Cat(y_sel).eq(y_rd.dat_r),
+                If(
+                    ~busy,
+                    coeff_rd.adr.eq(adr(ch_profile[0], C(0))),
+                )
+                .Elif(
+                    step == n_step - 1,
+                    coeff_rd.adr.eq(
+                        adr(ch_profile[channel_index + 1], channel_index + 1)
+                    ),
+                )
+                .Else(
+                    coeff_rd.adr.eq(adr(profile_index, channel_index)),
+                ),
+                y_rd.adr.eq(coeff_rd.adr),
+                y_wr.we.eq(y_we & ~hold[channel_index - 1]),
+                y_wr.adr.eq(adr(ch_profile_last_ch, channel_index - 1)),
+                y_wr.dat_w.eq(Cat(y0_clipped, y_last)),
+            ]
+            self.sync += [
+                If(busy & (step == n_step - 1), y_last.eq(y_rd.dat_r)),
+                If(
+                    y_we,
+                    outp[channel_index - 1].eq(
+                        Mux(hold[channel_index - 1], y_last[:w_data], y0_clipped)
+                    ),
+                ),
+            ]
+            coeff_sel = coeff_sel[step]
+        else:
+            # Making these registers reset less results in worsend timing.
+            # y1, ..., y(order) registers unique for each profile
+            y = [
+                Array(
+                    Array(Signal((w_data, True)) for _ in range(n_channels))
+                    for _ in range(n_profiles)
+                )
+                for _ in range(order)
+            ]
+            coeff_sel = coeff[step][profile_index][channel_index]
+            offset_sel = offset[profile_index][channel_index]
+            y_sel = [yk[profile_index][channel_index] for yk in y]
+            self.sync += If(
+                y_we & ~hold[channel_index - 1],
+                y[0][ch_profile_last_ch][channel_index - 1].eq(y0_clipped),
+                [
+                    y[k][ch_profile_last_ch][channel_index - 1].eq(
+                        y[k - 1][ch_profile_last_ch][channel_index - 1]
+                    )
+                    for k in range(1, order)
+                ],
+            )
+            self.comb += [o.eq(y[0][ch_profile[ch]][ch]) for ch, o in enumerate(outp)]
+        xy = Array([x[channel_index][k] for k in range(order + 1)] + y_sel)
 
         self.sync += [
             # default to 0 and set to 1 further down if computation done in this cycle
             stb_out.eq(0),
-            dsp.a.eq(coeff[step][profile_index][channel_index] << shift_a),
-            dsp.b.eq(
-                x[channel_index][step] << shift_b
-            ),  # overwritten later if at step==2
-            dsp.c.eq(Cat(c_rounding_offset, offset[profile_index][channel_index])),
+            [c.eq(0) for c in clip_pos + clip_neg],
+            If(
+                y_we & ~hold[channel_index - 1],
+                clip_pos[channel_index - 1].eq(
+                    (dsp.p[-n_sign:] != 0) & (dsp.p[-1] == 0)
+                ),
+                clip_neg[channel_index - 1].eq(dsp.p[-1] != 0),
+            ),
+            dsp.a.eq(coeff_sel << shift_a),
+            dsp.b.eq(xy[step] << shift_b),
+            dsp.c.eq(Cat(c_rounding_offset, offset_sel)),
             If(
                 stb_in & ~busy,
                 busy.eq(1),
@@ -102,35 +287,28 @@ class Iir(Module):
                 busy,
                 step.eq(step + 1),
                 If(step == 1, dsp.mux_p.eq(0)),
+                If(step == 2, dsp.mux_p.eq(1)),
                 If(
-                    step == 2,
-                    dsp.mux_p.eq(1),
+                    step == n_step - 1,
                     step.eq(0),
                     channel_index.eq(channel_index + 1),
                     profile_index.eq(ch_profile[channel_index + 1]),
-                    dsp.b.eq(y1[profile_index][channel_index] << shift_b),
-                    If(
-                        (channel_index != 0)
-                        & (channel_index != n_channels + 1)
-                        & ~hold[channel_index - 1],
-                        y1[ch_profile_last_ch][channel_index - 1].eq(y0_clipped),
-                    ),
                 ),
             ),
             # if done with all channels and last data is done
             If(
                 (channel_index == n_channels) & (step == 2),
+                step.eq(0),
                 channel_index.eq(0),
                 profile_index.eq(ch_profile[0]),
                 busy.eq(0),
                 stb_out.eq(1),
-                [xi[1].eq(xi[0]) for xi in x],
+                [xi[k].eq(xi[k - 1]) for xi in x for k in range(1, order + 1)],
             ),
         ]
         self.comb += [
             # assign extra signal for xy adressing
             ch_profile_last_ch.eq(ch_profile[channel_index - 1]),
-            [o.eq(y1[ch_profile[ch]][ch]) for ch, o in enumerate(outp)],
             # clipping to positive output range
             y0_clipped.eq(dsp.p >> shift_c),
             If(
@@ -139,3 +317,11 @@ class Iir(Module):
             ),
             If(dsp.p[-1] != 0, y0_clipped.eq(0)),  # if negative
         ]
+
+    def _profile_write_port(self, w_coeff, w_data, n_profiles, n_channels):
+        # coefficients and offset of a profile, written on `wr_stb`
+        self.wr_stb = Signal()
+        self.wr_channel = Signal(max=n_channels + 1)
+        self.wr_profile = Signal(max=n_profiles + 1)
+        self.wr_coeff = [Signal((w_coeff, True)) for _ in range(self.n_coeff)]
+        self.wr_offset = Signal((w_data, True))
@@ -0,0 +1,84 @@
+import numpy as np
+
+from iir import n_coeff
+from interpolate_model import wrap
+
+
+class IirModel:
+    """Vectorized bit-exact model of `iir.Iir`.
+
+    Runs the filter update by update over `(n, n_channels)` arrays of
+    input samples, all channels at once. Coefficients `coeff` are
+    `(n_coeff(order), n_profiles, n_channels)` (ordered as `Iir.coeff`),
+    offsets `(n_profiles, n_channels)`. The profile selection and the
+    hold flags are `(n_channels,)` or `(n, n_channels)` (one row per
+    update) and are constant during an update as in `Phaser`.
+
+    Mirrors the DSP arithmetic: MSB aligned operands, the offset with the
+    `shift_c` round half down offset loaded as `c` (the offset is not sign
+    extended), the `p` accumulator wrapping at its width and the output
+    clipped to the positive range. The output history `y` (per profile) and
+    the input history `x` persist across calls. `clip` are the
+    `(n, 2, n_channels)` positive/negative overflow flags of the unclipped
+    results of the last call (not held, as `Iir.clip_pos`/`Iir.clip_neg`).
+
+    * `dsp`: widths of the DSP `a`, `b` and `p` (see `dsp.DSP`)
+    """
+
+    def __init__(
+        self,
+        w_coeff,
+        w_data,
+        log2_a0,
+        n_profiles,
+        n_channels,
+        order=1,
+        dsp=(25, 18, 48),
+    ):
+        self.w_a, self.w_b, self.w_p = w_a, w_b, w_p = dsp
+        self.w_coeff = w_coeff
+        self.w_data = w_data
+        self.n_profiles = n_profiles
+        self.n_channels = n_channels
+        self.shift_c = w_a + w_b - w_data - (w_data - log2_a0)
+        self.shift_a = w_a - w_coeff
+        self.shift_b = w_b - w_data
+        self.n_sign = w_p - w_a - w_b + w_data - log2_a0 + 1
+        self.n_coeff = n_coeff(order)
+        # y1, ..., y(order) and x1, ..., x(order)
+        self.y = np.zeros((order, n_profiles, n_channels), np.int64)
+        self.x = np.zeros((order, n_channels), np.int64)
+
+    def update(self, x, coeff, offset, profile, hold):
+        """One update of all channels, returns the outputs"""
+        ch = np.arange(self.n_channels)
+        a = np.asarray(coeff, np.int64)[:, profile, ch] << self.shift_a
+        x = np.asarray(x, np.int64)
+        b = np.concatenate([x[None], self.x, self.y[:, profile, ch]]) << self.shift_b
+        c = (np.asarray(offset, np.int64)[profile, ch] & (1 << self.w_data) - 1) << (
+            self.shift_c
+        ) | (1 << self.shift_c - 1) - 1
+        p = wrap(wrap(c, self.w_p) + np.sum(a * b, axis=0), self.w_p)
+        y_full = p >> self.shift_c  # unclipped
+        y_max = (1 << self.w_data - 1) - 1
+        self.clip_pos = (y_full > y_max) & np.logical_not(hold)
+        self.clip_neg = (y_full < 0) & np.logical_not(hold)
+        y0 = np.clip(y_full, 0, y_max)
+        y = np.concatenate([y0[None], self.y[:-1, profile, ch]])
+        self.y[:, profile, ch] = np.where(hold, self.y[:, profile, ch], y)
+        self.x = np.concatenate([x[None], self.x[:-1]])
+        return self.y[0, profile, ch]
+
+    def __call__(self, x, coeff, offset, profile=0, hold=False):
+        """Outputs `(n, n_channels)` (`Iir.outp` after each update)"""
+        x = np.asarray(x, np.int64)
+        assert coeff.shape[0] == self.n_coeff
+        shape = x.shape
+        profile = np.broadcast_to(profile, shape)
+        hold = np.broadcast_to(hold, shape)
+        y, clip = [], []
+        for xi, pi, hi in zip(x, profile, hold):
+            y.append(self.update(xi, coeff, offset, pi, hi))
+            clip.append((self.clip_pos, self.clip_neg))
+        self.clip = np.array(clip)
+        return np.array(y)
@@ -1,54 +1,198 @@
 from migen import *
 from misoc.interconnect.stream import Endpoint
 from misoc.cores.fir import MACFIR, HBFMACUpsampler
-from misoc.cores.cic import SuperCIC
 from misoc.cores.duc import complex
 
+from cic import CICInterpolator
 from mac_hbf_upsampler import MAC_HBF_Upsampler
 from mac_sym_fir import MAC_SYM_FIR
 
+h_fir = [24, -85, 281, -1314, 55856, -1314, 281, -85, 24]
+
+h_hbf0 = [
+    -167,
+    0,
+    428,
+    0,
+    -931,
+    0,
+    1776,
+    0,
+    -3115,
+    0,
+    5185,
+    0,
+    -8442,
+    0,
+    14028,
+    0,
+    -26142,
+    0,
+    82873,
+    131072,
+    82873,
+    0,
+    -26142,
+    0,
+    14028,
+    0,
+    -8442,
+    0,
+    5185,
+    0,
+    -3115,
+    0,
+    1776,
+    0,
+    -931,
+    0,
+    428,
+    0,
+    -167,
+]
+
+h_hbf1 = [
+    294,
+    0,
+    -1865,
+    0,
+    6869,
+    0,
+    -20436,
+    0,
+    80679,
+    131072,
+    80679,
+    0,
+    -20436,
+    0,
+    6869,
+    0,
+    -1865,
+    0,
+    294,
+]
+
+# interpolation ratio codes (`SampleMux.ratio`, `InterpolateChannel.ratio`):
+# 0: 20x, 1: 10x (bypass hbf0), 2: 40x (cic r=10)
+ratios = [20, 10, 40]
+
+
+def saturate(x, width):
+    """Saturate the signed `x` to `width` bits.
+
+    Returns the saturated value and the overflow flag.
+    """
+    head = x[width - 1 :]
+    overflow = (head != 0) & (head != (1 << len(head)) - 1)
+    value = Mux(overflow, Cat(Replicate(~x[-1], width - 1), x[-1]), x[:width])
+    return value, overflow
+
 
 class SampleMux(Module):
     """Zero order hold interpolator.
 
+    The sample rate follows the interpolation `ratio` code (see `ratios`):
+    one sample every `n_interp` cycles (20x), every `2*n_interp` cycles
+    (40x, a frame carries samples for two frame periods) or, folded, every
+    `n_interp/n_channel` cycles (10x). Folded, the channel samples of a
+    frame slot are output in sequence on the first channel (early sample
+    most significant) and the other channels are zero.
+
+    A `timed` body carries slots of samples with a `b_hold` bit hold
+    duration `dt` (`dt` most significant). Each slot is held for `dt + 1`
+    sample periods and the last slot is held until the next body. Timed
+    samples are not folded.
+
     * `b_sample`: bits per sample (i or q)
     * `n_channel`: iq dac channels
     * `n_mux`: samples in a frame
     * `t_frame`: clock cycles per frame
+    * `b_hold`: bits per timed sample hold duration
     """
 
-    def __init__(self, b_sample, n_channel, n_mux, t_frame):
+    def __init__(self, b_sample, n_channel, n_mux, t_frame, b_hold=8):
         n_interp, n_rest = divmod(t_frame, n_mux)
         assert n_rest == 0
-        self.body = Signal(n_mux * n_channel * 2 * b_sample)
+        assert n_interp % n_channel == 0
+        b_slot = n_channel * 2 * b_sample
+        b_timed = b_slot + b_hold
+        self.body = Signal(n_mux * b_slot)
         self.body_stb = Signal()
+        self.timed = Signal()
+        self.ratio = Signal(2)
         self.sample = [Record(complex(b_sample)) for _ in range(n_channel)]
         self.sample_stb = Signal()
-        # frame body shift register
-        samples = [
-            Signal(n_channel * 2 * b_sample, reset_less=True) for _ in range(n_mux)
-        ]
-        assert len(Cat(samples)) == len(self.body)
-        i_interp = Signal(max=n_interp, reset_less=True)  # interpolation
+        # timed samples per frame
+        self.n_timed = n_timed = len(self.body) // b_timed
+        # frame body shift register, early slot most significant
+        buf = Signal(len(self.body), reset_less=True)
+        timed = Signal(reset_less=True)
+        hold = Signal(b_hold, reset_less=True)  # remaining hold periods
+        i_timed = Signal(max=n_timed, reset_less=True)  # remaining timed slots
+        slot = Signal(b_slot)
+        i_interp = Signal(max=2 * n_interp, reset_less=True)  # interpolation
+        i_fold = Signal(max=max(2, n_channel), reset_less=True)  # folded channel
+        fold = Signal()
+        t_interp = Signal.like(i_interp)
         self.comb += [
-            # early sample is most significant
-            Cat([(_.i[-b_sample:], _.q[-b_sample:]) for _ in self.sample]).eq(
-                samples[-1]
-            )
+            fold.eq((self.ratio == ratios.index(10)) & ~timed),
+            t_interp.eq(
+                Array([n_interp - 1, n_interp // n_channel - 1, 2 * n_interp - 1, 0])[
+                    self.ratio
+                ]
+            ),
+            slot.eq(Mux(timed, buf[-b_timed:-b_hold], buf[-b_slot:])),
+            If(
+                fold,
+                Cat(self.sample[0].i, self.sample[0].q).eq(
+                    Array(
+                        slot[i * 2 * b_sample : (i + 1) * 2 * b_sample]
+                        for i in range(n_channel)
+                    )[i_fold]
+                ),
+            ).Else(
+                # early sample is most significant
+                Cat([(_.i[-b_sample:], _.q[-b_sample:]) for _ in self.sample]).eq(slot),
+            ),
         ]
         self.sync += [
             i_interp.eq(i_interp - 1),
             self.sample_stb.eq(0),
             If(
                 i_interp == 0,
-                Cat(samples[1:]).eq(Cat(samples)),
-                i_interp.eq(n_interp - 1),
+                If(
+                    timed,
+                    If(
+                        hold != 0,
+                        hold.eq(hold - 1),
+                    ).Elif(
+                        i_timed != 0,
+                        buf.eq(buf << b_timed),
+                        hold.eq(buf[-b_timed - b_hold : -b_timed]),
+                        i_timed.eq(i_timed - 1),
+                    ),
+                )
+                .Elif(
+                    ~fold | (i_fold == 0),
+                    # the last slot is repeated
+                    buf.eq(Cat(buf[:b_slot], buf[:-b_slot])),
+                    i_fold.eq(n_channel - 1),
+                )
+                .Else(
+                    i_fold.eq(i_fold - 1),
+                ),
+                i_interp.eq(t_interp),
                 self.sample_stb.eq(1),
             ),
             If(
                 self.body_stb,
-                Cat(samples).eq(self.body),
-                i_interp.eq(n_interp - 1),
+                buf.eq(self.body),
+                timed.eq(self.timed),
+                hold.eq(self.body[-b_hold:]),
+                i_timed.eq(n_timed - 1),
+                i_interp.eq(t_interp),
+                i_fold.eq(n_channel - 1),
                 self.sample_stb.eq(1),
             ),
         ]
@@ -78,106 +222,189 @@ class MiniFIFO(Module):
         ]
 
 
-class InterpolateChannel(Module):
-    def __init__(self):
-        h_fir = [24, -85, 281, -1314, 55856, -1314, 281, -85, 24]
-        # ciccomp: cic droop and gain, rate 1/10, gain 2**9/5**4 ~ 0.9, 9 taps
-        self.submodules.ciccomp = MAC_SYM_FIR(h_fir, width_d=24, width_coef=16)
-        h_hbf0 = [
-            -167,
-            0,
-            428,
-            0,
-            -931,
-            0,
-            1776,
-            0,
-            -3115,
-            0,
-            5185,
-            0,
-            -8442,
-            0,
-            14028,
-            0,
-            -26142,
-            0,
-            82873,
-            131072,
-            82873,
-            0,
-            -26142,
-            0,
-            14028,
-            0,
-            -8442,
-            0,
-            5185,
-            0,
-            -3115,
-            0,
-            1776,
-            0,
-            -931,
-            0,
-            428,
-            0,
-            -167,
-        ]
-        # hbf1: rate 1/10 -> 1/5, gain=1, 39 taps
-        self.submodules.hbf0 = MAC_HBF_Upsampler(h_hbf0, width_d=24, width_coef=17)
-        h_hbf1 = [
-            294,
-            0,
-            -1865,
-            0,
-            6869,
-            0,
-            -20436,
-            0,
-            80679,
-            131072,
-            80679,
-            0,
-            -20436,
-            0,
-            6869,
-            0,
-            -1865,
-            0,
-            294,
-        ]
+class InterpolateLane(Module):
+    """HBF and CIC stages of an `InterpolateChannel` lane
+
+    The CIC input and the output are saturated. `clip` counts the cycles
+    with saturation (saturating) and is cleared on `clip_clr`.
+    """
+
+    def __init__(self, reload=False, dsp_primitive=False):
+        self.ratio = Signal(2)
+        self.clip = Signal(4)
+        self.clip_clr = Signal()
+        # hbf0: rate 1/10 -> 1/5, gain=1, 39 taps
+        self.submodules.hbf0 = MAC_HBF_Upsampler(
+            h_hbf0,
+            width_d=24,
+            width_coef=17,
+            reload=reload,
+            dsp_primitive=dsp_primitive,
+        )
         # hbf1: rate 1/5 -> 2/5, gain=1, 19 taps
-        self.submodules.hbf1 = MAC_HBF_Upsampler(h_hbf1, width_d=24, width_coef=17)
-        # cic: rate 2/5 -> 2/1, gain=5**4
-        # the CIC doesn't cope with FIR overshoot and baseband data must be
-        # band limited and/or backed off. Maybe TODO: clipping
-        self.submodules.cic = SuperCIC(n=5, r=5, width=16)
+        self.submodules.hbf1 = MAC_HBF_Upsampler(
+            h_hbf1,
+            width_d=24,
+            width_coef=17,
+            reload=reload,
+            dsp_primitive=dsp_primitive,
+        )
+        # cic: rate 2/5 -> 2/1, gain=5**4 (r=5)
+        # or rate 1/5 -> 2/1, gain=10**4 (r=10, 40x)
+        # the CIC doesn't cope with FIR overshoot, its input is saturated
+        self.submodules.cic = CICInterpolator(n=5, r_max=10, width=16)
         # buffer the odd/even stutter of the HBFs
         self.submodules.buf0 = MiniFIFO((len(self.hbf1.input.data), True))
         self.submodules.buf1 = MiniFIFO((len(self.cic.input.data), True))
 
-        self.input = Endpoint([("data", (14, True))])
+        self.input = Endpoint([("data", (len(self.hbf0.input.data), True))])
         self.output = Endpoint([("data0", (16, True)), ("data1", (16, True))])
-        # align MACs to MSB to save power, keep one bit headroom for FIR
-        # overshoot.
-        scale_in = len(self.ciccomp.input.data) - len(self.input.data) - 1
+        # saturate FIR overshoot
         scale_out = len(self.hbf1.output.data) - len(self.cic.input.data) - 1
         bias_out = (1 << scale_out - 1) - 1  # round half down bias
         # cic gain is r**(n-1) = 5**4, compensate with 2**-9,
-        # the rest (2**9/5**4) is applied by ciccomp
-        scale_cic = 9
-        bias_cic = (1 << scale_cic - 1) - 1  # round half down bias
+        # the rest (2**9/5**4) is applied by ciccomp.
+        # With r=10 the gain is 2**4*5**4, compensate with 2**-13.
+        scale_cic = [9, 13]
+        bias_cic = [(1 << s - 1) - 1 for s in scale_cic]  # round half down bias
+        r10 = Signal()
         self.comb += [
-            self.input.connect(self.hbf0.input, omit=["data"]),
-            self.ciccomp.input.data.eq(self.input.data << scale_in),
-            self.ciccomp.output.connect(self.hbf0.input),
-            self.hbf0.output.connect(self.buf0.input),
+            r10.eq(self.ratio == ratios.index(40)),
+            self.cic.r.eq(Mux(r10, 10, 5)),
+            If(
+                self.ratio == ratios.index(10),
+                # ciccomp at rate 1/5 directly into hbf1
+                self.input.connect(self.buf0.input),
+            ).Else(
+                self.input.connect(self.hbf0.input),
+                self.hbf0.output.connect(self.buf0.input),
+            ),
             self.buf0.output.connect(self.hbf1.input),
             self.hbf1.output.connect(self.buf1.input, omit=["data"]),
-            self.buf1.input.data.eq((self.hbf1.output.data + bias_out) >> scale_out),
             self.buf1.output.connect(self.cic.input),
             self.cic.output.connect(self.output, omit=["data0", "data1"]),
-            self.output.data0.eq((self.cic.output.data0 + bias_cic) >> scale_cic),
-            self.output.data1.eq((self.cic.output.data1 + bias_cic) >> scale_cic),
         ]
+        # round half down
+        cic_in = Signal((len(self.hbf1.output.data) + 1 - scale_out, True))
+        cic_in_clip = Signal()
+        self.comb += [
+            cic_in.eq((self.hbf1.output.data + bias_out) >> scale_out),
+            Cat(self.buf1.input.data, cic_in_clip).eq(
+                Cat(*saturate(cic_in, len(self.buf1.input.data)))
+            ),
+        ]
+        out_clip = []
+        for y, x in zip(
+            (self.output.data0, self.output.data1),
+            (self.cic.output.data0, self.cic.output.data1),
+        ):
+            y_full = Signal((len(x) + 1 - scale_cic[0], True))
+            y_clip = Signal()
+            self.comb += [
+                y_full.eq(
+                    Mux(
+                        r10,
+                        (x + bias_cic[1]) >> scale_cic[1],
+                        (x + bias_cic[0]) >> scale_cic[0],
+                    )
+                ),
+                Cat(y, y_clip).eq(Cat(*saturate(y_full, len(y)))),
+            ]
+            out_clip.append(y_clip)
+
+        clip = Signal()
+        self.comb += clip.eq(
+            (cic_in_clip & self.hbf1.output.stb & self.buf1.input.ack)
+            | ((out_clip[0] | out_clip[1]) & self.cic.output.stb)
+        )
+        self.sync += [
+            If(
+                clip & (self.clip != (1 << len(self.clip)) - 1),
+                self.clip.eq(self.clip + 1),
+            ),
+            If(
+                self.clip_clr,
+                self.clip.eq(0),
+            ),
+        ]
+
+
+class InterpolateChannel(Module):
+    """20x interpolator: ciccomp, hbf0, hbf1, cic
+
+    The interpolation `ratio` code (see `ratios`) selects 20x, 10x (hbf0
+    bypassed, ciccomp at rate 1/5) or 40x (cic r=10, ciccomp at rate
+    1/20) at runtime. The ciccomp compensates the CIC droop and gain for
+    all of them. 10x is not available with `n_lanes > 1` and 5x (ciccomp
+    at rate 2/5) exceeds the ciccomp throughput.
+
+    With `n_lanes > 1`, independent lanes (`inputs`, `outputs`) share the
+    ciccomp DSP. It needs 5 cycles per sample and can serve two lanes at
+    the 1/10 input rate. The HBFs are fully utilized and not shared.
+
+    With `reload`, the unique taps of the filters (`coeff`: ciccomp,
+    hbf0, hbf1) are loaded on `coeff_stb` and applied by each filter at
+    its next sample boundary. The HBF center taps are fixed to unity gain.
+
+    With `dsp_primitive`, the filters instantiate DSP48E1 primitives.
+    """
+
+    def __init__(self, n_lanes=1, reload=False, dsp_primitive=False):
+        # ciccomp: cic droop and gain, rate 1/10, gain 2**9/5**4 ~ 0.9, 9 taps
+        self.submodules.ciccomp = MAC_SYM_FIR(
+            h_fir,
+            width_d=24,
+            width_coef=16,
+            n_lanes=n_lanes,
+            reload=reload,
+            dsp_primitive=dsp_primitive,
+        )
+
+        self.inputs = [Endpoint([("data", (14, True))]) for _ in range(n_lanes)]
+        self.outputs = [
+            Endpoint([("data0", (16, True)), ("data1", (16, True))])
+            for _ in range(n_lanes)
+        ]
+        self.input, self.output = self.inputs[0], self.outputs[0]
+        self.ratio = Signal(2)
+        # align MACs to MSB to save power, keep one bit headroom for FIR
+        # overshoot.
+        scale_in = len(self.ciccomp.input.data) - len(self.input.data) - 1
+        self.lanes = []
+        for i in range(n_lanes):
+            lane = InterpolateLane(reload, dsp_primitive)
+            self.submodules += lane
+            self.lanes.append(lane)
+            self.comb += [
+                self.ciccomp.inputs[i].data.eq(self.inputs[i].data << scale_in),
+                self.ciccomp.outputs[i].connect(lane.input),
+                lane.output.connect(self.outputs[i]),
+                lane.ratio.eq(self.ratio),
+            ]
+            if n_lanes == 1:
+                # the ciccomp is stalled by and samples with hbf0 (hbf1)
+                self.comb += self.inputs[i].ack.eq(
+                    Mux(
+                        self.ratio == ratios.index(10),
+                        self.ciccomp.input.ack,
+                        lane.input.ack,
+                    )
+                )
+            else:
+                self.comb += self.inputs[i].ack.eq(self.ciccomp.inputs[i].ack)
+
+        # ciccomp, hbf0, hbf1 unique taps
+        stages = [[self.ciccomp]] + [
+            [lane.hbf0 for lane in self.lanes],
+            [lane.hbf1 for lane in self.lanes],
+        ]
+        self.coeff = []
+        self.coeff_stb = Signal()
+        for stage in stages:
+            coeff = [Signal.like(c) for c in stage[0].coeff]
+            self.coeff.extend(coeff)
+            for f in stage:
+                self.comb += [
+                    Cat(f.coeff).eq(Cat(coeff)),
+                    f.coeff_stb.eq(self.coeff_stb),
+                ]
@@ -0,0 +1,128 @@
+import numpy as np
+
+from interpolate import h_fir, h_hbf0, h_hbf1
+
+
+def wrap(x, width):
+    """Two's complement wrap to `width` bits"""
+    return ((x + (1 << width - 1)) & ((1 << width) - 1)) - (1 << width - 1)
+
+
+def saturate(x, width):
+    """Saturate to `width` bits signed"""
+    return np.clip(x, -(1 << width - 1), (1 << width - 1) - 1)
+
+
+def round_down(x, shift):
+    """Round half down right shift"""
+    return (x + (1 << shift - 1) - 1) >> shift
+
+
+def mac_sym_fir(x, coeff, width_d, width_coef):
+    """Model of `MAC_SYM_FIR` and `par_fir.PAR_SYM_FIR`"""
+    y = np.convolve(x, coeff)[: len(x)]
+    return wrap(round_down(y, width_coef), width_d)
+
+
+def mac_hbf_upsampler(x, coeff, width_d, width_coef):
+    """Model of `MAC_HBF_Upsampler` and `par_fir.PAR_HBF_Upsampler`.
+
+    The computed sample (from the even taps) precedes the trivial sample
+    (the delayed input passed through the center tap) of each input sample.
+    """
+    n = (len(coeff) + 1) // 4
+    y = np.empty(2 * len(x), np.int64)
+    y[::2] = mac_sym_fir(x, coeff[::2], width_d, width_coef)
+    y[1::2] = np.concatenate([np.zeros(n - 1, np.int64), x[: len(x) - n + 1]])
+    return y
+
+
+def cic_interpolator(x, n, r):
+    """Model of `cic.CICInterpolator` (gain `r**(n - 1)`)"""
+    x = np.asarray(x)
+    h = np.ones(1, np.int64)
+    for _ in range(n):
+        h = np.convolve(h, np.ones(r, np.int64))
+    y = np.empty(r * len(x), np.result_type(x, h))
+    for i in range(r):
+        y[i::r] = np.convolve(x, h[i::r])[: len(x)]
+    return y
+
+
+class InterpolateChannelModel:
+    """Bit-exact model of `interpolate.InterpolateChannel`.
+
+    Processes a sequence of 14 bit input samples into the sequence of 16 bit
+    output samples (`data0`, `data1`, ...) at `ratio` (10, 20, 40) times
+    the input rate starting from zero filter state.
+
+    `h_fir`, `h_hbf0`, and `h_hbf1` are the full impulse responses of
+    ciccomp, hbf0 and hbf1 with `width_fir` and `width_hbf` bit fixed
+    point coefficients. `width_d` is the MAC filter data width,
+    `width_cic` the CIC input width and `headroom` the number of bits
+    reserved for FIR overshoot. The defaults are those of the gateware,
+    other widths model design alternatives (see `wordlength.py`).
+    """
+
+    def __init__(
+        self,
+        h_fir=h_fir,
+        h_hbf0=h_hbf0,
+        h_hbf1=h_hbf1,
+        ratio=20,
+        width_d=24,
+        width_fir=16,
+        width_hbf=17,
+        width_cic=16,
+        headroom=1,
+    ):
+        assert ratio in (10, 20, 40)
+        self.h_fir = h_fir
+        self.h_hbf0 = h_hbf0
+        self.h_hbf1 = h_hbf1
+        self.width_in = 14
+        self.width_out = 16
+        self.width_d = width_d
+        self.width_fir = width_fir
+        self.width_hbf = width_hbf
+        self.width_cic = width_cic
+        self.cic_n = 5
+        # 10x: hbf0 bypassed, 40x: cic r=10
+        self.bypass = ratio == 10
+        self.cic_r = 10 if ratio == 40 else 5
+        self.ratio = ratio
+        # see `InterpolateChannel`
+        self.scale_in = self.width_d - self.width_in - headroom
+        self.scale_out = self.width_d - self.width_cic - headroom
+        self.scale_cic = (13 if ratio == 40 else 9) + width_cic - self.width_out
+
+    def ciccomp(self, x):
+        return mac_sym_fir(x, self.h_fir, self.width_d, self.width_fir)
+
+    def hbf0(self, x):
+        return mac_hbf_upsampler(x, self.h_hbf0, self.width_d, self.width_hbf)
+
+    def hbf1(self, x):
+        return mac_hbf_upsampler(x, self.h_hbf1, self.width_d, self.width_hbf)
+
+    def cic(self, x):
+        return cic_interpolator(x, self.cic_n, self.cic_r)
+
+    def __call__(self, x):
+        x = np.asarray(x, np.int64)
+        assert np.all(wrap(x, self.width_in) == x)
+        x = self.ciccomp(x << self.scale_in)
+        if not self.bypass:
+            x = self.hbf0(x)
+        x = self.hbf1(x)
+        x = saturate(round_down(x, self.scale_out), self.width_cic)
+        x = self.cic(x)
+        return saturate(round_down(x, self.scale_cic), self.width_out)
+
+    def coeff(self):
+        """Unique taps as loaded into `InterpolateChannel.coeff`"""
+        return (
+            list(self.h_fir[: (len(self.h_fir) + 1) // 2])
+            + list(self.h_hbf0[: (len(self.h_hbf0) + 1) // 2 : 2])
+            + list(self.h_hbf1[: (len(self.h_hbf1) + 1) // 2 : 2])
+        )
@@ -107,26 +107,253 @@ class Slipper(Module):
     Verifies `width` equal bits per cycle.
     If not, asserts bitslip and enforces latency blocking.
     Use bit index `width//2` as data.
+
+    With `one_shot`, the number of slips required to move the sample
+    transition out of the verified bits is computed from the position of
+    the transition and the slips are issued back-to-back (every other
+    cycle) before a single latency blocking. The slip count is chosen to
+    be correct for either slip direction (for the 4x oversampling
+    ISERDES in DDR mode the direction alternates/depends on the
+    primitive's bit order). If no such count exists, the slips assume
+    the transition moves towards the MSB. If the pattern is not valid
+    after the slips, the procedure is repeated.
+
+    `lock_time` is the number of cycles without `valid` before the
+    last (re-)lock (saturating).
     """
 
-    def __init__(self, width):
+    def __init__(self, width, one_shot=False):
         self.data = Signal(width)
         self.valid = Signal()
         self.bitslip = Signal()
+        self.lock_time = Signal(8, reset_less=True)
 
         good = Signal()
         pending = Signal(3, reset_less=True)
         self.comb += [
             # serdes sample match
             good.eq(self.data == Replicate(self.data[0], width)),
-            self.bitslip.eq(pending[0]),
-            # match and slip done
-            self.valid.eq(good & (pending == 0)),
         ]
+        if not one_shot:
+            self.comb += [
+                self.bitslip.eq(pending[0]),
+                # match and slip done
+                self.valid.eq(good & (pending == 0)),
+            ]
+            self.sync += [
+                pending.eq(Cat(~good & (pending == 0), pending)),
+            ]
+        else:
+            # slips to move the latest transition out of the verified bits
+            n_serde = width + 1
+            n_slips = Signal(max=n_serde)
+            for i in reversed(range(width - 1)):
+                for k in range(1, n_serde):
+                    if all((i + d) % n_serde >= width - 1 for d in (k, -k)):
+                        break
+                else:
+                    k = width - 1 - i
+                self.comb += If(
+                    self.data[i] != self.data[i + 1],
+                    n_slips.eq(k),
+                )
+            slips = Signal(max=n_serde, reset_less=True)
+            gap = Signal(reset_less=True)
+            self.comb += [
+                self.bitslip.eq((slips != 0) & ~gap),
+                # match and slips done
+                self.valid.eq(good & (slips == 0) & (pending == 0)),
+            ]
+            self.sync += [
+                gap.eq(self.bitslip),
+                pending.eq(pending[1:]),
+                If(
+                    self.bitslip,
+                    slips.eq(slips - 1),
+                    pending.eq(0b11),
+                ),
+                If(
+                    ~good & (slips == 0) & (pending == 0),
+                    slips.eq(n_slips),
+                ),
+            ]
+
+        t_lock = Signal.like(self.lock_time)
+        self.sync += [
+            If(
+                self.valid,
+                t_lock.eq(0),
+                If(
+                    t_lock != 0,
+                    self.lock_time.eq(t_lock),
+                ),
+            ).Elif(
+                t_lock != (1 << len(t_lock)) - 1,
+                t_lock.eq(t_lock + 1),
+            ),
+        ]
+
+
+class EyeScan(Module):
+    """Clock lane IDELAY eye scan and centering.
+
+    Steps the IDELAY through all `n_taps` taps (`ce`, wrapping around),
+    lets the link settle for `t_settle` cycles and then checks the clock
+    lane for `t_dwell` cycles at each tap. A tap is open if `valid` (from
+    `Slipper`) stays asserted and `clk_stb` (from `Unframer`) occurs exactly
+    every `t_clk` cycles. Then moves to the center of the widest run of
+    open taps. The taps are a ring (the IDELAY wraps around): a run may
+    continue from the last tap to the first.
+
+    Runs after reset and on `start`.
+    """
+
+    def __init__(self, t_clk, n_taps=32, t_settle=64, t_dwell=1024):
+        self.start = Signal()  # restart scan
+        self.valid = Signal()  # serdes sample match and slip done
+        self.clk_stb = Signal()  # clock pattern match
+        self.tap = Signal(max=n_taps)  # current delay tap (CNTVALUEOUT)
+        self.ce = Signal()  # increment delay tap
+        self.done = Signal()
+        # open taps
+        self.eye = Signal(n_taps)
+        # first tap and number of taps of the widest open eye
+        self.eye_start = Signal(max=n_taps, reset_less=True)
+        self.eye_width = Signal(max=n_taps + 1, reset_less=True)
+
+        ###
+
+        # cycles since the last clock pattern match, saturating
+        t = Signal(max=t_clk + 1, reset_less=True)
+        err = Signal()
+        self.sync += [
+            If(
+                self.clk_stb,
+                t.eq(0),
+            ).Elif(
+                t != t_clk,
+                t.eq(t + 1),
+            ),
+        ]
+        self.comb += [
+            err.eq(~self.valid | (self.clk_stb & (t != t_clk - 1)) | (t == t_clk)),
+        ]
+
+        count = Signal(max=max(t_settle, t_dwell), reset_less=True)
+        count_load = Signal.like(count)
+        load = Signal()
+        count_done = Signal()
+        self.comb += count_done.eq(count == 0)
         self.sync += [
-            pending.eq(Cat(~good & (pending == 0), pending)),
+            count.eq(count - 1),
+            If(
+                load,
+                count.eq(count_load),
+            ),
         ]
 
+        eye = [Signal(reset_less=True) for _ in range(n_taps)]
+        self.comb += self.eye.eq(Cat(eye))
+        is_open = Signal(reset_less=True)
+        record = Signal()
+        self.sync += If(record, Array(eye)[self.tap].eq(is_open))
+
+        # taps scanned, the evaluation goes around the ring almost twice
+        step = Signal(max=2 * n_taps, reset_less=True)
+        run = Signal(max=2 * n_taps, reset_less=True)  # current run of open taps
+        run_start = Signal(max=2 * n_taps)
+        center_sum = Signal(max=2 * n_taps)
+        center = Signal(max=n_taps)
+        self.comb += [
+            run_start.eq(step - run),
+            center_sum.eq(self.eye_start + ((self.eye_width - 1) >> 1)),
+            center.eq(center_sum),
+            If(center_sum >= n_taps, center.eq(center_sum - n_taps)),
+        ]
+
+        self.submodules.fsm = fsm = FSM("START")
+        fsm.act(
+            "START",
+            NextValue(step, 0),
+            load.eq(1),
+            count_load.eq(t_settle - 1),
+            NextState("SETTLE"),
+        )
+        fsm.act(
+            "SETTLE",
+            NextValue(is_open, 1),
+            If(
+                count_done,
+                load.eq(1),
+                count_load.eq(t_dwell - 1),
+                NextState("DWELL"),
+            ),
+        )
+        fsm.act(
+            "DWELL",
+            If(err, NextValue(is_open, 0)),
+            If(count_done, NextState("RECORD")),
+        )
+        fsm.act(
+            "RECORD",
+            record.eq(1),
+            # back to the initial tap after the last one
+            self.ce.eq(1),
+            load.eq(1),
+            count_load.eq(t_settle - 1),
+            NextValue(step, step + 1),
+            If(
+                step == n_taps - 1,
+                NextValue(step, 0),
+                NextValue(run, 0),
+                NextValue(self.eye_width, 0),
+                NextState("EVAL"),
+            ).Else(
+                NextState("SETTLE"),
+            ),
+        )
+        fsm.act(
+            "EVAL",
+            NextValue(step, step + 1),
+            If(
+                Array(eye + eye)[step],
+                NextValue(run, run + 1),
+                If(
+                    (run + 1 > self.eye_width) & (run + 1 <= n_taps),
+                    NextValue(self.eye_width, run + 1),
+                    NextValue(self.eye_start, run_start),
+                    If(
+                        run_start >= n_taps,
+                        NextValue(self.eye_start, run_start - n_taps),
+                    ),
+                ),
+            ).Else(
+                NextValue(run, 0),
+            ),
+            If(step == 2 * n_taps - 2, NextState("SEEK")),
+        )
+        fsm.act(
+            "SEEK",
+            If(
+                (self.eye_width == 0) | (self.tap == center),
+                NextState("DONE"),
+            ).Else(
+                self.ce.eq(1),
+                load.eq(1),
+                count_load.eq(3),
+                NextState("WAIT"),
+            ),
+        )
+        fsm.act(
+            "WAIT",  # CNTVALUEOUT update
+            If(count_done, NextState("SEEK")),
+        )
+        fsm.act(
+            "DONE",
+            self.done.eq(1),
+            If(self.start, NextState("START")),
+        )
+
 
 class Unframer(Module):
     """Unframes the clk, marker, and data bit streams into a framed multibit
@@ -261,17 +488,61 @@ class Checker(Module):
         ]
 
 
+class Responder(Module):
+    """Full rate response.
+
+    Sends the `width` bit response `data` (latched on `stb`) using all
+    `n_serde` bits per cycle on `miso` (`miso[0]` is sent first):
+    a start marker (1), `data` MSB first, an `n_crc` bit CRC over `data`
+    (MSB first, zero initial value), then zeros.
+    """
+
+    def __init__(self, width, n_serde=4, n_crc=8, poly=0x07):
+        self.data = Signal(width)
+        self.stb = Signal()
+        self.miso = Signal(n_serde)
+
+        n = 1 + width + n_crc
+        n_sr = -(-n // n_serde) * n_serde
+        data = Signal(width, reset_less=True)
+        load = Signal(reset_less=True)
+        sr = Signal(n_sr, reset_less=True)
+        self.submodules.crc = LiteEthMACCRCEngine(
+            data_width=width, width=n_crc, polynom=poly
+        )
+        self.comb += [
+            # LiteEthMACCRCEngine takes LSB first
+            self.crc.data.eq(data[::-1]),
+            self.crc.last.eq(0),
+            self.miso.eq(Cat(reversed(sr[-n_serde:]))),
+        ]
+        self.sync += [
+            load.eq(self.stb),
+            If(
+                self.stb,
+                data.eq(self.data),
+            ),
+            sr.eq(Cat(Replicate(0, n_serde), sr)),
+            If(
+                load,
+                sr.eq(Cat(self.crc.next, data, 1) << n_sr - n),
+            ),
+        ]
+
+
 class Link(Module):
     """Kasli-Phaser link implementation
 
     * Like the Fastino link but with 8 bits per clock cycle
     * 1 clock lane, 6 phaser input data lanes, 1 phaser output data lane
+    * `response_fast` selects the full rate `Responder` with `n_response`
+      bits per frame on the output lane instead of the `Checker` response
     """
 
-    def __init__(self, eem):
+    def __init__(self, eem, n_response=8 * 16):
         self.submodules.phy = Phy(eem)
         n_serde = len(self.phy.data[0])
-        self.submodules.slip = Slipper(n_serde - 1)
+        self.submodules.slip = Slipper(n_serde - 1, one_shot=True)
         self.comb += [
             self.slip.data.eq(self.phy.data[0]),  # clk
             self.phy.bitslip.eq(self.slip.bitslip),
@@ -281,12 +552,28 @@ class Link(Module):
             self.unframe.data_in_stb.eq(self.slip.valid),
             self.unframe.data_in.eq(Cat([d[n_serde // 2 - 1] for d in self.phy.data])),
         ]
+        self.submodules.eye = EyeScan(t_clk=8)
+        self.comb += [
+            self.eye.valid.eq(self.slip.valid),
+            self.eye.clk_stb.eq(self.unframe.clk_stb),
+            self.eye.tap.eq(self.phy.cnt_out),
+            self.phy.ce.eq(self.eye.ce),
+        ]
         self.submodules.checker = Checker(n_data=6, n_frame=10, t_clk=8)
         self.comb += [
             self.checker.data.eq(self.unframe.data_out),
             self.checker.data_stb.eq(self.unframe.data_out_stb),
             self.checker.end_of_frame.eq(self.unframe.end_of_frame),
-            self.phy.miso.eq(Replicate(self.checker.miso, n_serde)),
+        ]
+        self.response_fast = Signal()
+        self.submodules.responder = Responder(n_response, n_serde=n_serde)
+        self.comb += [
+            If(
+                self.response_fast,
+                self.phy.miso.eq(self.responder.miso),
+            ).Else(
+                self.phy.miso.eq(Replicate(self.checker.miso, n_serde)),
+            ),
         ]
 
 
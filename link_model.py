@@ -0,0 +1,256 @@
+import numpy as np
+
+
+class LinkModel:
+    """Vectorized bit-exact model of the Kasli-Phaser link framing.
+
+    Mirrors `link.Unframer` and `link.Checker`: one lane word per link
+    cycle (bit 0: clock lane, bits 1 to `n_data - 1`: data lanes), `t_clk`
+    cycles per clock pattern (`0000 1111`), `n_frame` clock patterns per
+    frame, `n_marker` marker bits on the first data lane at the end of the
+    clock patterns and an `n_crc` bit CRC in the last word of the frame.
+
+    Frames are handled as `(n, n_bytes)` arrays of `uint8`, the little
+    endian bytes of the `Checker.frame` value (the LSB is transmitted last).
+    Lane words are handled as `(n, n_words)` arrays of `uint8` in
+    transmission order as fed to `Unframer.data_in`.
+
+    * `n_data`: number of clk+data lanes
+    * `t_clk` is the clock pattern length
+    * `n_frame` clock cycles per frame
+    """
+
+    def __init__(self, n_data=7, t_clk=8, n_frame=10):
+        self.n_data = n_data
+        self.t_clk = t_clk
+        self.n_frame = n_frame
+        self.n_marker = n_frame // 2 + 1
+        self.n_crc = n_data - 1
+        self.n_word = self.n_crc * t_clk  # data bits per clock pattern
+        self.n_words = n_frame * t_clk  # lane words per frame
+        self.n_bits = self.n_word * n_frame - self.n_marker - self.n_crc
+        self.n_bytes = (self.n_bits + 7) // 8
+        self.poly = {
+            # 6: 0x27,  # CRC-6-CDMA2000-A
+            6: 0x2F,  # CRC-6-GSM
+        }[self.n_crc]
+        # the bit packing below works on 48 bit clock patterns
+        assert (self.n_crc, t_clk) == (6, 8)
+        self.clk = np.array(
+            [int(j >= t_clk // 2) for j in range(t_clk)] * n_frame, np.uint8
+        )
+
+        # `Checker.frame_buf` is the concatenation of the data lane words,
+        # latest word in the LSBs. The frame is `frame_buf` without the CRC
+        # (lowest word) and without the marker bits (the first data lane bit
+        # of the last word of the clock patterns carrying a marker).
+        # Each clock pattern maps to a contiguous slice of the frame:
+        # (frame bit offset, clock pattern bit offset, marker)
+        self._layout = []
+        start = 0
+        for i in range(n_frame):
+            if i == 0:
+                offset, marker = self.n_crc, None
+            elif i < self.n_marker + 1:
+                offset, marker = 1, int(i == 1)
+            else:
+                offset, marker = 0, None
+            self._layout.append((start, offset, marker))
+            start += self.n_word - offset
+        assert start == self.n_bits
+        self._crc_tables()
+
+    def crc_step(self, crc, data):
+        """Scalar reference of `LiteEthMACCRCEngine` as used in `Checker`:
+        process one data lane word (LSB is the first data lane), MSB first.
+        """
+        mask = (1 << self.n_crc) - 1
+        for i in reversed(range(self.n_crc)):
+            feedback = ((crc >> self.n_crc - 1) ^ (data >> i)) & 1
+            crc = (crc << 1) & mask
+            if feedback:
+                crc ^= self.poly
+        return crc
+
+    def _crc_tables(self):
+        # The CRC is linear and starts at zero for each frame. Tabulate
+        # the contribution of each byte value in each byte of each clock
+        # pattern to the CRC residue at the end of the frame.
+        n_bit = self.n_words * self.n_crc
+        basis = np.zeros(n_bit, np.uint8)
+        for k in range(n_bit):
+            word, bit = divmod(k, self.n_crc)
+            crc = self.crc_step(0, 1 << bit)
+            for _ in range(word):
+                crc = self.crc_step(crc, 0)
+            basis[k] = crc
+        basis = basis.reshape(-1, 8)
+        self._crc_table = np.zeros((len(basis), 256), np.uint8)
+        for v in range(256):
+            for j in range(8):
+                if (v >> j) & 1:
+                    self._crc_table[:, v] ^= basis[:, j]
+        # value of the CRC lane word that cancels a given residue
+        last = self._crc_table[0, : 1 << self.n_crc]
+        assert len(set(last.tolist())) == len(last)
+        self._crc_inv = np.argsort(last).astype(np.uint8)
+
+    def _words_to_bytes(self, words):
+        # (n, n_words) lane words to (n_frame*6, n) clock pattern bytes
+        d = (words[:, ::-1] >> 1).T.reshape(self.n_frame * 2, 4, -1)
+        d &= 0x3F
+        b = np.empty((self.n_frame * 2, 3, d.shape[-1]), np.uint8)
+        b[:, 0] = d[:, 0] | (d[:, 1] << 6)
+        b[:, 1] = (d[:, 1] >> 2) | (d[:, 2] << 4)
+        b[:, 2] = (d[:, 2] >> 4) | (d[:, 3] << 2)
+        return b.reshape(self.n_frame * 6, -1)
+
+    def _bytes_to_words(self, b):
+        # (n_frame*6, n) clock pattern bytes to (n, n_words) lane words
+        b = b.reshape(self.n_frame * 2, 3, -1)
+        d = np.empty((self.n_frame * 2, 4, b.shape[-1]), np.uint8)
+        d[:, 0] = b[:, 0] << 1
+        d[:, 1] = (b[:, 0] >> 5) | (b[:, 1] << 3)
+        d[:, 2] = (b[:, 1] >> 3) | (b[:, 2] << 5)
+        d[:, 3] = b[:, 2] >> 1
+        d &= 0x7E
+        return d.reshape(self.n_words, -1).T[:, ::-1] | self.clk
+
+    def _crc(self, b):
+        crc = np.zeros(b.shape[-1], np.uint8)
+        for table, bi in zip(self._crc_table, b):
+            crc ^= table.take(bi)
+        return crc
+
+    def crc(self, words):
+        """CRC residue (`Checker.crc.next` at the end of the frame) of
+        `(n, n_words)` lane words. Zero for a good frame."""
+        return self._crc(self._words_to_bytes(np.asarray(words, np.uint8)))
+
+    def encode(self, frames):
+        """Encode `(n, n_bytes)` frames into `(n, n_words)` lane words
+        including clock pattern, marker and CRC."""
+        frames = np.asarray(frames, np.uint8)
+        n = frames.shape[0]
+        # (n_limbs, n) little endian 64 bit limbs of the frame
+        buf = np.zeros((n, 8 * ((self.n_bits + 63) // 64 + 1)), np.uint8)
+        buf[:, : self.n_bytes] = frames
+        limbs = np.ascontiguousarray(buf.view("<u8").T)
+        pattern = np.empty((self.n_frame, n), "<u8")
+        for p, (start, offset, marker) in zip(pattern, self._layout):
+            k, s = divmod(start, 64)
+            p[:] = limbs[k] >> np.uint64(s)
+            if s:
+                p |= limbs[k + 1] << np.uint64(64 - s)
+            p &= np.uint64((1 << self.n_word - offset) - 1)
+            p <<= np.uint64(offset)
+            if marker:
+                p |= np.uint64(marker)
+        b = np.ascontiguousarray(
+            pattern.view(np.uint8)
+            .reshape(self.n_frame, n, 8)[:, :, :6]
+            .transpose(0, 2, 1)
+        ).reshape(self.n_frame * 6, n)
+        b[0] |= self._crc_inv[self._crc(b)]
+        return self._bytes_to_words(b)
+
+    def decode(self, words):
+        """Decode `(n, n_words)` lane words into `(n, n_bytes)` frames.
+
+        Returns the frames and a boolean array that is true for frames
+        with correct clock pattern, marker and CRC (`Checker.frame_stb`).
+        """
+        words = np.asarray(words, np.uint8)
+        n = words.shape[0]
+        b = self._words_to_bytes(words)
+        good = self._crc(b) == 0
+        good &= np.all(words & 1 == self.clk, axis=1)
+        buf = np.zeros((self.n_frame, n, 8), np.uint8)
+        buf[:, :, :6] = b.reshape(self.n_frame, 6, n).transpose(0, 2, 1)
+        pattern = buf.view("<u8").reshape(self.n_frame, n)
+        limbs = np.zeros(((self.n_bits + 63) // 64 + 1, n), np.uint64)
+        for p, (start, offset, marker) in zip(pattern, self._layout):
+            if marker is not None:
+                good &= (p & np.uint64(1)) == marker
+            p >>= np.uint64(offset)
+            k, s = divmod(start, 64)
+            limbs[k] |= p << np.uint64(s)
+            if s:
+                limbs[k + 1] |= p >> np.uint64(64 - s)
+        frames = np.ascontiguousarray(limbs.T).view(np.uint8)
+        return frames[:, : self.n_bytes], good
+
+    def from_int(self, frames):
+        """Convert a sequence of integer frames (`Checker.frame`) to
+        `(n, n_bytes)` frames."""
+        return np.frombuffer(
+            b"".join(int(f).to_bytes(self.n_bytes, "little") for f in frames),
+            np.uint8,
+        ).reshape(-1, self.n_bytes)
+
+    def to_int(self, frames):
+        """Convert `(n, n_bytes)` frames to a list of integer frames."""
+        return [int.from_bytes(f.tobytes(), "little") for f in frames]
+
+
+class ResponseModel:
+    """Vectorized bit-exact model of the full rate `link.Responder`.
+
+    Responses are handled as `(n, width // 8)` arrays of `uint8` (big
+    endian, the first register read is the first byte). MISO words are
+    handled as `(n, n_cycles)` arrays of `uint8` with `n_serde` bits per
+    link cycle, bit 0 sent first.
+    """
+
+    def __init__(self, width=8 * 16, n_serde=4, n_crc=8, poly=0x07):
+        assert width % 8 == 0
+        self.width = width
+        self.n_serde = n_serde
+        self.n_crc = n_crc
+        self.poly = poly
+        self.n_bits = 1 + width + n_crc
+        self.n_cycles = -(-self.n_bits // n_serde)
+
+    def crc(self, bits):
+        """CRC of `(n, m)` bits (MSB first). Zero for data followed by its
+        CRC."""
+        bits = np.asarray(bits, np.uint8)
+        crc = np.zeros(bits.shape[0], np.uint32)
+        for b in bits.T:
+            feedback = (crc >> self.n_crc - 1) ^ b
+            crc = (crc << 1) & ((1 << self.n_crc) - 1)
+            crc ^= feedback * np.uint32(self.poly)
+        return crc
+
+    def encode(self, data):
+        """Encode `(n, width // 8)` response bytes into `(n, n_cycles)` MISO
+        words."""
+        data = np.unpackbits(np.asarray(data, np.uint8), axis=-1)
+        n = data.shape[0]
+        bits = np.zeros((n, self.n_cycles * self.n_serde), np.uint8)
+        bits[:, 0] = 1
+        bits[:, 1 : 1 + self.width] = data
+        crc = self.crc(data)
+        for i in range(self.n_crc):
+            bits[:, 1 + self.width + i] = (crc >> self.n_crc - 1 - i) & 1
+        bits = bits.reshape(n, self.n_cycles, self.n_serde)
+        return np.packbits(bits, axis=-1, bitorder="little")[:, :, 0]
+
+    def decode(self, words):
+        """Decode `(n, m)` MISO words starting at or before the start
+        marker into `(n, width // 8)` response bytes.
+
+        Returns the responses and a boolean array that is true for
+        responses with start marker and correct CRC.
+        """
+        words = np.asarray(words, np.uint8)
+        n = words.shape[0]
+        bits = np.unpackbits(words[:, :, None], axis=-1, bitorder="little")
+        bits = bits[:, :, : self.n_serde].reshape(n, -1)
+        good = bits.any(axis=1)
+        start = bits.argmax(axis=1)
+        bits = np.concatenate([bits, np.zeros((n, self.n_bits), np.uint8)], axis=1)
+        idx = start[:, None] + np.arange(1, self.n_bits)
+        payload = np.take_along_axis(bits, idx, axis=1)
+        good &= self.crc(payload) == 0
+        return np.packbits(payload[:, : self.width], axis=-1), good
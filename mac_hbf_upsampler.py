@@ -4,6 +4,8 @@ import numpy as np
 from migen import *
 from misoc.interconnect.stream import Endpoint
 
+from dsp import DSP
+
 
 class MAC_HBF_Upsampler(Module):
     """Multiply-accumulate half-band FIR interpolator.
@@ -19,17 +21,33 @@ class MAC_HBF_Upsampler(Module):
     :param width_d: Input/output data width
     :param width_coef: Coefficient width (fixed point position)
     :param dsp_arch: DSP block architecture (Xilinx/Lattice)
+    :param dsp_primitive: Instantiate the DSP48E1 primitive (Xilinx)
+    :param reload: Load the unique taps `coeff` at runtime on `coeff_stb`
+    :param dsp_pipelen: Pipeline depth from the operand muxes to the accumulator
+        (>= 3), may exceed the sample period
     """
 
-    def __init__(self, coeff, width_d, width_coef, dsp_arch="xilinx"):
+    def __init__(
+        self,
+        coeff,
+        width_d,
+        width_coef,
+        dsp_arch="xilinx",
+        reload=False,
+        dsp_primitive=False,
+        dsp_pipelen=4,
+    ):
 
         assert dsp_arch in ("xilinx", "lattice"), "unsupported dsp architecture"
         self.dsp_arch = dsp_arch
+        self.dsp_primitive = dsp_primitive
         n = (len(coeff) + 1) // 4
         if len(coeff) != n * 4 - 1:
             raise ValueError("HBF length must be 4*n-1", coeff)
         elif n < 2:
             raise ValueError("Need order n >= 2")
+        if dsp_pipelen < 3:
+            raise ValueError("DSP pipeline needs at least 3 stages", dsp_pipelen)
         for i, c in enumerate(coeff):
             if i == n * 2 - 1:
                 if not c:
@@ -42,7 +60,6 @@ class MAC_HBF_Upsampler(Module):
             elif c != coeff[-1 - i]:
                 raise ValueError("HBF must be symmetric", (i, c))
 
-        dsp_pipelen = 4
         bias = (1 << width_coef - 1) - 1
         coef = []
         for i, c in enumerate(coeff[: (len(coeff) + 1) // 2 : 2]):
@@ -65,7 +82,16 @@ class MAC_HBF_Upsampler(Module):
             )  # filter is sensitive to output and ignores input stb
         ]
 
-        a, b, c, d, mux_p, p = self._dsp()
+        a, b, c, d, mux_p, p = self._dsp(dsp_pipelen)
+
+        # sequencing at the end of the dsp pipe, modulo the sample period
+        pos_p = (dsp_pipelen - 2) % len(coef)  # restart accumulation
+        pos_out = (dsp_pipelen - 1) % len(coef)  # result at the end of the pipe
+        pos_triv = (dsp_pipelen - 1 + len(coef) // 2) % len(coef)
+        # input samples shifted in since the trivial sample was at the center
+        shift_triv = (dsp_pipelen - 1 + len(coef) // 2) // len(coef)
+        if shift_triv >= len(coef):
+            raise ValueError("DSP pipeline too long", dsp_pipelen)
 
         self.comb += [
             pos_neg.eq(
@@ -78,9 +104,9 @@ class MAC_HBF_Upsampler(Module):
         ]
 
         self.sync += [
+            self.input.ack.eq(0),  # default no in ack, also while stalled
             If(
                 ~self.stop,
-                self.input.ack.eq(0),  # default no in ack
                 self.output.stb.eq(0),  # default no out strobe
                 mux_p.eq(0),  # default accumulate
                 pos.eq(pos + 1),
@@ -91,70 +117,59 @@ class MAC_HBF_Upsampler(Module):
                     self.input.ack.eq(1),
                 ),
                 If(
-                    pos == dsp_pipelen - 2,
+                    pos == pos_p,
                     mux_p.eq(1),
                 ),
                 If(
-                    pos
-                    == dsp_pipelen - 1,  # new output sample at the end of the dsp pipe
+                    pos == pos_out,  # new output sample at the end of the dsp pipe
                     self.output.data.eq(p >> width_coef),
                     self.output.stb.eq(1),
                 ),
                 If(
-                    pos
-                    == (len(coef) // 2)
-                    + dsp_pipelen
-                    - 1,  # emit trivial sample at halfway computation + pipelen
-                    self.output.data.eq(x[len(coef)]),
+                    pos == pos_triv,  # trivial sample, halfway between outputs
+                    self.output.data.eq(x[len(coef) + shift_triv]),
                     self.output.stb.eq(1),
                 ),
-            )
+            ),
         ]
 
-        if dsp_pipelen > (len(coef) // 2):  # if dsp pipe too long
+        # runtime coefficients, applied at the next sample boundary
+        self.coeff = [Signal.like(c) for c in coef]
+        self.coeff_stb = Signal()
+        if reload:
+            coeff_pending = Signal()
             self.sync += [
                 If(
-                    pos == ((len(coef) // 2) + dsp_pipelen - 1) % (len(coef) // 2),
-                    # emit trivial sample at halfway computation + pipelen
-                    self.output.data.eq(x[len(coef) + 1]),
-                    self.output.stb.eq(1),
-                )
+                    ~self.stop & (pos == len(coef) - 1) & coeff_pending,
+                    Cat(coef).eq(Cat(self.coeff)),
+                    coeff_pending.eq(0),
+                ),
+                If(
+                    self.coeff_stb,
+                    coeff_pending.eq(1),
+                ),
             ]
 
-    def _dsp(self):
-        """Fully pipelined DSP block mockup."""
-
-        if self.dsp_arch == "lattice":
-            a = Signal((18, True), reset_less=True)
-            b = Signal((18, True), reset_less=True)
-            c = Signal((36, True), reset_less=True)
-            d = Signal((18, True), reset_less=True)
-            ad = Signal((18, True), reset_less=True)
-            m = Signal((36, True), reset_less=True)
-            p = Signal((36, True), reset_less=True)
-        else:  # xilinx dsp arch
-            a = Signal((30, True), reset_less=True)
-            b = Signal((18, True), reset_less=True)
-            c = Signal((48, True), reset_less=True)
-            d = Signal((25, True), reset_less=True)
-            ad = Signal((25, True), reset_less=True)
-            m = Signal((48, True), reset_less=True)
-            p = Signal((48, True), reset_less=True)
+    def _dsp(self, dsp_pipelen):
+        """Fully pipelined DSP block.
 
+        The DSP block registers the operands up to once, further stages
+        register the operand mux outputs to ease timing."""
+        self.submodules.dsp = dsp = DSP(
+            arch=self.dsp_arch,
+            areg=min(1, dsp_pipelen - 3),
+            primitive=self.dsp_primitive,
+        )
         mux_p = Signal()  # accumulator mux
-        a_reg = Signal.like(a)
-        d_reg = Signal.like(d)
-        b_reg = [Signal.like(b) for _ in range(2)]
-
-        self.sync += [
-            If(
-                ~self.stop,
-                a_reg.eq(a),
-                Cat(b_reg).eq(Cat(b, b_reg)),
-                d_reg.eq(d),
-                ad.eq(a_reg + d_reg),
-                m.eq(ad * b_reg[-1]),  # b is double piped to be in line with a+d
-                If(~mux_p, p.eq(p + m)).Else(p.eq(m + c)),
-            )
+        a, b, d = Signal.like(dsp.a), Signal.like(dsp.b), Signal.like(dsp.d)
+        ops = [a, b, d]
+        for _ in range(dsp_pipelen - dsp.latency):
+            ops_reg = [Signal.like(op) for op in ops]
+            self.sync += If(~self.stop, Cat(ops_reg).eq(Cat(ops)))
+            ops = ops_reg
+        self.comb += [
+            dsp.ce.eq(~self.stop),
+            dsp.load.eq(mux_p),
+            Cat(dsp.a, dsp.b, dsp.d).eq(Cat(ops)),
         ]
-        return a, b, c, d, mux_p, p
+        return a, b, dsp.c, d, mux_p, dsp.p
@@ -1,9 +1,14 @@
 # SingularitySurfer 2020
 
+from functools import reduce
+from operator import or_
+
 import numpy as np
 from migen import *
 from misoc.interconnect.stream import Endpoint
 
+from dsp import DSP
+
 
 class MAC_SYM_FIR(Module):
     """Symmetric multiply-accumulate FIR filter.
@@ -14,21 +19,45 @@ class MAC_SYM_FIR(Module):
     The input strobe is ignored and the filter always uses the currently available data.
     Rounding is round half down.
 
+    With `n_lanes > 1` the DSP block is time-multiplexed between independent lanes
+    (`inputs`, `outputs`) with their own sample shift registers. All lanes sample
+    their inputs at the same time, they are processed round-robin and the filter
+    only stalls if a lane output is about to be overwritten before it has been
+    acknowledged.
+
     :param coeff: Filter coeffiecient list (full impulse response including center and zeros)
     :param width_d: Input/output data width
     :param width_coef: Coefficient width (fixed point position)
     :param dsp_arch: DSP block architecture (Xilinx/Lattice)
+    :param dsp_primitive: Instantiate the DSP48E1 primitive (Xilinx)
+    :param reload: Load the unique taps `coeff` at runtime on `coeff_stb`
+    :param n_lanes: Number of lanes sharing the DSP block
+    :param dsp_pipelen: Pipeline depth from the operand muxes to the accumulator
+        (>= 3), may exceed the sample period
     """
 
-    def __init__(self, coeff, width_d, width_coef, dsp_arch="xilinx"):
+    def __init__(
+        self,
+        coeff,
+        width_d,
+        width_coef,
+        dsp_arch="xilinx",
+        n_lanes=1,
+        reload=False,
+        dsp_primitive=False,
+        dsp_pipelen=4,
+    ):
 
         assert dsp_arch in ("xilinx", "lattice"), "unsupported dsp architecture"
         self.dsp_arch = dsp_arch
+        self.dsp_primitive = dsp_primitive
         n = (len(coeff) + 1) // 2
         if len(coeff) != n * 2 - 1:
             raise ValueError("FIR length must be 2*n-1", coeff)
         elif n < 2:
             raise ValueError("Need order n >= 2")
+        if dsp_pipelen < 3:
+            raise ValueError("DSP pipeline needs at least 3 stages", dsp_pipelen)
         for i, c in enumerate(coeff):
             if i == n * 2 - 1:
                 if not c:
@@ -38,38 +67,65 @@ class MAC_SYM_FIR(Module):
             elif c != coeff[-1 - i]:
                 raise ValueError("FIR must be symmetric", (i, c))
 
-        dsp_pipelen = 4
         bias = (1 << width_coef - 1) - 1
         coef = []
         for i, c in enumerate(coeff[: (len(coeff) + 1) // 2]):
             coef.append(Signal((width_coef + 1, True), reset_less=True, reset=c))
 
-        self.input = Endpoint([("data", (width_d, True))])
-        self.output = Endpoint([("data", (width_d, True))])
+        self.inputs = [Endpoint([("data", (width_d, True))]) for _ in range(n_lanes)]
+        self.outputs = [Endpoint([("data", (width_d, True))]) for _ in range(n_lanes)]
+        self.input, self.output = self.inputs[0], self.outputs[0]
 
         x = [
-            Signal((width_d, True), reset_less=True) for _ in range((len(coef) * 2) - 1)
+            [
+                Signal((width_d, True), reset_less=True)
+                for _ in range((len(coef) * 2) - 1)
+            ]
+            for _ in range(n_lanes)
         ]  # input hbf
 
         self.stop = Signal()  # filter output stall signal
         pos = Signal(int(np.ceil(np.log2(len(coef)))))
         pos_neg = Signal(len(pos) + 1)
-
-        self.comb += [
-            self.stop.eq(
-                self.output.stb & ~self.output.ack
-            )  # filter is sensitive to output and ignores input stb
-        ]
-
-        a, b, c, d, mux_p, p = self._dsp()
-
+        lane = Signal(max=max(2, n_lanes))  # lane being computed
+        # lane whose output is written at the end of the dsp pipe
+        lane_out = Signal.like(lane)
+        # sequencing at the end of the dsp pipe, modulo the sample period
+        pos_p = (dsp_pipelen - 2) % len(coef)  # restart accumulation
+        pos_out = (dsp_pipelen - 1) % len(coef)  # result at the end of the pipe
+        lane_delay = 1 + (dsp_pipelen - 1) // len(coef)
+
+        if n_lanes == 1:
+            self.comb += [
+                self.stop.eq(
+                    self.output.stb & ~self.output.ack
+                )  # filter is sensitive to output and ignores input stb
+            ]
+        else:
+            self.comb += [
+                lane_out.eq(
+                    Array((i - lane_delay) % n_lanes for i in range(n_lanes))[lane]
+                ),
+                self.stop.eq(
+                    (pos == pos_out)
+                    & (lane_out == n_lanes - 1)
+                    & reduce(or_, [o.stb & ~o.ack for o in self.outputs])
+                ),  # stall only if a lane output would be overwritten
+            ]
+
+        a, b, c, d, mux_p, p = self._dsp(dsp_pipelen)
+
+        if n_lanes == 1:
+            x_lane = Array(x[0])
+        else:
+            x_lane = Array(Array(xi) for xi in x)[lane]
         self.comb += [
             pos_neg.eq(
                 (len(coef) * 2) - 2 - pos
             ),  # position from end of input shift reg
             c.eq(bias),
-            a.eq(Array(x)[pos]),
-            d.eq(Array(x)[pos_neg]),
+            a.eq(x_lane[pos]),
+            d.eq(x_lane[pos_neg]),
             If(
                 pos == len(coef) - 1,
                 d.eq(0),  # inject zero sample so center tap is only multiplied once
@@ -77,67 +133,112 @@ class MAC_SYM_FIR(Module):
             b.eq(Array(coef)[pos]),
         ]
 
+        # all lanes sample their inputs together with lane 0 and
+        # output together with the last lane
+        x_in = [self.input.data] + [
+            Signal((width_d, True), reset_less=True) for _ in range(n_lanes - 1)
+        ]
+        y_out = [
+            Signal((width_d, True), reset_less=True) for _ in range(n_lanes - 1)
+        ] + [p >> width_coef]
+        for i, (xi, xi_in, yi_out, inp, out) in enumerate(
+            zip(x, x_in, y_out, self.inputs, self.outputs)
+        ):
+            self.sync += [
+                If(
+                    out.ack,
+                    out.stb.eq(0),  # default no out strobe
+                ),
+                inp.ack.eq(0),  # default no in ack, also while stalled
+                If(
+                    ~self.stop,
+                    If(
+                        (pos == len(coef) - 1) & (lane == 0),  # new input sample
+                        inp.ack.eq(1),
+                        xi_in.eq(inp.data) if i > 0 else [],
+                    ),
+                    If(
+                        (pos == len(coef) - 1) & (lane == i),
+                        Cat(xi).eq(Cat(xi_in, xi)),  # shift in new sample
+                    ),
+                    If(
+                        (pos == pos_out)
+                        & (lane_out == i),  # lane result at the end of the dsp pipe
+                        yi_out.eq(p >> width_coef) if i < n_lanes - 1 else [],
+                    ),
+                    If(
+                        (pos == pos_out)
+                        & (
+                            lane_out == n_lanes - 1
+                        ),  # new output sample at the end of the dsp pipe
+                        out.data.eq(yi_out),
+                        out.stb.eq(1),
+                    ),
+                ),
+            ]
+
         self.sync += [
             If(
                 ~self.stop,
-                self.input.ack.eq(0),  # default no in ack
-                self.output.stb.eq(0),  # default no out strobe
                 mux_p.eq(0),  # default accumulate
                 pos.eq(pos + 1),
                 If(
-                    pos == len(coef) - 1,  # new input sample
+                    pos == len(coef) - 1,  # next lane
                     pos.eq(0),
-                    Cat(x).eq(Cat(self.input.data, x)),  # shift in new sample
-                    self.input.ack.eq(1),
+                    If(
+                        lane == n_lanes - 1,
+                        lane.eq(0),
+                    ).Else(
+                        lane.eq(lane + 1),
+                    ),
                 ),
                 If(
-                    pos
-                    == dsp_pipelen - 2,  # new output sample at the end of the dsp pipe
+                    pos == pos_p,  # restart accumulation
                     mux_p.eq(1),
                 ),
-                If(
-                    pos
-                    == dsp_pipelen - 1,  # new output sample at the end of the dsp pipe
-                    self.output.data.eq(p >> width_coef),
-                    self.output.stb.eq(1),
-                ),
             )
         ]
 
-    def _dsp(self):
-        """Fully pipelined DSP block mockup."""
-
-        if self.dsp_arch == "lattice":
-            a = Signal((18, True), reset_less=True)
-            b = Signal((18, True), reset_less=True)
-            c = Signal((36, True), reset_less=True)
-            d = Signal((18, True), reset_less=True)
-            ad = Signal((18, True), reset_less=True)
-            m = Signal((36, True), reset_less=True)
-            p = Signal((36, True), reset_less=True)
-        else:  # xilinx dsp arch
-            a = Signal((30, True), reset_less=True)
-            b = Signal((18, True), reset_less=True)
-            c = Signal((48, True), reset_less=True)
-            d = Signal((25, True), reset_less=True)
-            ad = Signal((25, True), reset_less=True)
-            m = Signal((48, True), reset_less=True)
-            p = Signal((48, True), reset_less=True)
-
+        # runtime coefficients, applied at the next sample boundary
+        self.coeff = [Signal.like(c) for c in coef]
+        self.coeff_stb = Signal()
+        if reload:
+            coeff_pending = Signal()
+            self.sync += [
+                If(
+                    ~self.stop
+                    & (pos == len(coef) - 1)
+                    & (lane == n_lanes - 1)
+                    & coeff_pending,
+                    Cat(coef).eq(Cat(self.coeff)),
+                    coeff_pending.eq(0),
+                ),
+                If(
+                    self.coeff_stb,
+                    coeff_pending.eq(1),
+                ),
+            ]
+
+    def _dsp(self, dsp_pipelen):
+        """Fully pipelined DSP block.
+
+        The DSP block registers the operands up to once, further stages
+        register the operand mux outputs to ease timing."""
+        self.submodules.dsp = dsp = DSP(
+            arch=self.dsp_arch,
+            areg=min(1, dsp_pipelen - 3),
+            primitive=self.dsp_primitive,
+        )
         mux_p = Signal()  # accumulator mux
-        a_reg = Signal.like(a)
-        d_reg = Signal.like(d)
-        b_reg = [Signal.like(b) for _ in range(2)]
-
-        self.sync += [
-            If(
-                ~self.stop,
-                a_reg.eq(a),
-                Cat(b_reg).eq(Cat(b, b_reg)),
-                d_reg.eq(d),
-                ad.eq(a_reg + d_reg),
-                m.eq(ad * b_reg[-1]),  # b is double piped to be in line with a+d
-                If(~mux_p, p.eq(p + m)).Else(p.eq(m + c)),
-            )
+        a, b, d = Signal.like(dsp.a), Signal.like(dsp.b), Signal.like(dsp.d)
+        ops = [a, b, d]
+        for _ in range(dsp_pipelen - dsp.latency):
+            ops_reg = [Signal.like(op) for op in ops]
+            self.sync += If(~self.stop, Cat(ops_reg).eq(Cat(ops)))
+            ops = ops_reg
+        self.comb += [
+            dsp.ce.eq(~self.stop),
+            dsp.load.eq(mux_p),
+            Cat(dsp.a, dsp.b, dsp.d).eq(Cat(ops)),
         ]
-        return a, b, c, d, mux_p, p
+        return a, b, dsp.c, d, mux_p, dsp.p
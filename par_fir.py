@@ -0,0 +1,175 @@
+from migen import *
+from misoc.interconnect.stream import Endpoint
+
+
+class _ParallelFIR(Module):
+    """Common parts of the parallel filters.
+
+    Each unique tap has its own (pipelined) DSP and the products are
+    summed by a pipelined adder tree. The pipeline advances (`ce`) and
+    the input is acknowledged when the output is not stalled.
+    """
+
+    def _coef(self, taps, width_coef, reload):
+        coef = [Signal((width_coef + 1, True), reset_less=True, reset=c) for c in taps]
+        # runtime coefficients, applied to the next sample
+        self.coeff = [Signal.like(c) for c in coef]
+        self.coeff_stb = Signal()
+        if reload:
+            self.sync += If(self.coeff_stb, Cat(coef).eq(Cat(self.coeff)))
+        return coef
+
+    def _delay(self, x, n):
+        for _ in range(n):
+            y = Signal.like(x)
+            self.sync += If(self.ce, y.eq(x))
+            x = y
+        return x
+
+    def _mac(self, a, coef, bias):
+        """Pipelined `bias + sum(a[i]*coef[i])`, returns the sum and the
+        latency"""
+        # multiplier and product registers
+        m = []
+        for i, (ai, ci) in enumerate(zip(a, coef)):
+            mi = Signal((len(ai) + len(ci), True), reset_less=True)
+            pi = Signal((len(mi) + 1, True), reset_less=True)
+            self.sync += If(
+                self.ce, mi.eq(ai * ci), pi.eq(mi + (bias if i == 0 else 0))
+            )
+            m.append(pi)
+        latency = 2
+        # adder tree
+        while len(m) > 1:
+            s = []
+            for i in range(0, len(m) - 1, 2):
+                si = Signal((max(len(m[i]), len(m[i + 1])) + 1, True), reset_less=True)
+                self.sync += If(self.ce, si.eq(m[i] + m[i + 1]))
+                s.append(si)
+            if len(m) % 2:
+                s.append(self._delay(m[-1], 1))
+            m = s
+            latency += 1
+        return m[0], latency
+
+
+class PAR_SYM_FIR(_ParallelFIR):
+    """Parallel symmetric FIR filter.
+
+    Like `MAC_SYM_FIR` but with one DSP per unique tap, accepting one input
+    sample per cycle. The input strobe is respected and the filter stalls
+    while the output is not acknowledged. Rounding is round half down.
+
+    :param coeff: Filter coeffiecient list (full impulse response including center and zeros)
+    :param width_d: Input/output data width
+    :param width_coef: Coefficient width (fixed point position)
+    :param reload: Load the unique taps `coeff` at runtime on `coeff_stb`
+    """
+
+    def __init__(self, coeff, width_d, width_coef, reload=False):
+        n = (len(coeff) + 1) // 2
+        if len(coeff) != n * 2 - 1:
+            raise ValueError("FIR length must be 2*n-1", coeff)
+        for i, c in enumerate(coeff):
+            if c != coeff[-1 - i]:
+                raise ValueError("FIR must be symmetric", (i, c))
+        bias = (1 << width_coef - 1) - 1
+        coef = self._coef(coeff[:n], width_coef, reload)
+
+        self.input = Endpoint([("data", (width_d, True))])
+        self.output = Endpoint([("data", (width_d, True))])
+        self.ce = Signal()
+        self.comb += [
+            self.ce.eq(~self.output.stb | self.output.ack),
+            self.input.ack.eq(self.ce),
+        ]
+
+        x = [Signal((width_d, True), reset_less=True) for _ in range(2 * n - 1)]
+        stb = Signal()
+        self.sync += If(
+            self.ce,
+            If(
+                self.input.stb,
+                Cat(x).eq(Cat(self.input.data, x)),
+            ),
+            stb.eq(self.input.stb),
+        )
+        # pre-adder, the center tap is only multiplied once
+        a = [Signal((width_d + 1, True), reset_less=True) for _ in range(n)]
+        self.sync += If(
+            self.ce,
+            [ai.eq(x[i] + x[-1 - i]) for i, ai in enumerate(a[:-1])],
+            a[-1].eq(x[n - 1]),
+        )
+        p, latency = self._mac(a, coef, bias)
+        self.sync += [
+            If(
+                self.ce,
+                self.output.data.eq(p >> width_coef),
+                self.output.stb.eq(self._delay(stb, 1 + latency)),
+            ),
+        ]
+
+
+class PAR_HBF_Upsampler(_ParallelFIR):
+    """Parallel half-band FIR interpolator.
+
+    Like `MAC_HBF_Upsampler` but with one DSP per unique tap, accepting one
+    input sample per cycle. For each input sample, the output carries two
+    samples: the computed sample (`data0`) followed by the trivial sample
+    (`data1`). The input strobe is respected and the filter stalls while
+    the output is not acknowledged. Rounding is round half down.
+
+    :param coeff: Filter coeffiecient list (full impulse response including center and zeros)
+    :param width_d: Input/output data width
+    :param width_coef: Coefficient width (fixed point position)
+    :param reload: Load the unique taps `coeff` at runtime on `coeff_stb`
+    """
+
+    def __init__(self, coeff, width_d, width_coef, reload=False):
+        n = (len(coeff) + 1) // 4
+        if len(coeff) != n * 4 - 1:
+            raise ValueError("HBF length must be 4*n-1", coeff)
+        for i, c in enumerate(coeff):
+            if i != n * 2 - 1 and i & 1 and c:
+                raise ValueError("HBF even taps must be zero", (i, c))
+            elif c != coeff[-1 - i]:
+                raise ValueError("HBF must be symmetric", (i, c))
+        bias = (1 << width_coef - 1) - 1
+        coef = self._coef(coeff[: 2 * n : 2], width_coef, reload)
+
+        self.input = Endpoint([("data", (width_d, True))])
+        self.output = Endpoint([("data0", (width_d, True)), ("data1", (width_d, True))])
+        self.ce = Signal()
+        self.comb += [
+            self.ce.eq(~self.output.stb | self.output.ack),
+            self.input.ack.eq(self.ce),
+        ]
+
+        x = [Signal((width_d, True), reset_less=True) for _ in range(2 * n)]
+        stb = Signal()
+        self.sync += If(
+            self.ce,
+            If(
+                self.input.stb,
+                Cat(x).eq(Cat(self.input.data, x)),
+            ),
+            stb.eq(self.input.stb),
+        )
+        a = [Signal((width_d + 1, True), reset_less=True) for _ in range(n)]
+        # the trivial sample passes the unity center tap
+        t = Signal((width_d, True), reset_less=True)
+        self.sync += If(
+            self.ce,
+            [ai.eq(x[i] + x[-1 - i]) for i, ai in enumerate(a)],
+            t.eq(x[n - 1]),
+        )
+        p, latency = self._mac(a, coef, bias)
+        self.sync += [
+            If(
+                self.ce,
+                self.output.data0.eq(p >> width_coef),
+                self.output.data1.eq(self._delay(t, latency)),
+                self.output.stb.eq(self._delay(stb, 1 + latency)),
+            ),
+        ]
@@ -7,10 +7,17 @@ from link import Link
 from decode import Decode, Register
 from dac_data import DacData
 from adc import Adc, AdcParams
-from iir import Iir, Dsp
+from iir import Iir, Dsp, n_coeff
+from servo_diag import ServoDiag
 
 SERVO_PROFILES = 4  # number iir coefficient profiles per servo channel
 SERVO_CHANNELS = 2  # number servochannels
+# iir order, 2 (biquad) fits the register map with SERVO_PROFILES = 2
+SERVO_ORDER = 1
+# memory backed iir profiles written through a register window
+# (servo_sel, servo_dataK) instead of registers for each profile,
+# up to 64 SERVO_PROFILES
+SERVO_MEMORY = False
 
 
 class PWM(Module):
@@ -48,7 +55,12 @@ class Phaser(Module):
         # Don't bother meeting s/h for the clk iserdes. We align it.
         platform.add_false_path_constraint(eem.data0_p, self.crg.cd_sys2.clk)
         self.submodules.decoder = Decode(
-            b_sample=14, n_channel=2, n_mux=8, t_frame=8 * 10
+            b_sample=14,
+            n_channel=2,
+            n_mux=8,
+            t_frame=8 * 10,
+            reload=True,
+            dsp_primitive=True,
         )
         self.comb += [
             self.decoder.frame.eq(self.link.checker.frame),
@@ -58,6 +70,9 @@ class Phaser(Module):
             Cat(self.link.checker.response[2 * 8 :]).eq(
                 Cat([Replicate(d, 8) for d in self.decoder.response])
             ),
+            # Or send the 16 byte burst response at full rate
+            self.link.responder.data.eq(self.decoder.response_burst),
+            self.link.responder.stb.eq(self.decoder.response_stb),
         ]
 
         phaser_registers = [
@@ -102,11 +117,20 @@ class Phaser(Module):
             # digital upconverter (duc) configuration
             # (accu_clr, accu_clr_once, data_select (0: duc, 1: test))
             ("duc0_cfg", Register()),
-            ("duc0_reserved", Register(read=False, write=False)),
+            # interpolator clip counters (i(4), q(4), saturating,
+            # cleared on write)
+            ("dac0_clip", Register(readback=False)),
             # duc frequency tuning word (msb first)
-            ("duc0_f", Register(), Register(), Register(), Register()),
-            # duc phase offset word
-            ("duc0_p", Register(), Register()),
+            # (applied on duc_stb)
+            (
+                "duc0_f",
+                Register(group="duc"),
+                Register(group="duc"),
+                Register(group="duc"),
+                Register(group="duc"),
+            ),
+            # duc phase offset word (applied on duc_stb)
+            ("duc0_p", Register(group="duc"), Register(group="duc")),
             # dac data
             (
                 "dac0_data",
@@ -121,11 +145,20 @@ class Phaser(Module):
             # digital upconverter (duc) configuration
             # (accu_clr, accu_clr_once, data_select (0: duc, 1: test))
             ("duc1_cfg", Register()),
-            ("duc1_reserved", Register(read=False, write=False)),
+            # interpolator clip counters (i(4), q(4), saturating,
+            # cleared on write)
+            ("dac1_clip", Register(readback=False)),
             # duc frequency tuning word (msb first)
-            ("duc1_f", Register(), Register(), Register(), Register()),
-            # duc phase offset word
-            ("duc1_p", Register(), Register()),
+            # (applied on duc_stb)
+            (
+                "duc1_f",
+                Register(group="duc"),
+                Register(group="duc"),
+                Register(group="duc"),
+                Register(group="duc"),
+            ),
+            # duc phase offset word (applied on duc_stb)
+            ("duc1_p", Register(group="duc"), Register(group="duc")),
             # dac data
             (
                 "dac1_data",
@@ -137,23 +170,70 @@ class Phaser(Module):
             # dac test data for duc_cfg:data_select == 1
             ("dac1_test", Register(), Register(), Register(), Register()),
             (0x30,),
+            # servo configuration and data are applied on servo_stb
             # (ch0_profile[2], en0)
-            ("servo0_cfg", Register()),
+            ("servo0_cfg", Register(group="servo")),
             # (ch1_profile[2], en1)
-            ("servo1_cfg", Register()),
+            ("servo1_cfg", Register(group="servo")),
         ]
 
         # add servo data registers
-        for i in range(SERVO_CHANNELS):
-            for j in range(SERVO_PROFILES):
-                for k in range(4):  # 3 coefficients + offset
-                    phaser_registers.append(
-                        (
-                            f"ch{i}_profile{j}_data{k}",
-                            Register(read=False),
-                            Register(read=False),
-                        )
+        if SERVO_MEMORY:
+            # (profile[7], ch), the selected profile is written from the
+            # servo_dataK registers on servo_stb
+            phaser_registers.append(("servo_sel", Register(group="servo")))
+            for k in range(n_coeff(SERVO_ORDER) + 1):  # coefficients + offset
+                phaser_registers.append(
+                    (
+                        f"servo_data{k}",
+                        Register(read=False, group="servo"),
+                        Register(read=False, group="servo"),
                     )
+                )
+        else:
+            for i in range(SERVO_CHANNELS):
+                for j in range(SERVO_PROFILES):
+                    for k in range(n_coeff(SERVO_ORDER) + 1):  # coefficients + offset
+                        phaser_registers.append(
+                            (
+                                f"ch{i}_profile{j}_data{k}",
+                                Register(read=False, group="servo"),
+                                Register(read=False, group="servo"),
+                            )
+                        )
+
+        phaser_registers += [
+            (0x72,),
+            # servo configuration and data update strobe
+            ("servo_stb", Register(write=False, read=False)),
+            # interpolation ratio (0: 20x, 1: 10x channel 0 only, 2: 40x)
+            ("interp_cfg", Register(width=2)),
+            # servo diagnostics byte select (snapshot[1], sel[7]), writing
+            # with the snapshot bit set latches and restarts the window
+            ("servo_diag_sel", Register()),
+            # selected servo diagnostics byte (see `ServoDiag`)
+            ("servo_diag", Register(write=False)),
+            (0x76,),
+            # link configuration (response_fast)
+            ("link_cfg", Register(width=1)),
+            # link clock lane bitslip lock time (cycles, saturating)
+            ("link_lock", Register(write=False)),
+            # link clock lane delay eye scan restart strobe
+            ("link_cal", Register(write=False, read=False)),
+            # current link clock lane delay tap
+            ("link_tap", Register(write=False)),
+            # first tap and number of taps of the widest open eye
+            ("link_eye_start", Register(write=False)),
+            ("link_eye_width", Register(write=False)),
+            # open eye tap map (msb first)
+            (
+                "link_eye",
+                Register(write=False),
+                Register(write=False),
+                Register(write=False),
+                Register(write=False),
+            ),
+        ]
 
         self.decoder.map_registers(phaser_registers)
 
@@ -184,7 +264,18 @@ class Phaser(Module):
             Cat(adc_ctrl.gain0, adc_ctrl.gain1).eq(
                 self.decoder.get("adc_cfg", "write")
             ),
+            self.decoder.commit["duc"].eq(self.decoder.registers["duc_stb"][0].bus.we),
+            self.decoder.commit["servo"].eq(
+                self.decoder.registers["servo_stb"][0].bus.we
+            ),
             self.decoder.get("crc_err", "read").eq(self.link.checker.crc_err),
+            self.link.response_fast.eq(self.decoder.get("link_cfg", "write")),
+            self.decoder.get("link_lock", "read").eq(self.link.slip.lock_time),
+            self.link.eye.start.eq(self.decoder.registers["link_cal"][0].bus.we),
+            self.decoder.get("link_tap", "read").eq(self.link.eye.tap),
+            self.decoder.get("link_eye_start", "read").eq(self.link.eye.eye_start),
+            self.decoder.get("link_eye_width", "read").eq(self.link.eye.eye_width),
+            self.decoder.get("link_eye", "read").eq(self.link.eye.eye),
         ]
 
         fan = platform.request("fan_pwm")
@@ -241,6 +332,10 @@ class Phaser(Module):
         # 32 ns t_cnvh, 12 ns t_conv/t_DCNVSCKL, 192 ns data transfer, 24 ns t_rtt/tDSCKLCNVH
         # Note that there is one extra cycle (4 ns) at the end of a transaction.
         # Total: 264 ns -> 3.788 MSps
+        # With pipelined=True (conversion during the readout):
+        # 220 ns -> 4.545 MSps at the same conversion to data latency
+        # With ddr=True (ADC in DDR output mode): 96 ns data transfer,
+        # 168 ns -> 5.952 MSps (124 ns -> 8.065 MSps pipelined)
         adc_parameters = AdcParams(
             width=16, channels=2, lanes=2, t_cnvh=8, t_conv=3, t_rtt=6
         )
@@ -260,6 +355,11 @@ class Phaser(Module):
             log2_a0=14,
             n_profiles=SERVO_PROFILES,
             n_channels=SERVO_CHANNELS,
+            dsp_primitive=True,
+            order=SERVO_ORDER,
+            # one DSP per channel: adc.done to outp in iir.latency = 7 cycles
+            parallel=True,
+            memory=SERVO_MEMORY,
         )
         self.comb += [
             [inp.eq(data) for inp, data in zip(iir.inp, adc.data)],
@@ -267,15 +367,29 @@ class Phaser(Module):
         ]
 
         # connect iir to servo data registers
-        for i in range(SERVO_CHANNELS):
-            for j in range(SERVO_PROFILES):
-                for k in range(3):  # 3 coefficients
-                    self.comb += iir.coeff[k][j][i].eq(
-                        self.decoder.get(f"ch{i}_profile{j}_data{k}", "write")
+        if SERVO_MEMORY:
+            servo_sel = self.decoder.get("servo_sel", "write")
+            self.comb += [
+                iir.wr_channel.eq(servo_sel[0]),
+                iir.wr_profile.eq(servo_sel[1:]),
+                [
+                    c.eq(self.decoder.get(f"servo_data{k}", "write"))
+                    for k, c in enumerate(iir.wr_coeff)
+                ],
+                iir.wr_offset.eq(self.decoder.get(f"servo_data{iir.n_coeff}", "write")),
+            ]
+            # once the servo registers are committed
+            self.sync += iir.wr_stb.eq(self.decoder.commit["servo"])
+        else:
+            for i in range(SERVO_CHANNELS):
+                for j in range(SERVO_PROFILES):
+                    for k in range(iir.n_coeff):
+                        self.comb += iir.coeff[k][j][i].eq(
+                            self.decoder.get(f"ch{i}_profile{j}_data{k}", "write")
+                        )
+                    self.comb += iir.offset[j][i].eq(
+                        self.decoder.get(f"ch{i}_profile{j}_data{iir.n_coeff}", "write")
                     )
-                self.comb += iir.offset[j][i].eq(
-                    self.decoder.get(f"ch{i}_profile{j}_data3", "write")
-                )
 
         # connect hold and profile select so that they update after a filter update is done
         self.sync += [
@@ -289,8 +403,26 @@ class Phaser(Module):
             )
         ]
 
+        self.submodules.servo_diag = servo_diag = ServoDiag(
+            n_channels=SERVO_CHANNELS, w_adc=adc_parameters.width, w_data=16
+        )
+        diag_sel = self.decoder.registers["servo_diag_sel"][0].bus
+        self.comb += [
+            servo_diag.cnv.eq(adc.cnvn),
+            servo_diag.adc_stb.eq(iir.stb_in),
+            servo_diag.outp_stb.eq(iir.stb_out),
+            [a.eq(b) for a, b in zip(servo_diag.adc, adc.data)],
+            [a.eq(b) for a, b in zip(servo_diag.outp, iir.outp)],
+            [a.eq(b) for a, b in zip(servo_diag.clip_pos, iir.clip_pos)],
+            [a.eq(b) for a, b in zip(servo_diag.clip_neg, iir.clip_neg)],
+            servo_diag.snapshot.eq(diag_sel.we & diag_sel.dat_w[7]),
+            servo_diag.sel.eq(self.decoder.get("servo_diag_sel", "write")),
+            self.decoder.get("servo_diag", "read").eq(servo_diag.dat),
+        ]
+
         self.submodules.dac = DacData(platform.request("dac_data"))
         self.comb += [
+            self.decoder.ratio.eq(self.decoder.get("interp_cfg", "write")),
             # sync istr counter every frame
             # this is correct since dac samples per frame is 8*20 and
             # thus divisible by the EB depth of 8.
@@ -306,20 +438,28 @@ class Phaser(Module):
                 # keep accu cleared
                 duc.clr.eq(cfg[0]),
                 If(
-                    self.decoder.registers["duc_stb"][0].bus.we,
+                    self.decoder.commit["duc"],
                     # clear accu once
                     If(
                         cfg[1],
                         duc.clr.eq(1),
                     ),
-                    duc.f.eq(self.decoder.get("duc{}_f".format(ch), "write")),
-                    # msb align to 19 bit duc.p
-                    duc.p[3:].eq(self.decoder.get("duc{}_p".format(ch), "write")),
+                ),
+            ]
+            self.comb += [
+                duc.f.eq(self.decoder.get("duc{}_f".format(ch), "write")),
+                # msb align to 19 bit duc.p
+                duc.p[3:].eq(self.decoder.get("duc{}_p".format(ch), "write")),
+                self.decoder.get("dac{}_clip".format(ch), "read").eq(
+                    self.decoder.clip[ch]
+                ),
+                self.decoder.clip_clr[ch].eq(
+                    self.decoder.registers["dac{}_clip".format(ch)][0].bus.we
                 ),
             ]
             for t, (ti, to) in enumerate(zip(duc.i, duc.o)):
-                servo_dsp_i = Dsp()
-                servo_dsp_q = Dsp()
+                servo_dsp_i = Dsp(primitive=True)
+                servo_dsp_q = Dsp(primitive=True)
                 self.submodules += [servo_dsp_i, servo_dsp_q]
                 self.comb += [
                     ti.i.eq(self.decoder.data[t][ch].i),
@@ -0,0 +1,117 @@
+from migen import *
+
+
+class ServoDiag(Module):
+    """Servo diagnostics
+
+    Per channel, counts the positive and negative IIR output clipping
+    events (saturating) and tracks the minimum and maximum of the ADC data
+    and of the IIR output. The window is restarted by `snapshot`, which
+    also latches the values to be read out. An empty window reads as
+    minimum > maximum.
+
+    `latency` is the number of cycles from the rising edge of `cnv` (ADC
+    conversion start) to the corresponding `outp_stb` (IIR output update),
+    saturating. The next conversion may start before `outp_stb` and, with
+    a pipelined ADC, before `adc_stb`: the start of each of up to two
+    pending conversions is kept and matched with the next `adc_stb`.
+
+    The snapshot is read out as 16 bit words, big endian, one byte `dat`
+    at the byte index `sel`: per channel `[clip_pos, clip_neg, adc_min,
+    adc_max, outp_min, outp_max]`, then `latency`.
+    """
+
+    def __init__(self, n_channels, w_adc, w_data, w_count=16):
+        assert max(w_adc, w_data, w_count) <= 16
+        self.cnv = Signal()  # ADC conversion start
+        self.adc = [Signal((w_adc, True)) for _ in range(n_channels)]
+        self.adc_stb = Signal()  # new ADC data
+        self.outp = [Signal((w_data, True)) for _ in range(n_channels)]
+        self.outp_stb = Signal()  # new IIR output
+        self.clip_pos = [Signal() for _ in range(n_channels)]
+        self.clip_neg = [Signal() for _ in range(n_channels)]
+        self.snapshot = Signal()
+        self.latency = Signal(w_count, reset_less=True)
+        self.sel = Signal(7)
+        self.dat = Signal(8)
+
+        ###
+
+        words = []
+        for ch in range(n_channels):
+            counters = []
+            for clip in self.clip_pos[ch], self.clip_neg[ch]:
+                count = Signal(w_count)
+                self.sync += If(
+                    self.snapshot,
+                    count.eq(0),
+                ).Elif(
+                    clip & (count != (1 << w_count) - 1),
+                    count.eq(count + 1),
+                )
+                counters.append(count)
+            extremes = []
+            for x, stb in (self.adc[ch], self.adc_stb), (self.outp[ch], self.outp_stb):
+                w = len(x)
+                x_min = Signal((w, True), reset=(1 << w - 1) - 1)
+                x_max = Signal((w, True), reset=-(1 << w - 1))
+                self.sync += If(
+                    self.snapshot,
+                    x_min.eq(x_min.reset),
+                    x_max.eq(x_max.reset),
+                ).Elif(
+                    stb,
+                    If(x < x_min, x_min.eq(x)),
+                    If(x > x_max, x_max.eq(x)),
+                )
+                extremes += [x_min, x_max]
+            words += counters + extremes
+
+        # conversion start to ADC data and ADC data to IIR output
+        # the next conversion may start before the ADC data (pipelined ADC):
+        # the times since the last two conversion starts are kept
+        t_max = (1 << w_count) - 1
+        cnv_old = Signal(reset_less=True)
+        t_cnv = Array(Signal(w_count, reset_less=True) for _ in range(2))
+        t_adc = Signal(w_count, reset_less=True)
+        t_iir = Signal(w_count, reset_less=True)
+        n_cnv = Signal(2)  # pending conversions
+        wr = Signal()  # next conversion entry
+        rd = Signal()  # oldest pending conversion entry
+        push = Signal()
+        pop = Signal()
+        self.comb += [
+            rd.eq(wr ^ n_cnv[0]),
+            push.eq(self.cnv & ~cnv_old),
+            pop.eq(self.adc_stb & (n_cnv != 0)),
+        ]
+        self.sync += [
+            cnv_old.eq(self.cnv),
+            [If(t != t_max, t.eq(t + 1)) for t in t_cnv],
+            If(
+                push,
+                t_cnv[wr].eq(1),
+                wr.eq(~wr),
+                # a third conversion drops the oldest
+                If(~pop & (n_cnv != 2), n_cnv.eq(n_cnv + 1)),
+            ).Elif(
+                pop,
+                n_cnv.eq(n_cnv - 1),
+            ),
+            If(pop, t_adc.eq(t_cnv[rd])),
+            If(t_iir != t_max, t_iir.eq(t_iir + 1)),
+            If(self.adc_stb, t_iir.eq(1)),
+            If(
+                self.outp_stb,
+                self.latency.eq(t_adc + t_iir),
+                If(t_adc + t_iir > t_max, self.latency.eq(t_max)),
+            ),
+        ]
+        words.append(self.latency)
+
+        snapshot = []
+        for word in words:
+            w = Signal(16, reset_less=True)
+            self.sync += If(self.snapshot, w.eq(word))
+            snapshot += [w[8:], w[:8]]
+        self.comb += self.dat.eq(Array(snapshot)[self.sel])
@@ -1,8 +1,11 @@
 #!/usr/bin/python3
 
 import unittest
+
+import numpy as np
 from adc import Adc, AdcParams
 from migen import *
+from migen.genlib.io import DDRInput
 
 
 def bench(dut, done):
@@ -25,3 +28,189 @@ class TestInter(unittest.TestCase):
         done = []
         run_simulation(self.dut, bench(self.dut, done))
         self.assertEqual(done[0], True)
+
+
+class TestPipelined(unittest.TestCase):
+    def timing(self, pipelined):
+        """Conversion start and done cycles"""
+        p = AdcParams(
+            width=16,
+            channels=2,
+            lanes=2,
+            t_cnvh=8,
+            t_conv=3,
+            t_rtt=6,
+            pipelined=pipelined,
+        )
+        dut = Adc(None, p)
+        cnv, done = [], []
+
+        def gen(dut):
+            yield dut.start.eq(1)
+            cnvn_old = 0
+            for t in range(400):
+                yield
+                cnvn = yield dut.cnvn
+                if cnvn and not cnvn_old:
+                    cnv.append(t)
+                cnvn_old = cnvn
+                if (yield dut.done):
+                    done.append(t)
+
+        run_simulation(dut, gen(dut))
+        return cnv, done
+
+    def test_pipelined(self):
+        cnv, done = self.timing(False)
+        # 8 + 3 + 48 + 6 + 1
+        self.assertEqual(set(np.diff(cnv)), {66})
+        latency = [d - c for c, d in zip(cnv, done[1:])]
+        self.assertEqual(len(set(latency)), 1)
+        cnv, done = self.timing(True)
+        # the conversion overlaps the readout
+        self.assertEqual(set(np.diff(cnv)), {55})
+        self.assertEqual(set(np.diff(done)), {55})
+        # same latency, one done strobe per sample
+        self.assertEqual(set(d - c for c, d in zip(cnv, done)), set(latency))
+
+
+class SimDDRInput:
+    """`DDRInput` clocked by `ret` in SAME_EDGE mode: on the rising edge,
+    `o1` is the data at the rising edge and `o2` the data at the previous
+    falling edge (`ret_n`)"""
+
+    @staticmethod
+    def lower(dr):
+        m = Module()
+        m.clock_domains.cd_ret_n = ClockDomain("ret_n", reset_less=True)
+        m.comb += m.cd_ret_n.clk.eq(~ClockSignal("ret"))
+        fall = Signal()
+        m.sync.ret_n += fall.eq(dr.i)
+        m.sync.ret += [dr.o1.eq(dr.i), dr.o2.eq(fall)]
+        return m
+
+
+def run_adc(dut, words, n, rtt=3):
+    """Simulate `dut` with a model ADC for `n` cycles, `start` held
+
+    The simulation has half cycle resolution: `sck` is the `DDROutput` of
+    `ddr_clk_synth`, `clkout` is `sck` delayed by `rtt` half cycles and
+    clocks the `ret` (rising) and `ret_n` (falling edge) domains. The
+    model ADC converts the next of `words` (per channel) at each rising
+    edge of `cnvn`, the result is available `t_cnvh + t_conv` cycles later
+    and shifted out MSB first on each `clkout` capture edge (rising, DDR:
+    falling and rising).
+
+    Returns the cycles of the conversion starts and of the `done` strobes
+    with the `data` at each `done`.
+    """
+    p = dut.params
+    sim = Simulator(dut, [], special_overrides={DDRInput: SimDDRInput})
+    ev = sim.evaluator
+    ev.execute(sim.fragment.comb)
+    sim._commit_and_comb_propagate()
+    ev.assign(dut.start, 1)
+    ev.assign(dut.clkout, 1)
+    ev.assign(dut.ddr_clk_synth, dut.ddr_clk_synth.reset.value)
+    sim._commit_and_comb_propagate()
+    k = p.channels // p.lanes
+    cnv, done = [], []
+    sck = [1] * rtt
+    word = None  # the converted word
+    bit = 0  # next bit of the word
+    convert = []  # conversion end (half cycles) and word
+    for t in range(2 * n):
+        edges = []
+        if t % 2 == 0:
+            edges.append("sys")
+            synth = ev.eval(dut.ddr_clk_synth)
+            sck += [synth >> 1 & 1, synth & 1]
+        clkout = ev.eval(dut.clkout)
+        if sck[t] != clkout:
+            edges.append("ret" if sck[t] else "ret_n")
+            if sck[t] or p.ddr:
+                # lane i carries channels i*k ... i*k + k - 1
+                for i, sdo in enumerate([dut.sdo2n, dut.sdo[0]]):
+                    d = 0
+                    for j in range(k):
+                        d = d << p.width | word[i * k + j] & (1 << p.width) - 1
+                    v = d >> k * p.width - 1 - bit & 1
+                    ev.assign(sdo, v ^ (sdo is dut.sdo2n))
+                bit += 1
+            ev.assign(dut.clkout, sck[t])
+        if convert and convert[0][0] == t:
+            word = convert.pop(0)[1]
+            bit = 0
+        sim._commit_and_comb_propagate()
+        for cd in edges:
+            ev.execute(sim.fragment.sync.get(cd, []))
+        cnvn = ev.eval(dut.cnvn)
+        sim._commit_and_comb_propagate()
+        if "sys" in edges:
+            if ev.eval(dut.cnvn) and not cnvn:
+                cnv.append(t // 2)
+                convert.append((t + 2 * (p.t_cnvh + p.t_conv), words[len(cnv) - 1]))
+            if ev.eval(dut.done) and cnv:
+                done.append((t // 2, [ev.eval(d) for d in dut.data]))
+    return cnv, done
+
+
+class TestData(unittest.TestCase):
+    def check(self, **kwargs):
+        p = AdcParams(
+            width=16, channels=2, lanes=2, t_cnvh=8, t_conv=3, t_rtt=6, **kwargs
+        )
+        rng = np.random.default_rng(0)
+        words = rng.integers(-(1 << 15), 1 << 15, (20, 2))
+        # MSB and LSB, alternating bits (0x8001, 0x5555, 0xaaaa)
+        words[:2] = [[-(1 << 15) + 1, 0x5555], [0x5555, -0x5556]]
+        # the last clkout edge needs to be before the end of RTT
+        for rtt in 1, 2 * p.t_rtt - 2:
+            with self.subTest(rtt=rtt, **kwargs):
+                cnv, done = run_adc(Adc(None, p), words.tolist(), 600, rtt)
+                self.assertGreater(len(done), 5)
+                # the data of each conversion, in order, at the same latency
+                self.assertEqual([d for _, d in done], words[: len(done)].tolist())
+                self.assertEqual(len(set(t - c for c, (t, _) in zip(cnv, done))), 1)
+
+    def test_sdr(self):
+        self.check()
+
+    def test_sdr_pipelined(self):
+        self.check(pipelined=True)
+
+    def test_ddr(self):
+        self.check(ddr=True)
+
+    def test_ddr_pipelined(self):
+        self.check(pipelined=True, ddr=True)
+
+
+class TestDdr(unittest.TestCase):
+    def test_ddr(self):
+        for pipelined in False, True:
+            p = AdcParams(
+                width=16,
+                channels=2,
+                lanes=2,
+                t_cnvh=8,
+                t_conv=3,
+                t_rtt=6,
+                pipelined=pipelined,
+                ddr=True,
+            )
+            dut = Adc(None, p)
+            reading = []
+
+            def gen(dut):
+                yield dut.start.eq(1)
+                for _ in range(200):
+                    yield
+                    reading.append((yield dut.sck_en))
+
+            run_simulation(dut, gen(dut), special_overrides={DDRInput: SimDDRInput})
+            starts = np.flatnonzero(np.diff(reading) == 1)
+            ends = np.flatnonzero(np.diff(reading) == -1)
+            # 16 bits on two edges, 3 cycles per sck period
+            self.assertEqual(set(e - s for s, e in zip(starts, ends)), {24})
+            self.assertEqual(set(np.diff(starts)), {31 if pipelined else 42})
@@ -0,0 +1,42 @@
+import numpy as np
+import unittest
+
+from migen import *
+
+from cic import CICInterpolator
+from interpolate_model import cic_interpolator, wrap
+
+
+class TestCIC(unittest.TestCase):
+    def test_rate(self):
+        rng = np.random.default_rng(0)
+        for r in (2, 3, 5, 10):
+            with self.subTest(r=r):
+                dut = CICInterpolator(n=5, r_max=10, width=16)
+                x = rng.integers(-(1 << 15), 1 << 15, 30)
+                y = []
+
+                def src():
+                    yield dut.r.eq(r)
+                    yield dut.input.stb.eq(1)
+                    for xi in x:
+                        yield dut.input.data.eq(int(xi))
+                        yield
+                        while not (yield dut.input.ack):
+                            yield
+
+                @passive
+                def sink():
+                    yield dut.output.ack.eq(1)
+                    while True:
+                        yield
+                        if (yield dut.output.stb):
+                            y.append((yield dut.output.data0))
+                            y.append((yield dut.output.data1))
+
+                run_simulation(dut, [src(), sink()])
+                y0 = wrap(cic_interpolator(x, 5, r), len(dut.output.data0))
+                # skip the leading zeros of the pipeline latency
+                y = np.array(y[np.flatnonzero(y)[0] :])
+                self.assertGreater(len(y), 20)
+                np.testing.assert_equal(y, y0[: len(y)])
@@ -0,0 +1,189 @@
+import unittest
+
+from migen import *
+
+from decode import Decode, Register, intersection, coeff_width
+from interpolate_model import InterpolateChannelModel
+
+
+def header(we=0, addr=0, data=0, type=0):
+    return we | (addr << 1) | (data << 8) | (type << 16)
+
+
+def body(chunks, width, n_body=448):
+    # first chunk most significant
+    ret = 0
+    for i, c in enumerate(chunks):
+        ret |= c << n_body - width * (i + 1)
+    return ret << 20
+
+
+class TestIntersection(unittest.TestCase):
+    def test_intersection(self):
+        self.assertTrue(intersection((0x12, 0x7F), (0x12, 0x7F)))
+        self.assertFalse(intersection((0x12, 0x7F), (0x13, 0x7F)))
+        self.assertTrue(intersection((0x10, 0x70), (0x13, 0x7F)))
+        self.assertFalse(intersection((0x10, 0x70), (0x23, 0x7F)))
+        self.assertTrue(intersection((0x01, 0x01), (0x10, 0x10)))
+        self.assertFalse(intersection((0x01, 0x03), (0x02, 0x03)))
+
+    def test_overlap(self):
+        dut = Decode(b_sample=14, n_channel=2, n_mux=8, t_frame=8 * 10)
+        with self.assertRaises(ValueError):
+            dut.map_registers([("a", Register()), (0x00,), ("b", Register())])
+
+
+class TestDecode(unittest.TestCase):
+    pipeline = False
+
+    def setUp(self):
+        self.dut = Decode(
+            b_sample=14,
+            n_channel=2,
+            n_mux=8,
+            t_frame=8 * 10,
+            n_read=4,
+            pipeline=self.pipeline,
+        )
+        self.dut.map_registers(
+            [
+                (0x00,),
+                ("a", Register(write=False)),
+                ("b", Register()),
+                ("c", Register(), Register()),
+                (0x10,),
+                ("e", Register(group="g"), Register(group="g")),
+                (0x7F,),
+                ("d", Register(write=False)),
+            ]
+        )
+        self.dut.comb += [
+            self.dut.get("a", "read").eq(0x11),
+            self.dut.get("d", "read").eq(0x44),
+        ]
+
+    def frame(self, body=0, **kwargs):
+        yield self.dut.frame.eq(header(**kwargs) | body)
+        yield self.dut.stb.eq(1)
+        yield
+        yield self.dut.stb.eq(0)
+        yield self.dut.frame.eq(0)
+
+    def read_burst(self, addr, **kwargs):
+        yield from self.frame(addr=addr, **kwargs)
+        for _ in range(10):
+            if (yield self.dut.response_stb):
+                return (yield self.dut.response_burst)
+            yield
+
+    def test_burst(self):
+        ret = []
+
+        def gen():
+            yield from self.frame(we=1, addr=1, data=0x22)
+            yield from self.frame(we=1, addr=3, data=0x33)
+            ret.append((yield from self.read_burst(0)))
+            # wraps around
+            ret.append((yield from self.read_burst(0x7F)))
+
+        run_simulation(self.dut, gen())
+        self.assertEqual(ret, [0x11220033, 0x44112200])
+
+    def test_burst_re(self):
+        re = []
+
+        def gen():
+            bus = self.dut.registers["c"][0].bus
+            for _ in range(2):
+                yield from self.frame(addr=1)
+                for _ in range(8):
+                    re.append((yield bus.re))
+                    yield
+            yield from self.frame(addr=2)
+            re.append((yield bus.re))
+
+        run_simulation(self.dut, gen())
+        # only the addressed register is strobed
+        self.assertEqual(re[:16], [0] * 16)
+        self.assertEqual(re[16:], [1])
+
+    def test_write_list(self):
+        ret = []
+
+        def gen():
+            writes = [
+                header(we=1, addr=3, data=0x55),
+                header(we=0, addr=2, data=0x66),
+                header(we=1, addr=1, data=0x22),
+            ]
+            yield from self.frame(type=2, body=body(writes, 16))
+            for _ in range(40):
+                yield
+            ret.append((yield from self.read_burst(0)))
+
+        run_simulation(self.dut, gen())
+        self.assertEqual(ret, [0x11220055])
+
+    def test_write_burst(self):
+        ret = []
+
+        def gen():
+            # writes are applied after the burst read
+            ret.append(
+                (
+                    yield from self.read_burst(
+                        addr=1, data=3, type=3, body=body([0x22, 0x33, 0x44, 0x55], 8)
+                    )
+                )
+            )
+            for _ in range(10):
+                yield
+            ret.append((yield from self.read_burst(0)))
+
+        run_simulation(self.dut, gen())
+        self.assertEqual(ret, [0x00000000, 0x11223344])
+
+    def test_commit(self):
+        ret = []
+
+        def gen():
+            yield from self.frame(we=1, addr=0x10, data=0x12)
+            yield from self.frame(we=1, addr=0x11, data=0x34)
+            yield
+            ret.append((yield self.dut.get("e", "write")))
+            ret.append((yield from self.read_burst(0x10)) >> 16)
+            yield self.dut.commit["g"].eq(1)
+            yield
+            yield self.dut.commit["g"].eq(0)
+            yield
+            ret.append((yield self.dut.get("e", "write")))
+
+        run_simulation(self.dut, gen())
+        self.assertEqual(ret, [0x0000, 0x1234, 0x1234])
+
+
+class TestDecodePipelined(TestDecode):
+    pipeline = True
+
+
+class TestDecodeReload(unittest.TestCase):
+    def test_coeff(self):
+        dut = Decode(b_sample=14, n_channel=2, n_mux=8, t_frame=8 * 10, reload=True)
+        dut.map_registers([("a", Register())])
+        coeff = [-i - 1 for i in range(20)]
+        mask = (1 << coeff_width) - 1
+        ret = []
+
+        def gen():
+            yield dut.frame.eq(header(type=4) | body([c & mask for c in coeff], 18))
+            yield dut.stb.eq(1)
+            yield
+            yield dut.stb.eq(0)
+            yield
+            ret.append((yield dut.interpolate[0].coeff_stb))
+            for c in dut.interpolate[3].coeff:
+                ret.append((yield c))
+
+        run_simulation(dut, gen())
+        self.assertEqual(len(InterpolateChannelModel().coeff()), len(coeff))
+        self.assertEqual(ret, [1] + coeff)
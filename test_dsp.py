@@ -0,0 +1,68 @@
+import numpy as np
+import unittest
+
+from migen import *
+from migen.fhdl import verilog
+
+from dsp import DSP
+from mac_sym_fir import MAC_SYM_FIR
+from interpolate import h_fir
+from interpolate_model import mac_sym_fir
+
+
+class TestDSP(unittest.TestCase):
+    def test_mac(self):
+        rng = np.random.default_rng(0)
+        for areg, preadd in (0, False), (1, True), (2, False):
+            with self.subTest(areg=areg, preadd=preadd):
+                dut = DSP(areg=areg, preadd=preadd)
+                a, b, d = rng.integers(-(1 << 16), 1 << 16, (3, 20))
+                c = 1234
+                load = np.arange(20) % 4 == 0
+                p = []
+
+                def gen():
+                    yield dut.c.eq(c)
+                    for i in range(20 + dut.latency):
+                        if i < 20:
+                            yield dut.a.eq(int(a[i]))
+                            yield dut.b.eq(int(b[i]))
+                            yield dut.d.eq(int(d[i]))
+                        # load is applied at the p register
+                        j = i - dut.latency + 1
+                        yield dut.load.eq(0 <= j < 20 and bool(load[j]))
+                        yield
+                        p.append((yield dut.p))
+
+                run_simulation(dut, gen())
+                m = (a + d if preadd else a) * b
+                p0 = []
+                for mi, li in zip(m, load):
+                    p0.append(mi + (c if li else p0[-1]))
+                self.assertEqual(p[dut.latency : dut.latency + 20], p0)
+
+    def test_lattice(self):
+        dut = MAC_SYM_FIR(h_fir, width_d=16, width_coef=16, dsp_arch="lattice")
+        x = np.random.default_rng(1).integers(-(1 << 15), 1 << 15, 30)
+        y = []
+
+        def gen():
+            yield dut.output.ack.eq(1)
+            for xi in x:
+                yield dut.input.data.eq(int(xi))
+                yield
+                while not (yield dut.input.ack):
+                    yield
+                y.append((yield dut.output.data))
+
+        run_simulation(dut, gen())
+        y0 = mac_sym_fir(x, h_fir, 16, 16)
+        latency = [np.array_equal(y[i:], y0[: len(y) - i]) for i in range(5)]
+        self.assertTrue(any(latency))
+
+    def test_primitive(self):
+        dut = DSP(primitive=True)
+        v = str(verilog.convert(dut, ios={dut.a, dut.b, dut.c, dut.d, dut.p}))
+        self.assertIn("DSP48E1", v)
+        self.assertIn('.USE_DPORT("TRUE")', v)
+        self.assertIn(".BREG(2'd2)", v)
@@ -2,7 +2,9 @@
 # testbench for iir.py
 
 import unittest
-from iir import Iir
+import numpy as np
+from iir import Iir, n_coeff
+from iir_model import IirModel
 from migen import *
 
 
@@ -108,3 +110,139 @@ class TestIir(unittest.TestCase):
         run_simulation(self.dut, rounding(self.dut, inp, coeff, outp))
         self.assertEqual(inp // 2, outp[0])
         self.assertEqual((inp // 2) + 1, outp[1])
+
+
+class TestIirModel(unittest.TestCase):
+    def run_random(
+        self,
+        n_profiles,
+        n_channels,
+        order=1,
+        n=100,
+        seed=0,
+        parallel=False,
+        memory=False,
+    ):
+        rng = np.random.default_rng(seed)
+        kwargs = dict(w_coeff=16, w_data=16, log2_a0=14, order=order)
+        dut = Iir(
+            n_profiles=n_profiles,
+            n_channels=n_channels,
+            parallel=parallel,
+            memory=memory,
+            **kwargs,
+        )
+        model = IirModel(n_profiles=n_profiles, n_channels=n_channels, **kwargs)
+        # mostly small coefficients to stay in the linear range
+        coeff = rng.integers(
+            -(1 << 15), 1 << 15, (n_coeff(order), n_profiles, n_channels)
+        )
+        coeff >>= rng.integers(0, 8, coeff.shape)
+        offset = rng.integers(-(1 << 15), 1 << 15, (n_profiles, n_channels))
+        offset >>= rng.integers(0, 16, offset.shape)
+        x = rng.integers(-(1 << 15), 1 << 15, (n, n_channels))
+        profile = rng.integers(0, n_profiles, (n, n_channels))
+        hold = rng.random((n, n_channels)) < 0.1
+        y = []
+        clip = np.zeros((2, n_channels), np.int64)
+
+        def count_clip(dut):
+            for i in range(n_channels):
+                clip[0, i] += yield dut.clip_pos[i]
+                clip[1, i] += yield dut.clip_neg[i]
+
+        def load(dut):
+            if not memory:
+                for k in range(n_coeff(order)):
+                    for j in range(n_profiles):
+                        for i in range(n_channels):
+                            yield dut.coeff[k][j][i].eq(int(coeff[k, j, i]))
+                for j in range(n_profiles):
+                    for i in range(n_channels):
+                        yield dut.offset[j][i].eq(int(offset[j, i]))
+                return
+            yield dut.wr_stb.eq(1)
+            for j in range(n_profiles):
+                for i in range(n_channels):
+                    yield dut.wr_channel.eq(i)
+                    yield dut.wr_profile.eq(j)
+                    for k, c in enumerate(dut.wr_coeff):
+                        yield c.eq(int(coeff[k, j, i]))
+                    yield dut.wr_offset.eq(int(offset[j, i]))
+                    yield
+            yield dut.wr_stb.eq(0)
+
+        def gen(dut):
+            yield from load(dut)
+            for xi, pi, hi in zip(x, profile, hold):
+                for i in range(n_channels):
+                    yield dut.inp[i].eq(int(xi[i]))
+                    yield dut.ch_profile[i].eq(int(pi[i]))
+                    yield dut.hold[i].eq(int(hi[i]))
+                yield
+                yield dut.stb_in.eq(1)
+                yield
+                yield dut.stb_in.eq(0)
+                for _ in range(dut.latency):
+                    self.assertFalse((yield dut.stb_out))
+                    yield from count_clip(dut)
+                    yield
+                self.assertTrue((yield dut.stb_out))
+                yield from count_clip(dut)
+                yi = []
+                for o in dut.outp:
+                    yi.append((yield o))
+                y.append(yi)
+
+        run_simulation(dut, gen(dut))
+        y0 = model(x, coeff, offset, profile, hold)
+        np.testing.assert_equal(y, y0)
+        np.testing.assert_equal(clip, model.clip.sum(axis=0))
+        # the random run covers the clipping
+        self.assertTrue(np.any(y0 == 0))
+        self.assertTrue(np.any(y0 == (1 << 15) - 1))
+        self.assertTrue(np.any((y0 != 0) & (y0 != (1 << 15) - 1)))
+
+    def test_random(self):
+        self.run_random(n_profiles=4, n_channels=2)
+
+    def test_channels(self):
+        self.run_random(n_profiles=2, n_channels=3, seed=1)
+
+    def test_biquad(self):
+        self.run_random(n_profiles=2, n_channels=2, order=2, seed=2)
+
+    def test_order(self):
+        self.run_random(n_profiles=1, n_channels=3, order=3, seed=3)
+
+    def test_parallel(self):
+        self.run_random(n_profiles=2, n_channels=3, order=2, seed=5, parallel=True)
+
+    def test_memory(self):
+        self.run_random(n_profiles=32, n_channels=2, n=150, seed=6, memory=True)
+
+    def test_memory_parallel(self):
+        self.run_random(
+            n_profiles=5, n_channels=3, order=2, seed=7, parallel=True, memory=True
+        )
+
+    def test_latency(self):
+        for order in 1, 2:
+            for n_channels in 1, 2, 4:
+                iir = Iir(16, 16, 14, 1, n_channels, order=order)
+                self.assertEqual(iir.latency, n_channels * (2 * order + 1) + 4)
+                iir = Iir(16, 16, 14, 1, n_channels, order=order, parallel=True)
+                self.assertEqual(iir.latency, 2 * order + 5)
+
+    def test_reduce(self):
+        # a biquad with b2 = a2 = 0 is a first order filter
+        rng = np.random.default_rng(4)
+        kwargs = dict(w_coeff=16, w_data=16, log2_a0=14, n_profiles=1, n_channels=2)
+        coeff = rng.integers(-(1 << 12), 1 << 12, (3, 1, 2))
+        offset = rng.integers(0, 1 << 12, (1, 2))
+        x = rng.integers(-(1 << 15), 1 << 15, (50, 2))
+        y1 = IirModel(**kwargs)(x, coeff, offset)
+        coeff2 = np.zeros((5, 1, 2), np.int64)
+        coeff2[[0, 1, 3]] = coeff
+        y2 = IirModel(order=2, **kwargs)(x, coeff2, offset)
+        np.testing.assert_equal(y1, y2)
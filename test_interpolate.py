@@ -4,6 +4,7 @@ import unittest
 from migen import *
 
 import interpolate
+from interpolate_model import InterpolateChannelModel
 
 
 def feed(endpoint, x, rate):
@@ -22,6 +23,17 @@ def feed(endpoint, x, rate):
         yield endpoint.stb.eq(0)
 
 
+def hold(endpoint, x, n, delay=0):
+    # like SampleMux: ignore ack
+    for _ in range(delay):
+        yield
+    for xi in x:
+        yield endpoint.data.eq(int(xi))
+        yield endpoint.stb.eq(1)
+        for _ in range(n):
+            yield
+
+
 @passive
 def retrieve(endpoint, o):
     yield
@@ -34,6 +46,17 @@ def retrieve(endpoint, o):
         yield endpoint.ack.eq(0)
 
 
+def latency_model(x, y, max_latency=200, model=None):
+    """Latency of the output `y` w.r.t. the model output for input `x`"""
+    if model is None:
+        model = InterpolateChannelModel()
+    y0 = model(x)
+    assert len(y0) == model.ratio * len(x)
+    for latency in range(max_latency):
+        if np.array_equal(y[latency:], y0[: len(y) - latency]):
+            return latency
+
+
 class TestInter(unittest.TestCase):
     def setUp(self):
         self.dut = interpolate.InterpolateChannel()
@@ -42,16 +65,222 @@ class TestInter(unittest.TestCase):
         self.assertEqual(len(self.dut.input.data), 14)
         self.assertEqual(len(self.dut.output.data0), 16)
 
+    def run_seq(self, x, **kwargs):
+        y = []
+        run_simulation(
+            self.dut,
+            [feed(self.dut.input, x, rate=(1, 10)), retrieve(self.dut.output, y)],
+            **kwargs,
+        )
+        return np.ravel(y)
+
+    def assert_model(self, x, y):
+        latency = latency_model(x, y)
+        self.assertIsNotNone(latency)
+        self.assertGreater(len(y) - latency, 10 * len(x))
+
     def test_seq(self):
         # impulse response plus latency
         x = [(1 << 13) - 1] + [0] * (30 + 10)
+        y = self.run_seq(x, vcd_name="int.vcd")
+        self.assert_model(x, y)
+
+    def test_random(self):
+        # full scale, including overflow
+        x = np.random.default_rng(0).integers(-(1 << 13), 1 << 13, 60)
+        y = self.run_seq(x)
+        self.assert_model(x, y)
+
+    def test_clip(self):
+        # full scale steps overshoot and saturate
+        x = np.array(([(1 << 13) - 1] * 10 + [-(1 << 13)] * 10) * 2)
+        lane = self.dut.lanes[0]
         y = []
+        clip = []
+
+        def gen():
+            yield from feed(self.dut.input, x, rate=(1, 10))
+            clip.append((yield lane.clip))
+            yield lane.clip_clr.eq(1)
+            yield
+            yield lane.clip_clr.eq(0)
+            yield
+            clip.append((yield lane.clip))
+
+        run_simulation(self.dut, [gen(), retrieve(self.dut.output, y)])
+        y = np.ravel(y)
+        self.assert_model(x, y)
+        self.assertEqual(y.max(), (1 << 15) - 1)
+        self.assertEqual(y.min(), -(1 << 15))
+        self.assertEqual(clip, [15, 0])
+
+
+class TestInterShared(unittest.TestCase):
+    def test_lanes(self):
+        rng = np.random.default_rng(1)
+        for phase in range(0, 10, 3):
+            with self.subTest(phase=phase):
+                dut = interpolate.InterpolateChannel(n_lanes=2)
+                x = rng.integers(-(1 << 13), 1 << 13, (2, 40))
+                y = [[], []]
+                run_simulation(
+                    dut,
+                    [hold(i, xi, 10, phase) for i, xi in zip(dut.inputs, x)]
+                    + [retrieve(o, yi) for o, yi in zip(dut.outputs, y)],
+                )
+                # lanes are aligned
+                latency = [latency_model(xi, np.ravel(yi)) for xi, yi in zip(x, y)]
+                self.assertIsNotNone(latency[0])
+                self.assertEqual(latency[0], latency[1])
+
+
+class TestInterRatio(unittest.TestCase):
+    def test_ratio(self):
+        rng = np.random.default_rng(2)
+        for ratio in interpolate.ratios:
+            with self.subTest(ratio=ratio):
+                dut = interpolate.InterpolateChannel()
+                x = rng.integers(-(1 << 13), 1 << 13, 40)
+                y = []
+
+                def gen():
+                    yield dut.ratio.eq(interpolate.ratios.index(ratio))
+                    yield from hold(dut.input, x, ratio // 2)
+
+                run_simulation(dut, [gen(), retrieve(dut.output, y)])
+                y = np.ravel(y)
+                model = InterpolateChannelModel(ratio=ratio)
+                latency = latency_model(x, y, max_latency=400, model=model)
+                self.assertIsNotNone(latency)
+                self.assertGreater(len(y) - latency, ratio * len(x) // 2)
+
+
+class TestSampleMux(unittest.TestCase):
+    def test_fold(self):
+        dut = interpolate.SampleMux(b_sample=14, n_channel=2, n_mux=8, t_frame=80)
+        # slot k, channel ch, i/q: k << 4 | ch << 1 | iq, first slot most significant
+        body = 0
+        for k in range(8):
+            for ch in range(2):
+                for iq in range(2):
+                    v = k << 4 | ch << 1 | iq
+                    body |= v << (7 - k) * 56 + ch * 28 + iq * 14
+        y = {ratio: [] for ratio in interpolate.ratios}
+
+        def gen():
+            for ratio in interpolate.ratios:
+                yield dut.ratio.eq(interpolate.ratios.index(ratio))
+                yield dut.body.eq(body)
+                yield dut.body_stb.eq(1)
+                yield
+                yield dut.body_stb.eq(0)
+                for t in range(2 * 80):
+                    yield
+                    if (yield dut.sample_stb):
+                        s = []
+                        for c in dut.sample:
+                            s.append((yield c.i))
+                            s.append((yield c.q))
+                        y[ratio].append((t, s))
+
+        run_simulation(dut, gen())
+        self.assertEqual(
+            y[20][:2], [(0, [0x00, 0x01, 0x02, 0x03]), (10, [0x10, 0x11, 0x12, 0x13])]
+        )
+        self.assertEqual(
+            y[10][:3],
+            [
+                (0, [0x02, 0x03, 0, 0]),
+                (5, [0x00, 0x01, 0, 0]),
+                (10, [0x12, 0x13, 0, 0]),
+            ],
+        )
+        self.assertEqual(len(y[10]), 2 * 16)
+        self.assertEqual(
+            y[40][:2], [(0, [0x00, 0x01, 0x02, 0x03]), (20, [0x10, 0x11, 0x12, 0x13])]
+        )
+        self.assertEqual(len(y[40]), 8)
+
+    def test_timed(self):
+        dut = interpolate.SampleMux(b_sample=14, n_channel=2, n_mux=8, t_frame=80)
+        self.assertEqual(dut.n_timed, 7)
+        # slot k: hold k + 1 periods, channel ch, i/q: k << 4 | ch << 1 | iq
+        body = 0
+        for k in range(7):
+            slot = k << 56
+            for ch in range(2):
+                for iq in range(2):
+                    slot |= (k << 4 | ch << 1 | iq) << ch * 28 + iq * 14
+            body |= slot << (6 - k) * 64
+        y = []
+
+        def gen():
+            yield dut.body.eq(body)
+            yield dut.timed.eq(1)
+            yield dut.body_stb.eq(1)
+            yield
+            yield dut.body_stb.eq(0)
+            for _ in range(40 * 10):
+                yield
+                if (yield dut.sample_stb):
+                    y.append((yield dut.sample[1].q))
+
+        run_simulation(dut, gen())
+        y0 = [k << 4 | 3 for k in range(7) for _ in range(k + 1)]
+        self.assertEqual(y[: len(y0)], y0)
+        # the last slot is held
+        self.assertEqual(set(y[len(y0) :]), {6 << 4 | 3})
+
+
+class TestInterReload(unittest.TestCase):
+    def setUp(self):
+        self.dut = interpolate.InterpolateChannel(reload=True)
+        h_fir = [-12, 40, -150, 700, 60000, 700, -150, 40, -12]
+        h_hbf1 = np.array(interpolate.h_hbf1)
+        h_hbf1[:9] += [6, 0, -35, 0, 131, 0, -57, 0, -45]
+        h_hbf1[10:] = h_hbf1[8::-1]
+        self.model = InterpolateChannelModel(h_fir=h_fir, h_hbf1=list(h_hbf1))
+
+    def load(self):
+        for c, v in zip(self.dut.coeff, self.model.coeff()):
+            yield c.eq(int(v))
+        yield self.dut.coeff_stb.eq(1)
+        yield
+        yield self.dut.coeff_stb.eq(0)
+
+    def run_seq(self, x, t_load):
+        y = []
+
+        def load():
+            for _ in range(t_load):
+                yield
+            yield from self.load()
+
         run_simulation(
             self.dut,
-            [feed(self.dut.input, x, rate=(1, 10)), retrieve(self.dut.output, y)],
-            vcd_name="int.vcd",
+            [hold(self.dut.input, x, 10), retrieve(self.dut.output, y), load()],
         )
-        y = np.ravel(y)
-        print(repr(y))
-        # y0 =
-        # np.testing.assert_equal(y, y0)
+        return np.ravel(y)
+
+    def test_load(self):
+        x = np.random.default_rng(0).integers(-(1 << 12), 1 << 12, 60)
+        y = self.run_seq(x, 0)
+        self.assertIsNotNone(latency_model(x, y, model=self.model))
+
+    def test_switch(self):
+        x = np.random.default_rng(0).integers(-(1 << 12), 1 << 12, 150)
+        y = self.run_seq(x, 500)
+        latency = latency_model(x, y[:800], model=InterpolateChannelModel())
+        self.assertIsNotNone(latency)
+        # after the filter transients (~35 input samples)
+        y0 = self.model(x)
+        self.assertGreater(len(y), 2500)
+        np.testing.assert_equal(y[2000:], y0[2000 - latency : len(y) - latency])
+
+
+class TestModel(unittest.TestCase):
+    def test_gain(self):
+        y = InterpolateChannelModel()([1000] * 100)
+        # ciccomp compensates the cic gain, 14 to 16 bit scaling
+        g = 4 * sum(interpolate.h_fir) / 2**16 * 5**4 / 2**9
+        np.testing.assert_allclose(y[-40:], 1000 * g, rtol=1e-3)
@@ -0,0 +1,211 @@
+import unittest
+
+from migen import *
+from migen.genlib.io import DifferentialOutput
+from misoc.cores.duc import PhasedDUC
+
+from decode import Decode, Register
+from dac_data import DacData
+from dsp import DSP
+from interpolate import ratios
+from test_decode import header
+
+
+class SimDSP48E1(Module):
+    """Behavioral model of the `DSP48E1` instantiated by `DSP`"""
+
+    def __init__(self, instance):
+        io = {item.name: item for item in instance.items}
+        dsp = DSP(areg=io["AREG"].value.value, preadd=io["USE_DPORT"].value == "TRUE")
+        self.submodules += dsp
+        z = io["OPMODE"].expr[4:]  # 0b001: PCIN, 0b010: P, 0b011: C
+        self.comb += [
+            dsp.a.eq(io["A"].expr),
+            dsp.b.eq(io["B"].expr),
+            dsp.d.eq(io["D"].expr),
+            dsp.c.eq(Mux(z == 0b001, io["PCIN"].expr, io["C"].expr)),
+            dsp.load.eq(z != 0b010),
+            dsp.ce.eq(io["CEM"].expr),
+            io["P"].expr.eq(dsp.p),
+            io["PCOUT"].expr.eq(dsp.p),
+        ]
+
+
+class SimInstance:
+    """Simulate the DSP48E1 primitives, the I/O primitives are not
+    simulated (the OSERDES inputs are probed)"""
+
+    @staticmethod
+    def lower(dr):
+        if dr.of == "DSP48E1":
+            return SimDSP48E1(dr)
+        return Module()
+
+
+class SimDifferentialOutput:
+    @staticmethod
+    def lower(dr):
+        return Module()
+
+
+special_overrides = {Instance: SimInstance, DifferentialOutput: SimDifferentialOutput}
+
+
+class Datapath(Module):
+    """Phaser sample datapath from the link checker `frame_stb` to the
+    `DacData` words
+
+    The decoder is configured and the DUC output is wired to the `DacData`
+    words as in `Phaser`, with the DUC at zero frequency and the servo and
+    test data disabled. The `DacData` words are the OSERDES inputs.
+    """
+
+    def __init__(self):
+        self.submodules.decoder = Decode(
+            b_sample=14,
+            n_channel=2,
+            n_mux=8,
+            t_frame=8 * 10,
+            reload=True,
+            dsp_primitive=True,
+        )
+        self.decoder.map_registers([("a", Register())])
+        pins = Record(
+            [
+                (port + pol, 16 if port in ("data_a", "data_b") else 1)
+                for port in (
+                    "data_clk",
+                    "sync",
+                    "istr_parityab",
+                    "paritycd",
+                    "data_a",
+                    "data_b",
+                )
+                for pol in ("_p", "_n")
+            ]
+        )
+        self.submodules.dac = DacData(pins)
+        self.comb += self.dac.data_sync.eq(self.decoder.stb)
+        self.duc = []
+        for ch in range(2):
+            duc = PhasedDUC(n=2, pwidth=19, fwidth=32, zl=10)
+            self.submodules += duc
+            self.duc.append(duc)
+            self.comb += duc.clr.eq(1)
+            for t, (ti, to) in enumerate(zip(duc.i, duc.o)):
+                self.comb += [
+                    ti.i.eq(self.decoder.data[t][ch].i),
+                    ti.q.eq(self.decoder.data[t][ch].q),
+                ]
+                self.sync += [
+                    self.dac.data[2 * t][ch].eq(to.i),
+                    self.dac.data[2 * t + 1][ch].eq(to.q),
+                ]
+
+
+def measure(ratio, offset=0, n_warmup=2):
+    """Cycles from the `frame_stb` of a channel 0 impulse to the first
+    response at the output of each stage
+
+    The first frame is sent `offset` cycles after reset. Samples frames
+    are sent at the rate needed for the interpolation `ratio`.
+    """
+    dut = Datapath()
+    decoder = dut.decoder
+    # a samples frame every other frame at 40x
+    t_frame = 8 * 10 * max(1, ratio // 20)
+    b_slot = 2 * 2 * 14
+    impulse = ((1 << 13) - 1) << len(decoder.zoh.body) - b_slot
+    probes = [
+        ("decode", decoder.zoh.sample_stb & (decoder.zoh.sample[0].i != 0)),
+        ("interpolate", Cat(d[0].i for d in decoder.data) != 0),
+        ("duc", Cat(o.i for o in dut.duc[0].o) != 0),
+        ("dac", Cat(d[0] for d in dut.dac.data[::2]) != 0),
+    ]
+    latency = {}
+
+    def gen():
+        yield decoder.ratio.eq(ratios.index(ratio))
+        for _ in range(offset):
+            yield
+        t_impulse = None
+        for t in range(10 * t_frame):
+            k, i = divmod(t, t_frame)
+            body = impulse if k == n_warmup else 0
+            yield decoder.frame.eq(header(type=1) | (body << 20))
+            yield decoder.stb.eq(i == 0)
+            yield
+            if (yield decoder.stb) and (yield decoder.frame[20:]):
+                t_impulse = t
+            if t_impulse is None:
+                continue
+            for name, probe in probes:
+                if name not in latency and (yield probe):
+                    latency[name] = t - t_impulse
+            if len(latency) == len(probes):
+                break
+
+    run_simulation(dut, gen(), special_overrides=special_overrides)
+    return latency
+
+
+def report(latency):
+    """Stage latencies and total"""
+    stages = {}
+    t = 0
+    for name, ti in latency.items():
+        stages[name] = ti - t
+        t = ti
+    stages["total"] = t
+    return stages
+
+
+class TestLatency(unittest.TestCase):
+    # frame_stb to first response (cycles) with the first frame right after
+    # reset
+    expected = {
+        20: dict(decode=1, interpolate=132, duc=1, dac=1, total=135),
+        10: dict(decode=6, interpolate=59, duc=1, dac=1, total=67),
+        40: dict(decode=1, interpolate=236, duc=1, dac=1, total=239),
+    }
+    # the interpolators are not synchronized to the frames: (min, max) of
+    # each stage over the frame phases (first frame 0 to 9 cycles after
+    # reset)
+    spread = {
+        20: dict(
+            decode=(1, 1),
+            interpolate=(124, 133),
+            duc=(1, 1),
+            dac=(1, 1),
+            total=(127, 136),
+        ),
+        10: dict(
+            decode=(6, 6), interpolate=(57, 61), duc=(1, 1), dac=(1, 1), total=(65, 69)
+        ),
+        40: dict(
+            decode=(1, 1),
+            interpolate=(234, 253),
+            duc=(1, 1),
+            dac=(1, 1),
+            total=(237, 256),
+        ),
+    }
+
+    def test_latency(self):
+        for ratio, expected in self.expected.items():
+            with self.subTest(ratio=ratio):
+                stages = [report(measure(ratio, offset)) for offset in range(10)]
+                self.assertEqual(stages[0], expected, "stages at {}x".format(ratio))
+                for name, spread in self.spread[ratio].items():
+                    t = [s[name] for s in stages]
+                    self.assertEqual(
+                        (min(t), max(t)), spread, "{} at {}x: {}".format(name, ratio, t)
+                    )
+
+
+if __name__ == "__main__":
+    # the interpolators are not synchronized to the frames: the latency
+    # depends on the frame phase
+    for ratio in ratios:
+        for offset in range(10):
+            print(ratio, offset, report(measure(ratio, offset)))
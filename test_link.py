@@ -4,6 +4,7 @@ import unittest
 from migen import *
 
 import link
+from link_model import LinkModel, ResponseModel
 
 
 class TestSlip(unittest.TestCase):
@@ -41,6 +42,126 @@ class TestSlip(unittest.TestCase):
         run_simulation(self.dut, gen())
 
 
+class TestSlipOneShot(unittest.TestCase):
+    def lock(self, offset, direction, one_shot=True, latency=2):
+        """Behavioral 4x oversampling ISERDES with bitslip moving the
+        word boundary by `direction` samples after `latency` cycles.
+        Returns the valid history and the final lock time."""
+        dut = link.Slipper(width=3, one_shot=one_shot)
+        valid = []
+        lock_time = []
+
+        def gen():
+            o = offset
+            slips = []
+            for t in range(64):
+                # clock pattern 00001111, four samples per bit, d0 latest
+                s = [((4 * t + o + k) // 4 % 8) >= 4 for k in range(4)]
+                yield dut.data.eq(Cat(s[3], s[2], s[1]))
+                yield
+                valid.append((yield dut.valid))
+                if (yield dut.bitslip):
+                    slips.append(t + latency)
+                o += direction * slips.count(t)
+            lock_time.append((yield dut.lock_time))
+
+        run_simulation(dut, gen())
+        return valid, lock_time[0]
+
+    def test_lock(self):
+        for direction in (1, -1):
+            t_max = 0
+            t_max_iter = 0
+            for offset in range(4):
+                valid, lock_time = self.lock(offset, direction)
+                self.assertTrue(all(valid[16:]), (offset, direction))
+                self.assertEqual(lock_time, valid.count(0))
+                t_max = max(t_max, lock_time)
+                valid, lock_time = self.lock(offset, direction, one_shot=False)
+                self.assertTrue(all(valid[16:]), (offset, direction))
+                t_max_iter = max(t_max_iter, lock_time)
+            # a single slip burst and latency blocking
+            self.assertEqual(t_max, 6)
+            self.assertLess(t_max, t_max_iter)
+
+
+class DelayLine(Module):
+    """Behavioral stand-in for the clock lane IDELAY, ISERDES, `Slipper`
+    and `Unframer`: open taps give a clean clock pattern, closed taps give
+    noise on `valid` and `clk_stb`."""
+
+    def __init__(self, open_taps, t_clk=8, n_taps=32, tap=0):
+        self.ce = Signal()
+        self.tap = Signal(max=n_taps, reset=tap)
+        self.valid = Signal()
+        self.clk_stb = Signal()
+
+        is_open = Signal()
+        noise = Signal(16, reset=0xACE1)
+        t = Signal(max=t_clk)
+        self.comb += [
+            is_open.eq(Array([int(i in open_taps) for i in range(n_taps)])[self.tap]),
+            self.valid.eq(is_open | noise[0]),
+            self.clk_stb.eq((t == t_clk - 1) & (is_open | noise[1])),
+        ]
+        self.sync += [
+            If(self.ce, self.tap.eq(self.tap + 1)),
+            t.eq(t + 1),
+            noise.eq(Cat(noise[1:], noise[0] ^ noise[2] ^ noise[3] ^ noise[5])),
+        ]
+
+
+class TestEyeScan(unittest.TestCase):
+    def scan(self, open_taps, tap=0):
+        dut = link.EyeScan(t_clk=8, t_settle=16, t_dwell=64)
+        dut.submodules.dly = dly = DelayLine(open_taps, tap=tap)
+        dut.comb += [
+            dut.valid.eq(dly.valid),
+            dut.clk_stb.eq(dly.clk_stb),
+            dut.tap.eq(dly.tap),
+            dly.ce.eq(dut.ce),
+        ]
+        ret = {}
+
+        def run():
+            while not (yield dut.done):
+                yield
+            for k in "eye eye_start eye_width tap".split():
+                ret[k] = yield getattr(dut, k)
+
+        run_simulation(dut, run())
+        return ret
+
+    def test_center(self):
+        open_taps = set(range(3, 9)) | set(range(14, 25))
+        ret = self.scan(open_taps, tap=17)
+        self.assertEqual(ret["eye"], sum(1 << i for i in open_taps))
+        self.assertEqual(ret["eye_start"], 14)
+        self.assertEqual(ret["eye_width"], 11)
+        self.assertEqual(ret["tap"], 19)
+
+    def test_wrap(self):
+        # the widest eye wraps from the last tap to the first
+        open_taps = set(range(29, 32)) | set(range(0, 7)) | set(range(12, 19))
+        ret = self.scan(open_taps, tap=15)
+        self.assertEqual(ret["eye"], sum(1 << i for i in open_taps))
+        self.assertEqual(ret["eye_start"], 29)
+        self.assertEqual(ret["eye_width"], 10)
+        self.assertEqual(ret["tap"], 1)
+
+    def test_closed(self):
+        ret = self.scan(set(), tap=5)
+        self.assertEqual(ret["eye"], 0)
+        self.assertEqual(ret["eye_width"], 0)
+        self.assertEqual(ret["tap"], 5)
+
+    def test_open(self):
+        ret = self.scan(set(range(32)), tap=5)
+        self.assertEqual(ret["eye_start"], 0)
+        self.assertEqual(ret["eye_width"], 32)
+        self.assertEqual(ret["tap"], 15)
+
+
 def pack(data):
     n_frame = 10
     n_data = 7
@@ -48,6 +169,8 @@ def pack(data):
     n_marker = n_frame // 2 + 1
     n_crc = 6
     assert len(data) == n_frame * (n_data - 1) * t_clk - n_marker - n_crc
+    model = LinkModel(n_data=n_data, t_clk=t_clk, n_frame=n_frame)
+    crc = 0
     frame = []
     for i in range(n_frame):
         for j in range(t_clk):
@@ -57,8 +180,8 @@ def pack(data):
             if j == t_clk - 1:
                 if i == n_frame - 1:
                     # CRC-6-GSM
-                    # b |= CRC(0x3f, data_width=6)(frame) << 1
-                    b |= 0x3F << 1  # TODO
+                    # the crc word clears the crc state
+                    b |= crc << 1
                     frame.append(b)
                     continue
                 elif i == n_frame - 2:
@@ -69,6 +192,7 @@ def pack(data):
                 b |= data.pop(0) << 1
             for k in range(2, n_data):
                 b |= data.pop(0) << k
+            crc = model.crc_step(crc, b >> 1)
             frame.append(b)
     assert len(data) == 0, data
     return frame
@@ -164,3 +288,133 @@ class TestUnframe(unittest.TestCase):
         # self.assertEqual(bits[-8 - 1], 0x3f)
         self.assertEqual(len(rec_frame), 1)
         # self.assertEqual(rec_frame[0], (1 << 10*8*6 - 6 - 6) - 1)
+
+
+class TestLinkModel(unittest.TestCase):
+    def setUp(self):
+        self.model = LinkModel(n_data=7, t_clk=8, n_frame=10)
+        self.rng = np.random.default_rng(42)
+
+    def random_frames(self, n):
+        frames = self.rng.integers(0, 256, (n, self.model.n_bytes), dtype=np.uint8)
+        frames[:, -1] &= (1 << self.model.n_bits % 8) - 1
+        return frames
+
+    def test_init(self):
+        self.assertEqual(self.model.n_bits, 10 * 8 * 6 - 6 - 6)
+        self.assertEqual(self.model.n_words, 10 * 8)
+
+    def test_pack(self):
+        for bit, crc in ((0, 0x13), (1, 0x0B)):
+            frame = pack([bit] * self.model.n_bits)
+            self.assertEqual(frame[-1], 1 | (crc << 1))
+            words = np.array([frame], np.uint8)
+            self.assertEqual(self.model.crc(words)[0], 0)
+            frames, good = self.model.decode(words)
+            self.assertTrue(good[0])
+            self.assertEqual(
+                self.model.to_int(frames)[0], bit * ((1 << self.model.n_bits) - 1)
+            )
+            np.testing.assert_equal(self.model.encode(frames), words)
+
+    def test_roundtrip(self):
+        frames = self.random_frames(1000)
+        words = self.model.encode(frames)
+        np.testing.assert_equal(words & 1, np.broadcast_to(self.model.clk, words.shape))
+        self.assertTrue(np.all(self.model.crc(words) == 0))
+        frames1, good = self.model.decode(words)
+        self.assertTrue(np.all(good))
+        np.testing.assert_equal(frames1, frames)
+        ints = self.model.to_int(frames)
+        np.testing.assert_equal(self.model.from_int(ints), frames)
+
+    def test_errors(self):
+        words = self.model.encode(self.random_frames(self.model.n_words * 7))
+        # flip every bit of every word once
+        n = np.arange(len(words))
+        words[n, n % self.model.n_words] ^= (1 << n // self.model.n_words).astype(
+            np.uint8
+        )
+        _, good = self.model.decode(words)
+        self.assertFalse(np.any(good))
+
+    def test_gateware(self):
+        frames = self.random_frames(4)
+        words = self.model.encode(frames)
+        dut = link.Unframer(n_data=7, t_clk=8, n_frame=10)
+        check = link.Checker(n_data=6, t_clk=8, n_frame=10)
+        dut.submodules += check
+        dut.comb += [
+            check.data.eq(dut.data_out),
+            check.data_stb.eq(dut.data_out_stb),
+            check.end_of_frame.eq(dut.end_of_frame),
+        ]
+        rec = []
+        crc_err = []
+
+        def feed():
+            for w in words.ravel().tolist():
+                yield dut.data_in.eq(w)
+                yield dut.data_in_stb.eq(1)
+                yield
+            for _ in range(4):
+                yield
+            crc_err.append((yield check.crc_err))
+
+        @passive
+        def record():
+            while True:
+                if (yield check.frame_stb):
+                    rec.append((yield check.frame))
+                yield
+
+        run_simulation(dut, [feed(), record()])
+        self.assertEqual(rec, self.model.to_int(frames))
+        self.assertEqual(crc_err, [0])
+
+
+class TestResponder(unittest.TestCase):
+    def setUp(self):
+        self.dut = link.Responder(8 * 4, n_serde=4)
+        self.model = ResponseModel(8 * 4, n_serde=4)
+
+    def test_init(self):
+        self.assertEqual(len(self.dut.miso), 4)
+        self.assertEqual(self.model.n_cycles, (1 + 32 + 8 + 3) // 4)
+
+    def test_crc(self):
+        # CRC-8 (0x07) check value
+        bits = np.unpackbits(np.frombuffer(b"123456789", np.uint8))[None]
+        self.assertEqual(self.model.crc(bits)[0], 0xF4)
+
+    def test_response(self):
+        data = np.random.default_rng(3).integers(0, 256, (3, 4), dtype=np.uint8)
+        words = []
+
+        def gen():
+            for d in data:
+                yield self.dut.data.eq(int.from_bytes(d.tobytes(), "big"))
+                yield self.dut.stb.eq(1)
+                yield
+                yield self.dut.stb.eq(0)
+                w = []
+                for _ in range(20):
+                    yield
+                    w.append((yield self.dut.miso))
+                words.append(w)
+
+        run_simulation(self.dut, gen())
+        words = np.array(words, np.uint8)
+        # starts right away and ends in zeros
+        np.testing.assert_equal(words[:, 0], 0)
+        np.testing.assert_equal(words[:, 1] & 1, 1)
+        np.testing.assert_equal(words[:, -5:], 0)
+        np.testing.assert_equal(
+            words[:, 1 : 1 + self.model.n_cycles], self.model.encode(data)
+        )
+        resp, good = self.model.decode(words)
+        self.assertTrue(np.all(good))
+        np.testing.assert_equal(resp, data)
+        words[1, 3] ^= 2
+        _, good = self.model.decode(words)
+        np.testing.assert_equal(good, [True, False, True])
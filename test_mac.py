@@ -0,0 +1,83 @@
+import numpy as np
+import unittest
+
+from migen import *
+
+from mac_sym_fir import MAC_SYM_FIR
+from mac_hbf_upsampler import MAC_HBF_Upsampler
+from interpolate import h_fir, h_hbf0, h_hbf1
+from interpolate_model import mac_sym_fir, mac_hbf_upsampler
+
+
+class TestPipelen(unittest.TestCase):
+    pipelens = 3, 4, 5, 8, 13
+
+    def run_filter(self, dut, x, rng):
+        """Random output stalls, returns the acknowledged outputs per lane"""
+        y = [[] for _ in x]
+
+        def src():
+            for i in range(len(x[0])):
+                for inp, xi in zip(dut.inputs, x):
+                    yield inp.data.eq(int(xi[i]))
+                yield
+                while not (yield dut.inputs[0].ack):
+                    yield
+
+        @passive
+        def sink():
+            while True:
+                ack = int(rng.random() < 0.7)
+                for out in dut.outputs:
+                    yield out.ack.eq(ack)
+                yield
+                for yi, out in zip(y, dut.outputs):
+                    if ack and (yield out.stb):
+                        yi.append((yield out.data))
+
+        run_simulation(dut, [src(), sink()])
+        return y
+
+    def assertDelayed(self, y, y0):
+        """`y` is `y0` delayed by some zero samples"""
+        self.assertGreater(len(y), len(y0) // 2)
+        delay = [
+            np.array_equal(y[i:], y0[: len(y) - i]) and not any(y[:i])
+            for i in range(10)
+        ]
+        self.assertTrue(any(delay), (y[:10], y0[:10]))
+
+    def test_fir(self):
+        rng = np.random.default_rng(0)
+        for pipelen in self.pipelens:
+            with self.subTest(pipelen=pipelen):
+                x = rng.integers(-(1 << 15), 1 << 15, (1, 40))
+                dut = MAC_SYM_FIR(h_fir, 16, 16, dsp_pipelen=pipelen)
+                dut.inputs, dut.outputs = [dut.input], [dut.output]
+                (y,) = self.run_filter(dut, x, rng)
+                self.assertDelayed(y, mac_sym_fir(x[0], h_fir, 16, 16))
+
+    def test_lanes(self):
+        rng = np.random.default_rng(1)
+        for pipelen in self.pipelens:
+            with self.subTest(pipelen=pipelen):
+                x = rng.integers(-(1 << 15), 1 << 15, (2, 30))
+                dut = MAC_SYM_FIR(h_fir, 16, 16, n_lanes=2, dsp_pipelen=pipelen)
+                y = self.run_filter(dut, x, rng)
+                for yi, xi in zip(y, x):
+                    self.assertDelayed(yi, mac_sym_fir(xi, h_fir, 16, 16))
+
+    def test_hbf(self):
+        rng = np.random.default_rng(2)
+        for h in h_hbf0, h_hbf1:
+            for pipelen in self.pipelens:
+                with self.subTest(n=len(h), pipelen=pipelen):
+                    x = rng.integers(-(1 << 15), 1 << 15, (1, 40))
+                    dut = MAC_HBF_Upsampler(h, 16, 17, dsp_pipelen=pipelen)
+                    dut.inputs, dut.outputs = [dut.input], [dut.output]
+                    (y,) = self.run_filter(dut, x, rng)
+                    self.assertDelayed(y, mac_hbf_upsampler(x[0], h, 16, 17))
+
+    def test_depth(self):
+        with self.assertRaises(ValueError):
+            MAC_SYM_FIR(h_fir, 16, 16, dsp_pipelen=2)
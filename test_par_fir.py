@@ -0,0 +1,74 @@
+import numpy as np
+import unittest
+
+from migen import *
+
+from par_fir import PAR_SYM_FIR, PAR_HBF_Upsampler
+from interpolate import h_fir, h_hbf0, h_hbf1
+from interpolate_model import mac_sym_fir, mac_hbf_upsampler
+
+
+class TestParallel(unittest.TestCase):
+    def run_filter(self, dut, x, rng, fields=("data",)):
+        """Random input gaps and output stalls"""
+        y = []
+
+        def src():
+            for xi in x:
+                yield dut.input.data.eq(int(xi))
+                yield dut.input.stb.eq(1)
+                yield
+                while not (yield dut.input.ack):
+                    yield
+                if rng.random() < 0.3:
+                    yield dut.input.stb.eq(0)
+                    yield
+            yield dut.input.stb.eq(0)
+            for _ in range(30):
+                yield
+
+        @passive
+        def sink():
+            while True:
+                ack = int(rng.random() < 0.7)
+                yield dut.output.ack.eq(ack)
+                yield
+                if ack and (yield dut.output.stb):
+                    for f in fields:
+                        y.append((yield getattr(dut.output, f)))
+
+        run_simulation(dut, [src(), sink()])
+        return y
+
+    def test_fir(self):
+        rng = np.random.default_rng(0)
+        x = rng.integers(-(1 << 22), 1 << 22, 100)
+        y = self.run_filter(PAR_SYM_FIR(h_fir, 24, 16), x, rng)
+        np.testing.assert_equal(y, mac_sym_fir(x, h_fir, 24, 16))
+
+    def test_hbf(self):
+        rng = np.random.default_rng(1)
+        for h in h_hbf0, h_hbf1:
+            with self.subTest(n=len(h)):
+                x = rng.integers(-(1 << 22), 1 << 22, 100)
+                dut = PAR_HBF_Upsampler(h, 24, 17)
+                y = self.run_filter(dut, x, rng, ("data0", "data1"))
+                np.testing.assert_equal(y, mac_hbf_upsampler(x, h, 24, 17))
+
+    def test_throughput(self):
+        dut = PAR_HBF_Upsampler(h_hbf0, 24, 17)
+        x = np.arange(1, 40) << 10
+        y = []
+
+        def gen():
+            yield dut.output.ack.eq(1)
+            yield dut.input.stb.eq(1)
+            for xi in x:
+                yield dut.input.data.eq(int(xi))
+                yield
+                y.append((yield dut.output.stb))
+
+        run_simulation(dut, gen())
+        # one input per cycle, two outputs per cycle after the latency
+        self.assertEqual(sum(y), len(x) - y.index(1))
+        self.assertLess(y.index(1), 10)
@@ -0,0 +1,142 @@
+import unittest
+
+import numpy as np
+from migen import *
+
+from adc import Adc, AdcParams
+from servo_diag import ServoDiag
+
+
+class TestServoDiag(unittest.TestCase):
+    def setUp(self):
+        self.dut = ServoDiag(n_channels=2, w_adc=16, w_data=16)
+
+    def read(self, dut):
+        """Snapshot and read out the words"""
+        yield dut.snapshot.eq(1)
+        yield
+        yield dut.snapshot.eq(0)
+        words = []
+        n = len(dut.adc)
+        for i in range(n * 6 + 1):
+            word = 0
+            for j in range(2):
+                yield dut.sel.eq(2 * i + j)
+                yield
+                word = word << 8 | (yield dut.dat)
+            words.append(word - ((word >> 15) << 16) if i % 6 > 1 else word)
+        return np.array(words[:-1]).reshape(n, 6), words[-1]
+
+    def test_diag(self):
+        rng = np.random.default_rng(0)
+        adc = rng.integers(-(1 << 15), 1 << 15, (20, 2))
+        outp = rng.integers(0, 1 << 15, (20, 2))
+        clip = rng.random((20, 2, 2)) < 0.3
+        t_cnv, t_adc, t_iir = 4, 30, 7
+        result = []
+
+        def gen(dut):
+            for k, (a, o, c) in enumerate(zip(adc, outp, clip)):
+                if k == 0:
+                    yield dut.cnv.eq(1)
+                    yield
+                    yield dut.cnv.eq(0)
+                    wait = t_adc - 1
+                else:
+                    # started before the previous output
+                    wait = t_adc - t_iir - t_cnv
+                for _ in range(wait):
+                    yield
+                for i in range(2):
+                    yield dut.adc[i].eq(int(a[i]))
+                yield dut.adc_stb.eq(1)
+                yield
+                yield dut.adc_stb.eq(0)
+                # the next conversion starts before the output
+                yield dut.cnv.eq(1)
+                for _ in range(t_iir - 1):
+                    yield
+                yield dut.cnv.eq(0)
+                for i in range(2):
+                    yield dut.outp[i].eq(int(o[i]))
+                    yield dut.clip_pos[i].eq(int(c[0, i]))
+                    yield dut.clip_neg[i].eq(int(c[1, i]))
+                yield dut.outp_stb.eq(1)
+                yield
+                yield dut.outp_stb.eq(0)
+                yield [c.eq(0) for c in dut.clip_pos + dut.clip_neg]
+                for _ in range(t_cnv):
+                    yield
+            result.append((yield from self.read(dut)))
+            result.append((yield from self.read(dut)))
+
+        run_simulation(self.dut, gen(self.dut))
+        (words, latency), (empty, _) = result
+        self.assertEqual(latency, t_adc + t_iir)
+        for i in range(2):
+            self.assertEqual(
+                list(words[i]),
+                [
+                    clip[:, 0, i].sum(),
+                    clip[:, 1, i].sum(),
+                    adc[:, i].min(),
+                    adc[:, i].max(),
+                    outp[:, i].min(),
+                    outp[:, i].max(),
+                ],
+            )
+            # the snapshot restarts the window
+            self.assertEqual(list(empty[i][:2]), [0, 0])
+            self.assertGreater(empty[i][2], empty[i][3])
+            self.assertGreater(empty[i][4], empty[i][5])
+
+    def test_adc(self):
+        for pipelined in False, True:
+            p = AdcParams(
+                width=16,
+                channels=2,
+                lanes=2,
+                t_cnvh=8,
+                t_conv=3,
+                t_rtt=6,
+                pipelined=pipelined,
+            )
+            dut = Module()
+            dut.submodules.adc = adc = Adc(None, p)
+            dut.submodules.diag = diag = ServoDiag(n_channels=2, w_adc=16, w_data=16)
+            # IIR latency
+            iir = Signal(7)
+            dut.sync += iir.eq(Cat(adc.done, iir))
+            dut.comb += [
+                adc.start.eq(1),
+                diag.cnv.eq(adc.cnvn),
+                diag.adc_stb.eq(adc.done),
+                diag.outp_stb.eq(iir[-1]),
+            ]
+            latency = []
+
+            def gen():
+                for _ in range(600):
+                    yield
+                    if (yield diag.outp_stb):
+                        latency.append((yield diag.latency))
+
+            run_simulation(dut, gen())
+            with self.subTest(pipelined=pipelined):
+                # skip the reset value and the sequential done before the
+                # first conversion, cnvh + conv + read + rtt + iir
+                self.assertEqual(set(latency[2:]), {8 + 3 + 48 + 6 + 7})
+
+    def test_saturate(self):
+        dut = ServoDiag(n_channels=1, w_adc=16, w_data=16, w_count=4)
+        result = []
+
+        def gen(dut):
+            yield dut.clip_pos[0].eq(1)
+            for _ in range(20):
+                yield
+            yield dut.clip_pos[0].eq(0)
+            result.append((yield from self.read(dut)))
+
+        run_simulation(dut, gen(dut))
+        self.assertEqual(result[0][0][0][0], 15)
@@ -0,0 +1,28 @@
+import unittest
+
+from interpolate import h_fir
+from wordlength import design, quantize, metrics, cost, sweep, optimize
+
+
+class TestWordlength(unittest.TestCase):
+    def test_quantize(self):
+        self.assertEqual(quantize(h_fir, 16, 16), h_fir)
+        self.assertEqual(quantize([4, -6], 15, 16), [2, -3])
+
+    def test_design(self):
+        for ratio in 10, 20, 40:
+            with self.subTest(ratio=ratio):
+                snr, sfdr = metrics(ratio)
+                self.assertGreater(snr, 90)
+                self.assertGreater(sfdr, 90)
+
+    def test_narrow(self):
+        self.assertLess(metrics(width_fir=12)[0], metrics()[0] - 10)
+        self.assertLess(cost(**dict(design, width_d=18)), cost(**design))
+
+    def test_optimize(self):
+        results = sweep(width_d=range(18, 26), width_cic=range(14, 18))
+        best = optimize(results, 90, 80)
+        self.assertGreaterEqual(best[1], 90)
+        self.assertLessEqual(best[3:], cost(**design))
+        self.assertIsNone(optimize(results, 120, 80))
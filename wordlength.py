@@ -0,0 +1,155 @@
+"""Fixed-point word length optimizer for the interpolation cascade
+
+Sweeps the data, coefficient and CIC widths and the overshoot headroom
+of the bit-exact `InterpolateChannelModel`, reports the SNR (against a
+floating point reference of the filter design), the SFDR and the DSP/FF
+cost of each configuration and emits the cheapest one meeting the
+targets.
+
+The filter taps are requantized from the design (`interpolate.h_fir`
+etc.) to the coefficient widths. The cost is an estimate for one lane.
+
+    python wordlength.py --snr 90 --sfdr 80
+"""
+
+import argparse
+import itertools
+
+import numpy as np
+from migen import bits_for
+
+from interpolate import h_fir, h_hbf0, h_hbf1
+from interpolate_model import InterpolateChannelModel, cic_interpolator
+
+# the gateware configuration
+design = dict(width_d=24, width_fir=16, width_hbf=17, width_cic=16, headroom=1)
+
+
+def quantize(h, width, width_design):
+    """Requantize the `width_design` bit taps `h` to `width` bits"""
+    return [int(c) for c in np.round(np.array(h) * 2.0 ** (width - width_design))]
+
+
+def model(ratio=20, **widths):
+    """Bit-exact model with the taps requantized to the widths"""
+    widths = dict(design, **widths)
+    return InterpolateChannelModel(
+        h_fir=quantize(h_fir, widths["width_fir"], design["width_fir"]),
+        h_hbf0=quantize(h_hbf0, widths["width_hbf"], design["width_hbf"]),
+        h_hbf1=quantize(h_hbf1, widths["width_hbf"], design["width_hbf"]),
+        ratio=ratio,
+        **widths,
+    )
+
+
+def reference(x, ratio=20):
+    """Floating point interpolation with the design taps, scaled like the
+    model output"""
+    m = model(ratio)
+
+    def fir(x, h, width):
+        return np.convolve(x, np.array(h) / 2.0**width)[: len(x)]
+
+    def hbf(x, h, width):
+        n = (len(h) + 1) // 4
+        y = np.empty(2 * len(x))
+        y[::2] = fir(x, h[::2], width)
+        y[1::2] = np.concatenate([np.zeros(n - 1), x[: len(x) - n + 1]])
+        return y
+
+    x = np.asarray(x, float) * 2.0 ** (m.scale_in - m.scale_out - m.scale_cic)
+    x = fir(x, m.h_fir, m.width_fir)
+    if not m.bypass:
+        x = hbf(x, m.h_hbf0, m.width_hbf)
+    x = hbf(x, m.h_hbf1, m.width_hbf)
+    return cic_interpolator(x, m.cic_n, m.cic_r)
+
+
+def tone(n=512, k=37, amplitude=0.9):
+    """Coherent test tone, `k` cycles in `n` 14 bit samples"""
+    return np.round(
+        amplitude * ((1 << 13) - 1) * np.sin(2 * np.pi * k * np.arange(n) / n)
+    ).astype(np.int64)
+
+
+def metrics(ratio=20, n=512, k=37, **widths):
+    """SNR and SFDR (dB) of the steady state output for a test tone"""
+    x = np.tile(tone(n, k), 3)
+    y = model(ratio, **widths)(x)[-n * ratio :]
+    y_ref = reference(x, ratio)[-n * ratio :]
+    snr = 10 * np.log10(np.sum(y_ref**2) / np.sum((y - y_ref) ** 2))
+    s = np.abs(np.fft.rfft(y))
+    spur = np.max(np.delete(s, [0, k]))
+    sfdr = 20 * np.log10(s[k] / spur)
+    return snr, sfdr
+
+
+def cost(width_d, width_fir, width_hbf, width_cic, headroom=1, dsp_arch="xilinx"):
+    """DSP blocks and flip-flops of a lane (estimate)"""
+    w_a, w_b = (25, 18) if dsp_arch == "xilinx" else (18, 18)
+
+    def mults(width_coef):
+        # pre-adder sum and coefficient, cascaded if too wide
+        return -(-(width_d + 1) // w_a) * -(-(width_coef + 1) // w_b)
+
+    dsp = mults(width_fir) + 2 * mults(width_hbf)
+    # sample shift registers, filter outputs, buffer
+    n_fir = (len(h_fir) + 1) // 2
+    n_hbf = (len(h_hbf0) + 1) // 4 + (len(h_hbf1) + 1) // 4
+    ff = (2 * n_fir - 1 + 2 * n_hbf + 3 + 1) * width_d
+    # cic: buffer, input, combs, zero stuffing, integrators, output
+    n = 5
+    width_o = width_cic + bits_for(10 ** (n - 1) - 1)
+    ff += width_cic + (1 + 2 * n + 2 + 4 * n + 2) * width_o
+    return dsp, ff
+
+
+def sweep(ratio=20, **ranges):
+    """Metrics and cost of all combinations of the width `ranges`"""
+    ranges = dict({k: [v] for k, v in design.items()}, **ranges)
+    results = []
+    for values in itertools.product(*ranges.values()):
+        widths = dict(zip(ranges, values))
+        if widths["width_cic"] + widths["headroom"] >= widths["width_d"]:
+            continue
+        snr, sfdr = metrics(ratio, **widths)
+        results.append((widths, snr, sfdr) + cost(**widths))
+    return results
+
+
+def optimize(results, snr, sfdr):
+    """Cheapest (DSP, then FF) configuration meeting the targets"""
+    ok = [r for r in results if r[1] >= snr and r[2] >= sfdr]
+    if ok:
+        return min(ok, key=lambda r: r[3:])
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--ratio", type=int, default=20, choices=[10, 20, 40])
+    p.add_argument("--snr", type=float, default=90.0, help="min SNR (dB)")
+    p.add_argument("--sfdr", type=float, default=80.0, help="min SFDR (dB)")
+    p.add_argument("--width-d", type=int, nargs=2, default=[18, 26])
+    p.add_argument("--width-fir", type=int, nargs=2, default=[12, 17])
+    p.add_argument("--width-hbf", type=int, nargs=2, default=[13, 18])
+    p.add_argument("--width-cic", type=int, nargs=2, default=[14, 17])
+    p.add_argument("--headroom", type=int, nargs=2, default=[1, 2])
+    args = p.parse_args()
+    ranges = {
+        k: range(v[0], v[1] + 1)
+        for k, v in vars(args).items()
+        if k.startswith("width") or k == "headroom"
+    }
+    results = sweep(args.ratio, **ranges)
+    print(" ".join(design), "snr sfdr dsp ff")
+    for widths, *r in results:
+        print(*widths.values(), "{:.1f} {:.1f} {} {}".format(*r))
+    best = optimize(results, args.snr, args.sfdr)
+    if best is None:
+        print("no configuration meets the targets")
+    else:
+        print("min:", best[0], "snr {:.1f} sfdr {:.1f} dsp {} ff {}".format(*best[1:]))
+
+
+if __name__ == "__main__":
+    main()